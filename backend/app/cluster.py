@@ -0,0 +1,113 @@
+"""
+多工作进程启动入口
+充分利用单机多核：启动 N 个工作进程，每个进程都是完整的 FastAPI 应用。
+
+    cd backend
+    python -m app.cluster --workers 4 --port 8005
+
+- 所有工作进程通过 SO_REUSEPORT 共同监听公共端口，由内核在进程间分配连接；
+- 每个工作进程另外监听一个内部端口（127.0.0.1:CLUSTER_INTERNAL_PORT_BASE + 序号），
+  作为自己的 WORKER_URL 写入会话元数据，其他进程据此转发该会话的请求；
+- 会话元数据必须放在 Redis 中（SESSION_STORE=redis），各进程才能查到彼此的会话。
+
+主进程只负责拉起和回收工作进程：任一工作进程退出时结束全部进程，由外部（systemd / Docker）负责重启。
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+
+def _bind(host: str, port: int, reuse_port: bool) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def serve_worker(host: str, port: int, internal_port: int):
+    """在当前进程中运行一个工作进程，同时监听公共端口和内部端口"""
+    import uvicorn
+
+    os.environ["WORKER_URL"] = f"http://127.0.0.1:{internal_port}"
+    sockets = [_bind(host, port, reuse_port=True), _bind("127.0.0.1", internal_port, reuse_port=False)]
+    config = uvicorn.Config("app.main:app", log_level=os.getenv("LOG_LEVEL", "info"))
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def run_cluster(workers: int, host: str, port: int) -> int:
+    """拉起工作进程并等待，返回退出码"""
+    store = os.environ.setdefault("SESSION_STORE", "redis")
+    if workers > 1 and store != "redis":
+        logger.error("多工作进程部署需要 SESSION_STORE=redis")
+        return 1
+
+    base = int(os.getenv("CLUSTER_INTERNAL_PORT_BASE", "9100"))
+    processes = []
+    for index in range(workers):
+        cmd = [
+            sys.executable, "-m", "app.cluster", "--serve",
+            "--host", host, "--port", str(port), "--internal-port", str(base + index),
+        ]
+        processes.append(subprocess.Popen(cmd))
+    logger.info(f"[cluster] 已启动 {workers} 个工作进程，公共端口 {port}，内部端口 {base}-{base + workers - 1}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    exit_code = 0
+    while not stopping:
+        exited = [p for p in processes if p.poll() is not None]
+        if exited:
+            exit_code = exited[0].returncode or 1
+            logger.error(f"[cluster] 工作进程 {exited[0].pid} 已退出（{exited[0].returncode}），停止全部进程")
+            break
+        time.sleep(0.5)
+
+    for p in processes:
+        if p.poll() is None:
+            p.terminate()
+    for p in processes:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+    return exit_code
+
+
+def main():
+    load_dotenv(Path(__file__).parent.parent.parent / ".env")
+    parser = argparse.ArgumentParser(description="DrawIO AI 多工作进程启动入口")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CLUSTER_WORKERS", "0")) or os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8005)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--internal-port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.serve:
+        serve_worker(args.host, args.port, args.internal_port)
+    else:
+        sys.exit(run_cluster(args.workers, args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+共享服务依赖
+GLMService 与 SessionManager 在应用 lifespan 中各创建一份并保存在 app.state 上，
+路由通过 Depends 注入，所有路由共用同一实例。
+
+未经过 lifespan 启动时（如测试中直接构造 TestClient），首次注入时创建。
+"""
+from fastapi import FastAPI, Request
+
+from app.services.glm_service import GLMService
+from app.services.session_manager import SessionManager
+
+
+def init_services(app: FastAPI):
+    """创建共享服务实例，在 lifespan 启动阶段调用"""
+    app.state.glm_service = GLMService()
+    app.state.session_manager = SessionManager()
+
+
+def _state(app: FastAPI):
+    if not hasattr(app.state, "glm_service"):
+        init_services(app)
+    return app.state
+
+
+def get_glm_service(request: Request) -> GLMService:
+    """注入共享的 GLMService"""
+    return _state(request.app).glm_service
+
+
+def get_session_manager(request: Request) -> SessionManager:
+    """注入共享的 SessionManager"""
+    return _state(request.app).session_manager
@@ -4,6 +4,8 @@ drawio-ai 后端服务入口
 """
 from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
+import os
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,8 +15,16 @@ import logging
 env_path = Path(__file__).parent.parent.parent / ".env"
 load_dotenv(env_path)
 
-from app.routers import session, chat, diagram
+from app.dependencies import init_services
+from app.routers import session, chat, diagram, batch
+from app.services.affinity import SessionAffinityMiddleware, close_forward_client
+from app.services.cpu_pool import get_cpu_pool
+from app.services.http_pool import close_upstream_client
+from app.services.loop_monitor import start_loop_monitor
 from app.services.mcp_client import cleanup_mcp_client
+from app.services.metrics import get_metrics
+from app.services.session_manager import PREVIEW
+from app.services.mcp_warmup import get_mcp_warmup
 
 # 配置日志
 logging.basicConfig(
@@ -29,11 +39,32 @@ async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时
     logger.info("DrawIO AI Backend 启动中...")
+    init_services(app)
+    # 记录事件循环延迟，发现阻塞事件循环的 CPU 密集操作
+    loop_monitor = start_loop_monitor()
+    prewarm = None
+    if os.getenv("STARTUP_PREWARM", "1") == "1":
+        # openai 等较重的依赖在开始接收请求后于后台线程导入，随后预先建立上游连接，
+        # 不阻塞启动，也不拖慢第一个请求
+        prewarm = asyncio.create_task(app.state.glm_service.warm_up())
+    if app.state.session_manager.default_mode == PREVIEW:
+        # 后台预先建立 MCP 连接，创建会话时无需等待 MCP Server 启动
+        get_mcp_warmup().start()
     yield
     # 关闭时
     logger.info("DrawIO AI Backend 关闭中...")
+    if prewarm is not None:
+        prewarm.cancel()
+        await asyncio.gather(prewarm, return_exceptions=True)
+    await get_mcp_warmup().stop()
     await cleanup_mcp_client()
     logger.info("MCP 客户端已清理")
+    await close_forward_client()
+    await close_upstream_client()
+    if loop_monitor is not None:
+        loop_monitor.cancel()
+        await asyncio.gather(loop_monitor, return_exceptions=True)
+    get_cpu_pool().shutdown()
 
 
 app = FastAPI(
@@ -52,10 +83,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 多进程部署时把会话请求转发到会话所属进程（放在最外层，转发的响应直接使用所属进程的 CORS 头）
+app.add_middleware(SessionAffinityMiddleware)
+
 # 注册路由
 app.include_router(session.router, prefix="/api", tags=["会话管理"])
 app.include_router(chat.router, prefix="/api", tags=["AI 对话"])
 app.include_router(diagram.router, prefix="/api", tags=["图表操作"])
+app.include_router(batch.router, prefix="/api", tags=["批量生成"])
 
 
 @app.get("/")
@@ -67,4 +102,10 @@ async def root():
 @app.get("/health")
 async def health_check():
     """健康检查"""
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+
+@app.get("/metrics")
+async def metrics():
+    """运行指标"""
+    return get_metrics().snapshot()
@@ -0,0 +1,124 @@
+"""
+批量生成路由
+一次请求生成多张图表，以 NDJSON 流式返回进度，或打包为 zip 下载
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from typing import Optional, List
+import io
+import json
+import logging
+import os
+import time
+import zipfile
+
+from app.dependencies import get_glm_service, get_session_manager
+from app.services.batch import BATCH_TARGETS, BatchGenerator
+from app.services.glm_service import GLMService
+from app.services.metrics import get_metrics
+from app.services.session_manager import SessionManager
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+BATCH_FORMATS = ("ndjson", "zip")
+
+
+class BatchItem(BaseModel):
+    """单条生成请求"""
+    prompt: str
+    name: Optional[str] = None  # 输出文件名，缺省为 diagram_<序号>
+
+
+class BatchGenerateRequest(BaseModel):
+    """批量生成请求"""
+    items: List[BatchItem]
+    format: str = "ndjson"  # ndjson / zip
+    target: str = "file"  # file: 只返回文件；session: 同时写入新建的无头会话
+    concurrency: Optional[int] = None
+
+
+def _dedupe_name(name: str, used: set) -> str:
+    """zip 内文件名去重：重名时追加序号"""
+    stem, ext = name[:-len(".drawio")], ".drawio"
+    candidate, n = name, 2
+    while candidate in used:
+        candidate = f"{stem}_{n}{ext}"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def _summary(results: List[dict], started: float) -> dict:
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    return {
+        "type": "summary",
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000),
+    }
+
+
+@router.post("/batch/generate")
+async def batch_generate(
+    request: BatchGenerateRequest,
+    glm_service: GLMService = Depends(get_glm_service),
+    session_manager: SessionManager = Depends(get_session_manager),
+):
+    """
+    批量生成图表
+
+    - format=ndjson: 每完成一条输出一行 {"type": "item", ...}，最后输出一行 {"type": "summary", ...}
+    - format=zip: 全部完成后返回 zip，包含成功的 .drawio 文件和记录每条状态的 manifest.json
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="items 不能为空")
+    max_items = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+    if len(request.items) > max_items:
+        raise HTTPException(status_code=400, detail=f"单次最多生成 {max_items} 张图表")
+    if request.format not in BATCH_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format 仅支持: {', '.join(BATCH_FORMATS)}")
+    if request.target not in BATCH_TARGETS:
+        raise HTTPException(status_code=400, detail=f"target 仅支持: {', '.join(BATCH_TARGETS)}")
+
+    get_metrics().incr("batch.requests")
+    generator = BatchGenerator(glm_service, request.concurrency, request.target, session_manager)
+    prompts = [item.model_dump() for item in request.items]
+    started = time.perf_counter()
+
+    if request.format == "ndjson":
+        async def lines():
+            results = []
+            async for result in generator.run(prompts):
+                results.append(result)
+                yield json.dumps({"type": "item", **result}, ensure_ascii=False) + "\n"
+            yield json.dumps(_summary(results, started), ensure_ascii=False) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    results = [result async for result in generator.run(prompts)]
+    results.sort(key=lambda r: r["index"])
+
+    buffer = io.BytesIO()
+    used = set()
+    manifest = []
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for result in results:
+            entry = {k: v for k, v in result.items() if k not in ("drawio", "completed", "total")}
+            if result["status"] == "ok":
+                entry["name"] = _dedupe_name(result["name"], used)
+                archive.writestr(entry["name"], result["drawio"])
+            manifest.append(entry)
+        archive.writestr("manifest.json", json.dumps(
+            {"summary": _summary(results, started), "items": manifest}, ensure_ascii=False, indent=2
+        ))
+
+    logger.info(f"[batch] zip 打包完成，大小: {buffer.tell()} 字节")
+    return Response(
+        content=buffer.getvalue(),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="diagrams.zip"'},
+    )
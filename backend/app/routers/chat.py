@@ -2,21 +2,33 @@
 AI 对话路由
 处理用户与 GLM 的对话，生成绘图指令
 """
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+import asyncio
 import logging
 
+from app.dependencies import get_glm_service, get_session_manager
+from app.services.cpu_pool import run_cpu
+from app.services.cancellation import ClientDisconnected, cancel_on_disconnect, ensure_connected
 from app.services.glm_service import GLMService
-from app.services.session_manager import SessionManager
-from app.services.mcp_client import get_mcp_client
+from app.services.intent import CREATE_DIAGRAM, classify_intent, is_conversational
+from app.services.layout import get_layout_engine
+from app.services.metrics import get_metrics
+from app.services.session_manager import SessionManager, get_diagram_client
+from app.services.stream_buffer import buffered_events
+from app.services.templates import get_template_engine
+from app.services.turn import prepare_turn
+from app.services.stream_events import (
+    CoalesceConfig, CompleteEvent, DiagramStatusEvent, ErrorEvent,
+    coalesce_text, encode_sse,
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-glm_service = GLMService()
-session_manager = SessionManager()
+coalesce_config = CoalesceConfig()
 
 
 class ChatMessage(BaseModel):
@@ -38,69 +50,146 @@ class ChatResponse(BaseModel):
     action: Optional[str] = None  # display / edit / none
 
 
+def _classify(message: str) -> str:
+    """预分类用户意图并记录指标"""
+    intent = classify_intent(message)
+    metrics = get_metrics()
+    metrics.incr(f"intent.{intent}")
+    if is_conversational(intent):
+        metrics.incr("chat.diagram_fetch_skipped")
+    logger.info(f"意图预分类: {intent}")
+    return intent
+
+
+def _try_template(intent: str, message: str) -> Optional[dict]:
+    """
+    创建类请求先尝试模板快速通道，命中时无需获取当前图表和调用 GLM
+
+    Returns:
+        模板生成的结果，未命中时返回 None
+    """
+    if intent != CREATE_DIAGRAM:
+        return None
+    metrics = get_metrics()
+    result = get_template_engine().try_serve(message)
+    metrics.incr("template.served" if result else "template.fallback")
+    served = metrics.counter("template.served")
+    metrics.set_gauge("template.share", served / (served + metrics.counter("template.fallback")))
+    if result:
+        logger.info("[template] 命中模板快速通道，跳过 GLM 调用")
+    return result
+
+
+async def _apply_result(client, session_id: str, result: dict, tag: str = "") -> bool:
+    """
+    根据 GLM 返回的指令执行图表操作
+    
+    Args:
+        client: 会话对应的图表后端（MCP 客户端或无头图表存储）
+    
+    Returns:
+        图表是否已更新
+    """
+    action = result.get("action", "none")
+    
+    if action == "display" and result.get("xml"):
+        # 显示新图表，缺少坐标或节点重叠时先自动布局（大图表在线程池中计算）
+        xml = await run_cpu(get_layout_engine().apply, result["xml"], result.get("layout"), size=len(result["xml"]))
+        logger.info(f"{tag}准备显示图表，XML 长度: {len(xml)}")
+        success = await client.display_diagram(session_id, xml)
+        if success:
+            logger.info(f"{tag}图表显示成功")
+        else:
+            logger.error(f"{tag}图表显示失败，MCP display_diagram 返回 False")
+        return success
+    
+    if action == "edit" and result.get("operations"):
+        # 编辑现有图表
+        operations = result["operations"]
+        logger.info(f"{tag}准备编辑图表，操作数: {len(operations)}")
+        success = await client.edit_diagram(session_id, operations)
+        if success:
+            logger.info(f"{tag}图表编辑成功")
+        else:
+            logger.error(f"{tag}图表编辑失败，MCP edit_diagram 返回 False")
+        return success
+    
+    return False
+
+
 @router.post("/chat/{session_id}", response_model=ChatResponse)
-async def chat_with_glm(session_id: str, request: ChatRequest):
+async def chat_with_glm(
+    session_id: str,
+    request: ChatRequest,
+    raw_request: Request,
+    glm_service: GLMService = Depends(get_glm_service),
+    session_manager: SessionManager = Depends(get_session_manager),
+):
     """
     与 GLM 进行对话，生成/修改图表
+    
+    客户端中途断开时取消进行中的生成，并跳过图表操作
     """
     # 验证会话是否存在
     session_info = await session_manager.get_session(session_id)
     if not session_info:
         raise HTTPException(status_code=404, detail="会话不存在")
     
+    metrics = get_metrics()
     try:
-        # 获取 MCP 客户端
-        mcp_client = get_mcp_client()
+        # 获取会话对应的图表后端
+        client = get_diagram_client(session_info)
         
-        # 获取当前图表 XML（如果有）
-        current_xml = await mcp_client.get_diagram(session_id)
+        # 预分类意图，寒暄和提问无需获取当前图表
+        intent = _classify(request.message)
         
-        # 调用 GLM 服务
-        result = await glm_service.chat(
-            user_message=request.message,
-            history=request.history,
-            current_diagram_xml=current_xml
-        )
+        # 简单的创建请求直接用模板生成
+        result = _try_template(intent, request.message)
+        if result is None:
+            # 并行获取当前图表 XML、建立上游连接和准备对话历史
+            turn = await cancel_on_disconnect(raw_request, prepare_turn(
+                glm_service, client, session_id, request.message, request.history, intent
+            ))
+            
+            # 调用 GLM 服务
+            result = await cancel_on_disconnect(raw_request, glm_service.chat(
+                user_message=request.message,
+                current_diagram_xml=turn.current_xml,
+                intent=intent,
+                messages=turn.messages
+            ))
         
-        # 根据 GLM 返回的指令执行图表操作
-        diagram_updated = False
         action = result.get("action", "none")
-        
         logger.info(f"GLM 返回 action: {action}")
         
-        if action == "display" and result.get("xml"):
-            # 显示新图表
-            xml = result["xml"]
-            logger.info(f"准备显示图表，XML 长度: {len(xml)}")
-            success = await mcp_client.display_diagram(session_id, xml)
-            if success:
-                diagram_updated = True
-                logger.info(f"图表显示成功")
-            else:
-                logger.error(f"图表显示失败，MCP display_diagram 返回 False")
-        elif action == "edit" and result.get("operations"):
-            # 编辑现有图表
-            operations = result["operations"]
-            logger.info(f"准备编辑图表，操作数: {len(operations)}")
-            success = await mcp_client.edit_diagram(session_id, operations)
-            if success:
-                diagram_updated = True
-                logger.info(f"图表编辑成功")
-            else:
-                logger.error(f"图表编辑失败，MCP edit_diagram 返回 False")
+        # 图表操作一旦开始就执行完毕，避免中途取消导致预览与缓存不一致
+        await ensure_connected(raw_request)
+        diagram_updated = await asyncio.shield(_apply_result(client, session_id, result))
         
+        metrics.incr("chat.completed")
         return ChatResponse(
             reply=result.get("reply", ""),
             diagram_updated=diagram_updated,
             action=action
         )
     
+    except ClientDisconnected:
+        metrics.incr("chat.cancelled")
+        logger.info(f"会话 {session_id} 客户端已断开，已取消本轮对话")
+        return Response(status_code=499)
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"对话处理失败: {str(e)}")
 
 
 @router.post("/chat/{session_id}/stream")
-async def chat_with_glm_stream(session_id: str, request: ChatRequest):
+async def chat_with_glm_stream(
+    session_id: str,
+    request: ChatRequest,
+    raw_request: Request,
+    glm_service: GLMService = Depends(get_glm_service),
+    session_manager: SessionManager = Depends(get_session_manager),
+):
     """
     与 GLM 进行流式对话
     """
@@ -109,58 +198,48 @@ async def chat_with_glm_stream(session_id: str, request: ChatRequest):
     if not session_info:
         raise HTTPException(status_code=404, detail="会话不存在")
     
-    async def generate():
+    async def events():
         try:
-            mcp_client = get_mcp_client()
-            current_xml = await mcp_client.get_diagram(session_id)
-            final_result = None
+            client = get_diagram_client(session_info)
+            intent = _classify(request.message)
+            final_result = _try_template(intent, request.message)
             
-            async for chunk in glm_service.chat_stream(
-                user_message=request.message,
-                history=request.history,
-                current_diagram_xml=current_xml
-            ):
-                yield f"data: {chunk}\n\n"
+            if final_result is not None:
+                # 模板命中，直接发送完整结果
+                yield CompleteEvent(result=final_result)
+            else:
+                turn = await prepare_turn(
+                    glm_service, client, session_id, request.message, request.history, intent
+                )
                 
-                # 解析 chunk，获取最终结果
-                try:
-                    import json
-                    chunk_data = json.loads(chunk)
-                    if chunk_data.get("type") == "complete":
-                        final_result = chunk_data.get("result")
-                except:
-                    pass
+                async for event in glm_service.chat_stream(
+                    user_message=request.message,
+                    current_diagram_xml=turn.current_xml,
+                    intent=intent,
+                    messages=turn.messages
+                ):
+                    yield event
+                    if isinstance(event, CompleteEvent):
+                        final_result = event.result
             
             # 流式结束后，执行图表操作
             if final_result:
-                action = final_result.get("action", "none")
-                diagram_updated = False
-                
-                if action == "display" and final_result.get("xml"):
-                    xml = final_result["xml"]
-                    logger.info(f"[stream] 准备显示图表，XML 长度: {len(xml)}")
-                    success = await mcp_client.display_diagram(session_id, xml)
-                    if success:
-                        diagram_updated = True
-                        logger.info("[stream] 图表显示成功")
-                    else:
-                        logger.error("[stream] 图表显示失败")
-                        
-                elif action == "edit" and final_result.get("operations"):
-                    operations = final_result["operations"]
-                    logger.info(f"[stream] 准备编辑图表，操作数: {len(operations)}")
-                    success = await mcp_client.edit_diagram(session_id, operations)
-                    if success:
-                        diagram_updated = True
-                        logger.info("[stream] 图表编辑成功")
-                    else:
-                        logger.error("[stream] 图表编辑失败")
+                if await raw_request.is_disconnected():
+                    logger.info("[stream] 客户端已断开，跳过图表操作")
+                    get_metrics().incr("stream.apply_skipped")
+                    return
+                diagram_updated = await asyncio.shield(_apply_result(client, session_id, final_result, "[stream] "))
                 
                 # 发送图表更新状态
-                yield f"data: {{\"type\": \"diagram_status\", \"updated\": {str(diagram_updated).lower()}}}\n\n"
+                yield DiagramStatusEvent(updated=diagram_updated)
                 
         except Exception as e:
             logger.error(f"[stream] 错误: {str(e)}")
-            yield f"data: {{\"type\": \"error\", \"message\": \"{str(e)}\"}}\n\n"
+            yield ErrorEvent(message=str(e))
+    
+    async def generate():
+        # 有界缓冲区负责背压与断开检测，合并在缓冲区之后进行
+        async for event in coalesce_text(buffered_events(events(), raw_request), coalesce_config):
+            yield encode_sse(event)
     
     return StreamingResponse(generate(), media_type="text/event-stream")
@@ -2,16 +2,16 @@
 图表操作路由
 处理图表的获取、修改和导出
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import Optional, List
 
-from app.services.session_manager import SessionManager
-from app.services.mcp_client import get_mcp_client
+from app.dependencies import get_session_manager
+from app.services.edit_queue import get_edit_queue
+from app.services.session_manager import SessionManager, get_diagram_client
 
 router = APIRouter()
-session_manager = SessionManager()
 
 
 class DiagramXMLResponse(BaseModel):
@@ -33,7 +33,7 @@ class EditDiagramRequest(BaseModel):
 
 
 @router.get("/diagram/{session_id}", response_model=DiagramXMLResponse)
-async def get_diagram(session_id: str):
+async def get_diagram(session_id: str, session_manager: SessionManager = Depends(get_session_manager)):
     """
     获取当前图表 XML
     """
@@ -42,33 +42,39 @@ async def get_diagram(session_id: str):
         raise HTTPException(status_code=404, detail="会话不存在")
     
     try:
-        mcp_client = get_mcp_client()
-        xml = await mcp_client.get_diagram(session_id)
+        client = get_diagram_client(session_info)
+        xml = await client.get_diagram(session_id)
         return DiagramXMLResponse(session_id=session_id, xml=xml or "")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取图表失败: {str(e)}")
 
 
 @router.post("/diagram/{session_id}/edit")
-async def edit_diagram(session_id: str, request: EditDiagramRequest):
+async def edit_diagram(
+    session_id: str,
+    request: EditDiagramRequest,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
     """
     编辑图表（手动操作）
+    
+    短时间内的连续编辑合并为一次图表操作，见 app.services.edit_queue
     """
     session_info = await session_manager.get_session(session_id)
     if not session_info:
         raise HTTPException(status_code=404, detail="会话不存在")
     
     try:
-        mcp_client = get_mcp_client()
+        client = get_diagram_client(session_info)
         operations = [op.model_dump() for op in request.operations]
-        success = await mcp_client.edit_diagram(session_id, operations)
+        success = await get_edit_queue().submit(client, session_id, operations)
         return {"success": success, "message": "图表已更新"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"编辑图表失败: {str(e)}")
 
 
 @router.get("/diagram/{session_id}/download")
-async def download_diagram(session_id: str):
+async def download_diagram(session_id: str, session_manager: SessionManager = Depends(get_session_manager)):
     """
     下载 .drawio 文件
     """
@@ -77,8 +83,8 @@ async def download_diagram(session_id: str):
         raise HTTPException(status_code=404, detail="会话不存在")
     
     try:
-        mcp_client = get_mcp_client()
-        file_content = await mcp_client.export_diagram(session_id)
+        client = get_diagram_client(session_info)
+        file_content = await client.export_diagram(session_id)
         
         return Response(
             content=file_content,
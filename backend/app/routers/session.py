@@ -2,20 +2,26 @@
 会话管理路由
 处理用户会话的创建、查询和删除
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 
-from app.services.session_manager import SessionManager
+from app.dependencies import get_session_manager
+from app.services.session_manager import SessionManager, SESSION_MODES
 
 router = APIRouter()
-session_manager = SessionManager()
+
+
+class CreateSessionRequest(BaseModel):
+    """会话创建请求"""
+    mode: Optional[str] = None  # preview / headless，缺省使用 SESSION_DEFAULT_MODE
 
 
 class SessionResponse(BaseModel):
     """会话创建响应"""
     session_id: str
-    preview_url: str
+    preview_url: Optional[str] = None  # headless 会话没有预览地址
+    mode: str
     message: str
 
 
@@ -23,21 +29,30 @@ class SessionStatusResponse(BaseModel):
     """会话状态响应"""
     session_id: str
     status: str
+    mode: str
     created_at: str
     preview_url: Optional[str] = None
 
 
 @router.post("/session", response_model=SessionResponse)
-async def create_session():
+async def create_session(
+    request: Optional[CreateSessionRequest] = None,
+    session_manager: SessionManager = Depends(get_session_manager),
+):
     """
     创建新的绘图会话
-    返回 session_id 和预览 URL
+    返回 session_id 和预览 URL；headless 模式不启动 MCP Server，也没有预览
     """
+    mode = request.mode if request else None
+    if mode and mode not in SESSION_MODES:
+        raise HTTPException(status_code=400, detail=f"mode 仅支持: {', '.join(SESSION_MODES)}")
+    
     try:
-        session_info = await session_manager.create_session()
+        session_info = await session_manager.create_session(mode)
         return SessionResponse(
             session_id=session_info["session_id"],
             preview_url=session_info["preview_url"],
+            mode=session_info["mode"],
             message="会话创建成功"
         )
     except Exception as e:
@@ -45,7 +60,7 @@ async def create_session():
 
 
 @router.get("/session/{session_id}", response_model=SessionStatusResponse)
-async def get_session_status(session_id: str):
+async def get_session_status(session_id: str, session_manager: SessionManager = Depends(get_session_manager)):
     """
     获取会话状态
     """
@@ -56,13 +71,14 @@ async def get_session_status(session_id: str):
     return SessionStatusResponse(
         session_id=session_id,
         status=session_info.get("status", "unknown"),
+        mode=session_info.get("mode", "preview"),
         created_at=session_info.get("created_at", ""),
         preview_url=session_info.get("preview_url")
     )
 
 
 @router.delete("/session/{session_id}")
-async def delete_session(session_id: str):
+async def delete_session(session_id: str, session_manager: SessionManager = Depends(get_session_manager)):
     """
     删除会话
     """
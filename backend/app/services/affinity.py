@@ -0,0 +1,182 @@
+"""
+会话亲和与请求转发
+多工作进程部署时，会话的 MCP 浏览器预览和无头图表都只存在于创建它的进程中。
+会话元数据（共享存储）的 worker 字段记录所属进程的内部地址，任一进程收到
+/api/session|chat|diagram/{session_id} 请求时，若会话属于其他进程则原样转发过去，
+响应（包括 SSE / NDJSON 流）逐块回传给客户端。
+
+未设置 WORKER_URL 时为单进程部署，中间件直接放行。
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
+
+from app.services.metrics import get_metrics
+from app.services.session_store import get_session_store
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# 标记已转发过的请求，避免亲和信息不一致时在进程间来回转发
+FORWARDED_HEADER = b"x-drawio-forwarded"
+
+_SESSION_PATH = re.compile(r"^/api/(?:session|chat|diagram)/([^/]+)")
+
+# 不转发的逐跳头部
+_REQUEST_SKIP = {b"host", b"content-length", b"connection", b"keep-alive", b"transfer-encoding", b"upgrade"}
+_RESPONSE_SKIP = {b"connection", b"keep-alive", b"transfer-encoding", b"upgrade"}
+
+# 会话归属不会改变，本地缓存最近查询过的会话，避免每个请求都访问共享存储
+_OWNER_CACHE_SIZE = 10000
+
+
+def worker_url() -> Optional[str]:
+    """当前工作进程的内部地址，单进程部署时为 None"""
+    return os.getenv("WORKER_URL") or None
+
+
+_forward_client: Optional["httpx.AsyncClient"] = None
+
+
+def get_forward_client() -> "httpx.AsyncClient":
+    """获取转发用的 HTTP 客户端单例（单进程部署不会用到，httpx 推迟到此时导入）"""
+    import httpx
+
+    global _forward_client
+    if _forward_client is None:
+        connect_timeout = float(os.getenv("AFFINITY_CONNECT_TIMEOUT", "3"))
+        # 流式响应可能持续很久，只限制建立连接的时间
+        _forward_client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=connect_timeout))
+    return _forward_client
+
+
+async def close_forward_client():
+    """关闭转发用的 HTTP 客户端"""
+    global _forward_client
+    if _forward_client is not None:
+        await _forward_client.aclose()
+        _forward_client = None
+
+
+class SessionAffinityMiddleware:
+    """把会话请求转发到会话所属工作进程的 ASGI 中间件"""
+
+    def __init__(self, app, client: Optional["httpx.AsyncClient"] = None):
+        self.app = app
+        self._client = client
+        self._owners: "OrderedDict[str, Optional[str]]" = OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        own = worker_url()
+        if scope["type"] != "http" or not own:
+            return await self.app(scope, receive, send)
+
+        match = _SESSION_PATH.match(scope["path"])
+        if not match or any(name == FORWARDED_HEADER for name, _ in scope["headers"]):
+            return await self.app(scope, receive, send)
+
+        owner = await self._owner(match.group(1))
+        if not owner or owner == own:
+            return await self.app(scope, receive, send)
+
+        await self._forward(owner, scope, receive, send)
+
+    async def _owner(self, session_id: str) -> Optional[str]:
+        """查询会话所属进程，会话不存在时返回 None（由本进程返回 404）"""
+        if session_id in self._owners:
+            self._owners.move_to_end(session_id)
+            return self._owners[session_id]
+        session_info = await get_session_store().get(session_id)
+        if session_info is None:
+            return None
+        owner = session_info.get("worker")
+        self._owners[session_id] = owner
+        if len(self._owners) > _OWNER_CACHE_SIZE:
+            self._owners.popitem(last=False)
+        return owner
+
+    async def _forward(self, owner: str, scope, receive, send):
+        import httpx
+
+        metrics = get_metrics()
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        url = owner.rstrip("/") + scope["path"]
+        if scope.get("query_string"):
+            url += "?" + scope["query_string"].decode("latin-1")
+        headers = [(k, v) for k, v in scope["headers"] if k.lower() not in _REQUEST_SKIP]
+        headers.append((FORWARDED_HEADER, worker_url().encode("latin-1")))
+
+        client = self._client or get_forward_client()
+        request = client.build_request(scope["method"], url, headers=headers, content=body)
+
+        async def wait_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        # 客户端断开后立即关闭上游连接，所属进程据此取消进行中的生成。
+        # 非流式接口（POST /api/chat/{id}）在整轮完成前不返回任何数据，等待响应头和每个数据块时都要同时监听断开
+        disconnected = asyncio.create_task(wait_disconnect())
+        sending = asyncio.ensure_future(client.send(request, stream=True))
+        try:
+            await asyncio.wait({sending, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not sending.done():
+                metrics.incr("affinity.client_disconnected")
+                return
+            try:
+                response = sending.result()
+            except httpx.TransportError as e:
+                metrics.incr("affinity.unavailable")
+                logger.error(f"[affinity] 转发到 {owner} 失败: {e}")
+                payload = json.dumps({"detail": "会话所在的工作进程不可用"}, ensure_ascii=False).encode("utf-8")
+                await send({
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+                })
+                await send({"type": "http.response.body", "body": payload})
+                return
+
+            metrics.incr("affinity.forwarded")
+            try:
+                await send({
+                    "type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": [(k, v) for k, v in response.headers.raw if k.lower() not in _RESPONSE_SKIP],
+                })
+                chunks = response.aiter_raw().__aiter__()
+                while True:
+                    step = asyncio.ensure_future(chunks.__anext__())
+                    await asyncio.wait({step, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                    if not step.done():
+                        step.cancel()
+                        await asyncio.gather(step, return_exceptions=True)
+                        metrics.incr("affinity.client_disconnected")
+                        return
+                    try:
+                        chunk = step.result()
+                    except StopAsyncIteration:
+                        break
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+            finally:
+                await response.aclose()
+        finally:
+            disconnected.cancel()
+            if not sending.done():
+                # 取消请求会关闭到所属进程的连接
+                sending.cancel()
+                await asyncio.gather(sending, return_exceptions=True)
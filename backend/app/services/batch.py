@@ -0,0 +1,187 @@
+"""
+批量图表生成
+一次请求生成多张图表：按有界并发把各条提示词分发给 GLM（简单请求优先走模板快速通道），
+结果经自动布局和 XML 校验后直接包装为 .drawio 文件，不经过 MCP 实时预览；
+target=session 时另外为每张图表创建一个无头会话，之后可通过 /api/diagram/{session_id} 继续获取或编辑。
+
+每条提示词相互独立，单条失败只记录错误，不影响其余条目。
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.services.cpu_pool import run_cpu
+from app.services.diagram_store import get_headless_client
+from app.services.intent import CREATE_DIAGRAM
+from app.services.layout import get_layout_engine
+from app.services.mcp_client import validate_and_fix_xml, wrap_as_drawio_file
+from app.services.metrics import get_metrics
+from app.services.session_manager import HEADLESS, SessionManager
+from app.services.templates import get_template_engine
+
+logger = logging.getLogger(__name__)
+
+FILE_TARGET = "file"
+SESSION_TARGET = "session"
+BATCH_TARGETS = (FILE_TARGET, SESSION_TARGET)
+
+# 文件名中不允许出现的字符
+_UNSAFE_NAME = re.compile(r"[^\w\-.]+")
+
+
+def safe_file_name(name: str, index: int) -> str:
+    """
+    将用户给定的名称转为安全的 .drawio 文件名
+
+    Args:
+        name: 用户给定的名称，可为空
+        index: 条目序号，名称为空时用于生成默认文件名
+    """
+    stem = _UNSAFE_NAME.sub("_", (name or "").strip()).strip("._")
+    if stem.lower().endswith(".drawio"):
+        stem = stem[:-len(".drawio")]
+    return f"{stem or f'diagram_{index + 1}'}.drawio"
+
+
+def _layout_and_validate(xml: str, layout: Optional[str]) -> Tuple[bool, str, str]:
+    """自动布局后校验并修复 XML，在线程池中执行"""
+    return validate_and_fix_xml(get_layout_engine().apply(xml, layout))
+
+
+class BatchGenerator:
+    """
+    批量生成器
+
+    并发度由信号量限制；结果按完成顺序产出，每条结果附带当前进度。
+    """
+
+    def __init__(
+        self,
+        glm_service,
+        concurrency: Optional[int] = None,
+        target: str = FILE_TARGET,
+        session_manager: Optional[SessionManager] = None,
+    ):
+        self.glm_service = glm_service
+        self.target = target
+        self.session_manager = session_manager or SessionManager()
+        self.max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+        default = int(os.getenv("BATCH_CONCURRENCY", "4"))
+        self.concurrency = max(1, min(concurrency or default, self.max_concurrency))
+        self.item_timeout = float(os.getenv("BATCH_ITEM_TIMEOUT", "180"))
+
+    async def run(self, prompts: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        生成全部条目，按完成顺序逐条产出结果
+
+        Args:
+            prompts: 条目列表，每项包含 prompt 和可选的 name
+
+        Yields:
+            单条结果，包含 index/name/status/elapsed_ms/completed/total，
+            成功时带 drawio 文件内容（target=session 时另带 session_id），失败时带 error
+        """
+        total = len(prompts)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def worker(index: int, item: Dict[str, Any]):
+            async with semaphore:
+                result = await self._generate(index, item)
+            await queue.put(result)
+
+        logger.info(f"[batch] 开始批量生成，条目数: {total}，并发度: {self.concurrency}")
+        tasks = [asyncio.create_task(worker(i, item)) for i, item in enumerate(prompts)]
+        try:
+            for completed in range(1, total + 1):
+                result = await queue.get()
+                result.update(completed=completed, total=total)
+                yield result
+        finally:
+            # 调用方提前退出（如客户端断开）时取消尚未完成的条目
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _generate(self, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        """生成单条图表，异常转换为错误结果"""
+        metrics = get_metrics()
+        name = safe_file_name(item.get("name"), index)
+        start = time.perf_counter()
+        entry: Dict[str, Any] = {"index": index, "name": name}
+        try:
+            result = await asyncio.wait_for(self._produce(item["prompt"]), self.item_timeout)
+            entry.update(status="ok", **result)
+            metrics.incr("batch.items_ok")
+        except asyncio.TimeoutError:
+            entry.update(status="error", error=f"生成超时（{self.item_timeout:g} 秒）")
+            metrics.incr("batch.items_failed")
+        except Exception as e:
+            entry.update(status="error", error=str(e))
+            metrics.incr("batch.items_failed")
+        elapsed = time.perf_counter() - start
+        metrics.observe("batch.item_duration", elapsed)
+        entry["elapsed_ms"] = round(elapsed * 1000)
+        if entry["status"] != "ok":
+            logger.warning(f"[batch] 第 {index + 1} 条生成失败: {entry['error']}")
+        return entry
+
+    async def _produce(self, prompt: str) -> Dict[str, Any]:
+        """
+        调用模板或 GLM 生成图表并包装为 .drawio 文件，target=session 时写入新建的无头会话
+
+        Raises:
+            ValueError: 模型未返回图表或 XML 无法修复
+        """
+        result = get_template_engine().try_serve(prompt)
+        if result is None:
+            result = await self.glm_service.chat(user_message=prompt, intent=CREATE_DIAGRAM)
+
+        if result.get("action") != "display" or not result.get("xml"):
+            reply = (result.get("reply") or "").strip()
+            raise ValueError(f"模型未生成图表: {reply[:200]}" if reply else "模型未生成图表")
+
+        # 同一批次的布局与校验共用一条线程池队列，不挤占交互请求
+        is_valid, xml, error_msg = await run_cpu(
+            _layout_and_validate, result["xml"], result.get("layout"), size=len(result["xml"]), key=self
+        )
+        if not is_valid:
+            raise ValueError(f"图表 XML 无效: {error_msg}")
+
+        produced = {
+            "source": result.get("source", "glm"),
+            "reply": result.get("reply", ""),
+            "drawio": wrap_as_drawio_file(xml),
+        }
+        if self.target == SESSION_TARGET:
+            produced["session_id"] = await self._store_in_session(xml)
+        return produced
+
+    async def _store_in_session(self, xml: str) -> str:
+        """
+        新建无头会话并写入图表，返回会话 ID
+
+        写入失败、条目被取消或超时时删除已创建的会话，不留下指向空白图表的会话。
+
+        Raises:
+            ValueError: 图表写入会话失败
+        """
+        # 创建会话在独立任务中执行：条目被取消时仍能拿到已创建的会话并删除
+        creating = asyncio.ensure_future(self.session_manager.create_session(HEADLESS))
+        session_id = None
+        try:
+            session_id = (await asyncio.shield(creating))["session_id"]
+            if not await get_headless_client().display_diagram(session_id, xml):
+                raise ValueError("图表写入会话失败")
+            return session_id
+        except BaseException:
+            if session_id is None:
+                results = await asyncio.gather(creating, return_exceptions=True)
+                if isinstance(results[0], dict):
+                    session_id = results[0]["session_id"]
+            if session_id is not None:
+                await asyncio.shield(self.session_manager.delete_session(session_id))
+            raise
@@ -0,0 +1,57 @@
+"""
+客户端断开检测与取消传播
+客户端断开后取消正在进行的 GLM 生成和 MCP 读取，不再执行后续的图表操作
+"""
+import asyncio
+import os
+from typing import Awaitable, TypeVar
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """客户端已断开连接"""
+
+
+def disconnect_poll_interval() -> float:
+    """断开检测间隔（秒）"""
+    return float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+
+async def cancel_on_disconnect(request, awaitable: Awaitable[T], poll_interval: float = None) -> T:
+    """
+    执行 awaitable，期间定期检查客户端是否断开
+
+    Args:
+        request: Starlette Request
+        awaitable: 要执行的协程
+        poll_interval: 检测间隔（秒）
+
+    Raises:
+        ClientDisconnected: 客户端已断开，awaitable 已被取消
+    """
+    poll_interval = poll_interval or disconnect_poll_interval()
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise ClientDisconnected()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
+async def ensure_connected(request):
+    """
+    在开始不可撤销的操作前确认客户端仍在线
+
+    Raises:
+        ClientDisconnected: 客户端已断开
+    """
+    if await request.is_disconnected():
+        raise ClientDisconnected()
@@ -0,0 +1,263 @@
+"""
+编辑上下文选择
+大图表上的局部修改（如「把数据库节点改成红色」）不需要把整张图表的 XML 发给模型。
+按用户消息中提到的 id 和标签找到相关单元格，再沿连线 / 父容器扩展 k 跳邻域，
+在 token 预算内只发送这部分子图，其余单元格用一份紧凑的概要（id + 标签）代替。
+
+- 整张图表不超过预算时不做选择，原样发送；
+- 消息中找不到任何相关单元格（如「整体改成横向布局」）时同样发送整张图表；
+- 模型返回的编辑操作仍在服务端的完整图表上执行，未列出的单元格不受影响。
+
+指标：edit_context.selected / no_match / unparsed 计数，edit_context.ratio（选择后 / 原始 token 数）
+"""
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.services.diagram_index import ROOT_IDS, DiagramIndex, get_index_cache
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 概要占总预算的比例
+OUTLINE_SHARE = 0.25
+
+# 模糊匹配时标签中命中的词所占比例达到该值才视为相关
+_FUZZY_THRESHOLD = 0.3
+
+_ID_TOKEN = re.compile(r"[A-Za-z0-9_\-.:]+")
+_WORD = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：非 ASCII 字符（中文）按 1 个，ASCII 按 4 个字符 1 个"""
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_chars) + ascii_chars // 4
+
+
+def _terms(text: str) -> List[str]:
+    """切分为用于模糊匹配的词：英文单词 / 数字整体，中文按相邻两字切分"""
+    terms = []
+    for run in _WORD.findall(text.lower()):
+        if run[0] >= "一" and len(run) > 2:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
+
+
+def _contains_label(message: str, label: str) -> bool:
+    """标签整体出现在消息中，且首尾不是更长的英文单词或数字的一部分（「步骤 1」不匹配「步骤 12」）"""
+    start = message.find(label)
+    while start != -1:
+        end = start + len(label)
+        before = message[start - 1] if start else " "
+        after = message[end] if end < len(message) else " "
+        if not (label[0].isalnum() and before.isascii() and before.isalnum()) and \
+                not (label[-1].isalnum() and after.isascii() and after.isalnum()):
+            return True
+        start = message.find(label, start + 1)
+    return False
+
+
+def match_cells(index: DiagramIndex, message: str) -> Dict[str, float]:
+    """
+    找出消息提到的单元格
+
+    Returns:
+        单元格 id -> 相关度（id 或完整标签出现在消息中为 1.0，部分词命中时小于 1），按相关度降序
+    """
+    scores: Dict[str, float] = {}
+    for token in _ID_TOKEN.findall(message):
+        if token in index.cells and token not in ROOT_IDS:
+            scores[token] = 1.0
+
+    lowered = message.lower()
+    message_terms = set(_terms(message))
+    label_terms = {cid: _terms(label) for cid, label in index.labels.items() if label}
+    # 出现在很多标签中的词（如「服务」「步骤」）区分度低，不作为命中依据
+    df: Dict[str, int] = {}
+    for terms in label_terms.values():
+        for term in set(terms):
+            df[term] = df.get(term, 0) + 1
+    common = max(3, len(label_terms) // 20)
+
+    fuzzy = []
+    for cid, terms in label_terms.items():
+        if cid in scores:
+            continue
+        if _contains_label(lowered, index.labels[cid].lower()):
+            scores[cid] = 1.0
+        else:
+            fuzzy.append(cid)
+    # 已被完整命中的标签解释过的词不再用于模糊匹配（「步骤 12」命中后，「步骤 1」不因「步骤」相关）
+    explained = {t for cid in scores if cid in label_terms for t in label_terms[cid]}
+    for cid in fuzzy:
+        terms = label_terms[cid]
+        matched = sum(len(t) for t in terms if t in message_terms and t not in explained and df[t] <= common)
+        if matched:
+            score = matched / sum(len(t) for t in terms)
+            if score >= _FUZZY_THRESHOLD:
+                scores[cid] = score
+    return dict(sorted(scores.items(), key=lambda item: -item[1]))
+
+
+@dataclass
+class EditContext:
+    """选择出的编辑上下文"""
+    xml: str
+    outline: str
+    total: int
+    selected: int
+    full_tokens: int
+    tokens: int
+
+    def render(self, user_message: str) -> str:
+        """生成附带在用户消息前的图表上下文"""
+        outline = f"\n\n{self.outline}" if self.outline else ""
+        return f"""当前图表较大（共 {self.total} 个单元格），以下只列出与需求相关的 {self.selected} 个单元格及其相邻单元格：
+```xml
+{self.xml}
+```{outline}
+
+请使用 edit 操作修改，只引用上面出现过的 id，不要输出整张图表。
+
+用户需求：{user_message}"""
+
+
+class _Selection:
+    """在 token 预算内按顺序收集单元格"""
+
+    def __init__(self, index: DiagramIndex, budget: int):
+        self.index = index
+        self.budget = budget
+        self.cells: Dict[str, None] = {}
+        self.tokens = 0
+        self.full = False
+
+    def take(self, cell_id: str) -> bool:
+        """加入单元格，超出预算时返回 False 并停止后续选择"""
+        if cell_id in self.cells or cell_id not in self.index.cells:
+            return True
+        if self.full:
+            return False
+        cost = estimate_tokens(self.index.xml_of(cell_id))
+        if self.tokens + cost > self.budget:
+            self.full = True
+            return False
+        self.cells[cell_id] = None
+        self.tokens += cost
+        return True
+
+
+def _expand(index: DiagramIndex, cell_id: str) -> List[str]:
+    """一跳以内的单元格：连线的两端；节点相连的连线和另一端节点；容器的子单元格"""
+    if index.is_edge(cell_id):
+        return [end for end in index.endpoints[cell_id] if end]
+    result = []
+    for edge_id in index.edges_of.get(cell_id, []):
+        result.append(edge_id)
+        result.extend(end for end in index.endpoints[edge_id] if end and end != cell_id)
+    result.extend(index.children.get(cell_id, []))
+    return result
+
+
+def _outline(index: DiagramIndex, selected: Dict[str, None], budget: int) -> str:
+    """未选中单元格的概要：数量统计和节点 id / 标签列表（超出预算的部分只给出数量）"""
+    rest = [cid for cid in index.cells if cid not in selected and cid not in ROOT_IDS]
+    if not rest:
+        return ""
+    edges = sum(1 for cid in rest if index.is_edge(cid))
+    lines = [f"其余 {len(rest)} 个单元格未列出（{len(rest) - edges} 个节点、{edges} 条连线），节点概要："]
+    used = estimate_tokens(lines[0])
+    listed = 0
+    nodes = [cid for cid in rest if not index.is_edge(cid)]
+    for cid in nodes:
+        label = index.labels.get(cid) or "无标签"
+        children = len(index.children.get(cid, []))
+        item = f"- {cid}「{label}」" + (f"（分组，含 {children} 个单元格）" if children else "")
+        cost = estimate_tokens(item) + 1
+        if used + cost > budget:
+            break
+        lines.append(item)
+        used += cost
+        listed += 1
+    if listed < len(nodes):
+        lines.append(f"- ……另有 {len(nodes) - listed} 个节点")
+    return "\n".join(lines)
+
+
+def select_edit_context(
+    xml: str, message: str, budget: int, hops: int = 1, session_id: Optional[str] = None
+) -> Optional[EditContext]:
+    """
+    为编辑请求选择图表上下文
+
+    Args:
+        xml: 当前图表 XML
+        message: 用户消息
+        budget: 图表上下文的 token 预算（子图 + 概要），0 表示不做选择
+        hops: 从提到的单元格向外扩展的跳数
+        session_id: 会话 ID，用于复用该会话缓存的图表索引
+
+    Returns:
+        选择结果；无需选择（图表不超过预算、无法解析或消息未提到任何单元格）时返回 None，由调用方发送整张图表
+    """
+    metrics = get_metrics()
+    full_tokens = estimate_tokens(xml)
+    if budget <= 0 or full_tokens <= budget:
+        return None
+    try:
+        index = get_index_cache().get(xml, session_id)
+    except Exception as e:
+        logger.warning(f"[context] 图表 XML 无法解析，发送整张图表: {e}")
+        metrics.incr("edit_context.unparsed")
+        return None
+
+    seeds = match_cells(index, message)
+    if not seeds:
+        metrics.incr("edit_context.no_match")
+        logger.info("[context] 消息未提到具体单元格，发送整张图表")
+        return None
+
+    selection = _Selection(index, int(budget * (1 - OUTLINE_SHARE)))
+    for root_id in ROOT_IDS:
+        selection.take(root_id)
+    frontier = []
+    for seed in seeds:
+        # 先放入所在的容器，保持父子结构完整
+        for ancestor in reversed(index.ancestors(seed)):
+            selection.take(ancestor)
+        if not selection.take(seed):
+            break
+        frontier.append(seed)
+    for _ in range(hops):
+        reached = []
+        for cid in frontier:
+            for other in _expand(index, cid):
+                if other not in selection.cells and selection.take(other):
+                    reached.append(other)
+        frontier = reached
+    # 两端都已选中的连线一并列出
+    for edge_id, (source, target) in index.endpoints.items():
+        if source in selection.cells and target in selection.cells:
+            selection.take(edge_id)
+
+    body = "".join(index.xml_of(cid) for cid in index.cells if cid in selection.cells)
+    context = EditContext(
+        xml=f"<mxGraphModel><root>{body}</root></mxGraphModel>",
+        outline=_outline(index, selection.cells, budget - selection.tokens),
+        total=len(index),
+        selected=len(selection.cells),
+        full_tokens=full_tokens,
+        tokens=0,
+    )
+    context.tokens = estimate_tokens(context.xml) + estimate_tokens(context.outline)
+    metrics.incr("edit_context.selected")
+    metrics.observe("edit_context.ratio", context.tokens / full_tokens)
+    logger.info(
+        f"[context] 选取 {context.selected}/{context.total} 个单元格，"
+        f"约 {context.tokens} / {full_tokens} tokens"
+    )
+    return context
@@ -0,0 +1,132 @@
+"""
+CPU 密集任务线程池
+大图表的 XML 解析、修复、自动布局和响应解析都是纯 CPU 计算，在事件循环线程中执行时
+会卡住所有其他连接（流式输出、断开检测、其他会话的请求）。
+
+- 输入小于 CPU_OFFLOAD_THRESHOLD 字符时直接在事件循环中执行，省去线程切换；
+- 超过阈值时交给有界线程池（CPU_OFFLOAD_WORKERS 个线程）执行，事件循环继续处理其他请求；
+- 排队按调用方轮转：默认每个请求（asyncio 任务）一条队列，批量生成使用同一条队列，
+  大批量任务不会让交互请求一直排在后面。
+
+使用线程池而非进程池：待处理的数据（XML 字符串、解析结果）在进程间传递的序列化开销
+与解析本身相当，且线程中执行时 GIL 会定期切换回事件循环线程。
+
+指标：cpu_pool.inline / offloaded 计数，cpu_pool.wait（排队耗时）、cpu_pool.run（执行耗时），
+cpu_pool.queued / active 瞬时值
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Hashable, Optional, Tuple
+
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CpuPool:
+    """有界线程池，按调用方轮转调度"""
+
+    def __init__(self):
+        self.threshold = int(os.getenv("CPU_OFFLOAD_THRESHOLD", "65536"))
+        self.workers = int(os.getenv("CPU_OFFLOAD_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 调用方 -> 待执行的任务 (函数, 参数, future, 入队时间)；OrderedDict 的顺序即轮转顺序
+        self._queues: "OrderedDict[Hashable, Deque[Tuple[Callable, tuple, asyncio.Future, float]]]" = OrderedDict()
+        self._queued = 0
+        self._active = 0
+
+    async def run(self, func: Callable, *args, size: int = 0, key: Hashable = None) -> Any:
+        """
+        执行 CPU 密集的函数
+
+        Args:
+            func: 要执行的函数（需线程安全，不访问事件循环）
+            size: 输入规模（通常为 XML / 响应文本的字符数），小于阈值时直接执行
+            key: 排队使用的调用方标识，默认为当前 asyncio 任务
+
+        Returns:
+            func 的返回值，异常原样抛出
+        """
+        metrics = get_metrics()
+        if size < self.threshold or self.threshold < 0:
+            metrics.incr("cpu_pool.inline")
+            return func(*args)
+
+        metrics.incr("cpu_pool.offloaded")
+        if key is None:
+            key = id(asyncio.current_task())
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append((func, args, future, time.perf_counter()))
+        self._queued += 1
+        self._dispatch()
+        return await future
+
+    def _dispatch(self):
+        """从各调用方的队列中轮流取任务，直到线程池占满"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="cpu-pool")
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics()
+        while self._active < self.workers and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            func, args, future, enqueued = queue.popleft()
+            self._queued -= 1
+            # 该调用方还有任务时移到队尾，让其他调用方先执行
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if future.cancelled():
+                continue
+            metrics.observe("cpu_pool.wait", time.perf_counter() - enqueued)
+            self._active += 1
+            loop.run_in_executor(self._executor, self._timed, func, args).add_done_callback(
+                lambda done, future=future: self._finish(done, future)
+            )
+        metrics.set_gauge("cpu_pool.queued", self._queued)
+        metrics.set_gauge("cpu_pool.active", self._active)
+
+    @staticmethod
+    def _timed(func: Callable, args: tuple) -> Any:
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            get_metrics().observe("cpu_pool.run", time.perf_counter() - start)
+
+    def _finish(self, done: asyncio.Future, future: asyncio.Future):
+        self._active -= 1
+        if done.cancelled():
+            future.cancel()
+        elif not future.cancelled():
+            if done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(done.result())
+        self._dispatch()
+
+    def shutdown(self):
+        """关闭线程池（不等待执行中的任务）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_cpu_pool: Optional[CpuPool] = None
+
+
+def get_cpu_pool() -> CpuPool:
+    """获取 CPU 任务线程池单例"""
+    global _cpu_pool
+    if _cpu_pool is None:
+        _cpu_pool = CpuPool()
+    return _cpu_pool
+
+
+async def run_cpu(func: Callable, *args, size: int = 0, key: Hashable = None) -> Any:
+    """在 CPU 任务线程池中执行 func，见 CpuPool.run"""
+    return await get_cpu_pool().run(func, *args, size=size, key=key)
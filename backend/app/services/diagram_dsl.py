@@ -0,0 +1,473 @@
+"""
+紧凑图表描述（DSL）编译器
+模型只输出节点 / 连线 / 分组的 JSON 描述，由服务端编译为 mxGraph XML：
+- 形状和颜色用调色板中的名称表示，不再输出冗长的 style 字符串
+- 不输出坐标，新图表交给自动布局（app.services.layout）排版
+- 编辑操作同样使用 JSON 描述，不再需要在 new_xml 中转义整段 XML
+
+新图表：
+    {"layout": "flowchart",
+     "nodes": [{"id": "start", "label": "开始", "shape": "start"}, ...],
+     "edges": [{"from": "start", "to": "login", "label": "是"}],
+     "groups": [{"id": "svc", "label": "服务层", "nodes": ["a", "b"]}]}
+
+编辑操作：
+    {"op": "add", "node": {...}}          新增节点
+    {"op": "add", "edge": {...}}          新增连线
+    {"op": "update", "id": "...", ...}    修改节点或连线的 label / shape / color / style
+    {"op": "delete", "id": "..."}         删除节点（连带删除相关连线）或连线
+"""
+import json
+import logging
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from app.services.diagram_index import DiagramIndex, get_index_cache
+from app.services.layout import default_size
+
+logger = logging.getLogger(__name__)
+
+# 形状调色板：名称 -> (基础样式, 缺省颜色)
+SHAPES: Dict[str, Tuple[str, str]] = {
+    "process": ("rounded=0;whiteSpace=wrap;html=1;", "blue"),
+    "rounded": ("rounded=1;whiteSpace=wrap;html=1;", "blue"),
+    "start": ("ellipse;whiteSpace=wrap;html=1;", "green"),
+    "end": ("ellipse;whiteSpace=wrap;html=1;", "red"),
+    "ellipse": ("ellipse;whiteSpace=wrap;html=1;", "blue"),
+    "decision": ("rhombus;whiteSpace=wrap;html=1;", "yellow"),
+    "io": ("shape=parallelogram;perimeter=parallelogramPerimeter;whiteSpace=wrap;html=1;fixedSize=1;", "purple"),
+    "database": ("shape=cylinder3;whiteSpace=wrap;html=1;boundedLbl=1;backgroundOutline=1;size=15;", "gray"),
+    "document": ("shape=document;whiteSpace=wrap;html=1;boundedLbl=1;", "yellow"),
+    "cloud": ("ellipse;shape=cloud;whiteSpace=wrap;html=1;", "gray"),
+    "actor": ("shape=umlActor;verticalLabelPosition=bottom;verticalAlign=top;html=1;", ""),
+    "text": ("text;html=1;align=center;verticalAlign=middle;", ""),
+    "topic": ("ellipse;whiteSpace=wrap;html=1;fontStyle=1;fontSize=14;", "purple"),
+}
+
+GROUP_STYLE = "swimlane;whiteSpace=wrap;html=1;startSize=30;"
+LANE_STYLE = "swimlane;horizontal=0;whiteSpace=wrap;html=1;startSize=30;"
+
+COLORS: Dict[str, str] = {
+    "blue": "fillColor=#dae8fc;strokeColor=#6c8ebf;",
+    "green": "fillColor=#d5e8d4;strokeColor=#82b366;",
+    "yellow": "fillColor=#fff2cc;strokeColor=#d6b656;",
+    "red": "fillColor=#f8cecc;strokeColor=#b85450;",
+    "purple": "fillColor=#e1d5e7;strokeColor=#9673a6;",
+    "gray": "fillColor=#f5f5f5;strokeColor=#666666;",
+    "orange": "fillColor=#ffe6cc;strokeColor=#d79b00;",
+}
+
+EDGE_BASE = "rounded=0;orthogonalLoop=1;jettySize=auto;html=1;"
+EDGE_ROUTES = {
+    "orthogonal": "edgeStyle=orthogonalEdgeStyle;",
+    "straight": "edgeStyle=none;",
+    "curved": "edgeStyle=none;curved=1;",
+}
+
+MODEL_OPEN = (
+    '<mxGraphModel dx="1434" dy="780" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" '
+    'arrows="1" fold="1" page="1" pageScale="1" pageWidth="827" pageHeight="1169" math="0" shadow="0">'
+)
+
+# 新增节点与相邻节点的间距
+_PLACEMENT_GAP = 60
+
+
+class DiagramSpecError(ValueError):
+    """图表描述无效"""
+
+
+def _attr(value: Any) -> str:
+    """转义为 XML 属性值，换行写成 &#xa;"""
+    text = escape(str(value), {'"': "&quot;"})
+    return text.replace("\r\n", "&#xa;").replace("\n", "&#xa;")
+
+
+def node_style(node: Dict[str, Any]) -> str:
+    """按调色板生成节点样式，style 字段作为额外样式追加"""
+    shape = str(node.get("shape") or "process").lower()
+    base, default_color = SHAPES.get(shape, SHAPES["process"])
+    color = str(node.get("color") or default_color).lower()
+    style = base + COLORS.get(color, "")
+    if node.get("bold"):
+        style += "fontStyle=1;"
+    if node.get("style"):
+        style += str(node["style"]).strip().rstrip(";") + ";"
+    return style
+
+
+def edge_style(edge: Dict[str, Any]) -> str:
+    """按调色板生成连线样式"""
+    route = str(edge.get("route") or "orthogonal").lower()
+    style = EDGE_ROUTES.get(route, EDGE_ROUTES["orthogonal"]) + EDGE_BASE
+    style += "endArrow=none;" if edge.get("arrow") is False else "endArrow=classic;"
+    if edge.get("dashed") or str(edge.get("line", "")).lower() == "dashed":
+        style += "dashed=1;"
+    if edge.get("color") in COLORS:
+        style += "strokeColor=" + COLORS[edge["color"]].split("strokeColor=")[1]
+    if edge.get("style"):
+        style += str(edge["style"]).strip().rstrip(";") + ";"
+    return style
+
+
+def _vertex_xml(cell_id: str, label: str, style: str, parent: str, geometry: Dict[str, float]) -> str:
+    attrs = "".join(f'{k}="{int(round(float(v)))}" ' for k, v in geometry.items())
+    return (
+        f'<mxCell id="{_attr(cell_id)}" value="{_attr(label)}" style="{style}" vertex="1" '
+        f'parent="{_attr(parent)}"><mxGeometry {attrs}as="geometry"/></mxCell>'
+    )
+
+
+def _edge_xml(cell_id: str, edge: Dict[str, Any], parent: str = "1") -> str:
+    value = f' value="{_attr(edge["label"])}"' if edge.get("label") else ""
+    return (
+        f'<mxCell id="{_attr(cell_id)}"{value} style="{edge_style(edge)}" edge="1" parent="{_attr(parent)}" '
+        f'source="{_attr(edge["from"])}" target="{_attr(edge["to"])}"><mxGeometry relative="1" as="geometry"/></mxCell>'
+    )
+
+
+def _node_size(node: Dict[str, Any], style: str) -> Dict[str, float]:
+    width, height = default_size(style, str(node.get("label", "")))
+    return {"width": node.get("width") or width, "height": node.get("height") or height}
+
+
+def _edge_id(edge: Dict[str, Any], used: set) -> str:
+    base = str(edge.get("id") or f"e_{edge['from']}_{edge['to']}")
+    cell_id, n = base, 1
+    while cell_id in used:
+        n += 1
+        cell_id = f"{base}_{n}"
+    used.add(cell_id)
+    return cell_id
+
+
+def _check_node(node: Any) -> Dict[str, Any]:
+    if not isinstance(node, dict) or not node.get("id"):
+        raise DiagramSpecError(f"节点缺少 id: {node!r}")
+    return node
+
+
+def _check_edge(edge: Any) -> Dict[str, Any]:
+    if not isinstance(edge, dict):
+        raise DiagramSpecError(f"连线格式无效: {edge!r}")
+    # 兼容 source/target 写法
+    edge.setdefault("from", edge.get("source"))
+    edge.setdefault("to", edge.get("target"))
+    if not edge.get("from") or not edge.get("to"):
+        raise DiagramSpecError(f"连线缺少 from/to: {edge!r}")
+    return edge
+
+
+def compile_diagram(spec: Dict[str, Any]) -> str:
+    """
+    把新图表描述编译为 mxGraphModel XML
+
+    节点只带尺寸不带坐标，由自动布局补全。引用了不存在节点的连线会被丢弃。
+
+    Raises:
+        DiagramSpecError: 描述中没有任何节点或格式无效
+    """
+    if not isinstance(spec, dict):
+        raise DiagramSpecError("diagram 必须是对象")
+    nodes = [_check_node(n) for n in spec.get("nodes") or []]
+    if not nodes:
+        raise DiagramSpecError("diagram 中没有节点")
+
+    groups = [_check_node(g) for g in spec.get("groups") or []]
+    parent_of: Dict[str, str] = {}
+    for group in groups:
+        for member in group.get("nodes") or []:
+            parent_of[str(member)] = str(group["id"])
+        if group.get("parent"):
+            parent_of[str(group["id"])] = str(group["parent"])
+    for node in nodes:
+        if node.get("group"):
+            parent_of[str(node["id"])] = str(node["group"])
+
+    known = {str(n["id"]) for n in nodes} | {str(g["id"]) for g in groups}
+    used = set(known) | {"0", "1"}
+
+    def depth(gid: str) -> int:
+        seen = set()
+        while gid in parent_of and gid not in seen:
+            seen.add(gid)
+            gid = parent_of[gid]
+        return len(seen)
+
+    cells = []
+    # 外层分组先于内层输出，保证父单元格在前
+    for group in sorted(groups, key=lambda g: depth(str(g["id"]))):
+        gid = str(group["id"])
+        style = LANE_STYLE if str(group.get("shape", "")).lower() == "lane" else GROUP_STYLE
+        color = str(group.get("color") or "gray").lower()
+        parent = parent_of.get(gid) if parent_of.get(gid) in known else "1"
+        cells.append(_vertex_xml(gid, group.get("label", ""), style + COLORS.get(color, ""), parent, {}))
+    for node in nodes:
+        nid = str(node["id"])
+        style = node_style(node)
+        parent = parent_of.get(nid) if parent_of.get(nid) in known else "1"
+        cells.append(_vertex_xml(nid, node.get("label", ""), style, parent, _node_size(node, style)))
+
+    for edge in spec.get("edges") or []:
+        edge = _check_edge(edge)
+        if str(edge["from"]) not in known or str(edge["to"]) not in known:
+            logger.warning(f"[dsl] 忽略引用了未知节点的连线: {edge['from']} -> {edge['to']}")
+            continue
+        cells.append(_edge_xml(_edge_id(edge, used), edge))
+
+    return MODEL_OPEN + '<root><mxCell id="0"/><mxCell id="1" parent="0"/>' + "".join(cells) + "</root></mxGraphModel>"
+
+
+def is_dsl_operation(operation: Any) -> bool:
+    """是否为 DSL 形式的编辑操作（含 op 字段，而不是 type + new_xml）"""
+    return isinstance(operation, dict) and "op" in operation
+
+
+def _current_index(xml: Optional[str]) -> DiagramIndex:
+    """当前图表的单元格索引（与本轮的上下文选择共用缓存），无法解析时返回空索引"""
+    if not xml:
+        return DiagramIndex()
+    try:
+        return get_index_cache().get(xml)
+    except ET.ParseError:
+        logger.warning("[dsl] 当前图表 XML 无法解析，新增节点将使用缺省位置")
+        return DiagramIndex()
+
+
+def _inner(cell: ET.Element) -> Optional[ET.Element]:
+    """UserObject / object 包裹的单元格，几何与关系属性在内层 mxCell 上"""
+    return cell if cell.tag == "mxCell" else cell.find("mxCell")
+
+
+def _box(current: DiagramIndex, cell_id: str) -> Optional[Tuple[float, float, float, float]]:
+    cell = current.cells.get(cell_id)
+    inner = _inner(cell) if cell is not None else None
+    geo = inner.find("mxGeometry") if inner is not None else None
+    if geo is None or inner.get("vertex") != "1":
+        return None
+    try:
+        return tuple(float(geo.get(k) or 0) for k in ("x", "y", "width", "height"))
+    except ValueError:
+        return None
+
+
+def _boxes(current: DiagramIndex, parent: str) -> List[Tuple[float, float, float, float]]:
+    return [box for box in (_box(current, cid) for cid in current.children.get(parent, [])) if box]
+
+
+def _free_position(
+    occupied: List[Tuple[float, float, float, float]],
+    width: float,
+    height: float,
+    anchor: Optional[Tuple[float, float, float, float]]
+) -> Tuple[float, float]:
+    """
+    为新节点找一个不重叠的位置
+
+    有锚点（相连的已有节点）时放在锚点下方，被占用则向右平移；
+    否则放在现有内容的下方
+    """
+    def free(x, y):
+        return not any(x < ox + ow and ox < x + width and y < oy + oh and oy < y + height
+                       for ox, oy, ow, oh in occupied)
+
+    if anchor:
+        ax, ay, aw, ah = anchor
+        x, y = ax + (aw - width) / 2, ay + ah + _PLACEMENT_GAP
+        for _ in range(50):
+            if free(x, y):
+                return x, y
+            x += width + _PLACEMENT_GAP / 2
+        return x, y
+    bottom = max((oy + oh for _, oy, _, oh in occupied), default=0)
+    left = min((ox for ox, _, _, _ in occupied), default=40)
+    return left, bottom + _PLACEMENT_GAP if occupied else 40
+
+
+def compile_operations(
+    operations: List[Dict[str, Any]],
+    current_xml: Optional[str] = None,
+    errors: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    把 DSL 编辑操作编译为 MCP edit_diagram 的操作
+
+    已是 type + new_xml 形式的操作原样保留。新增节点的位置参考本批次中与之相连的已有节点；
+    修改操作保留原有几何信息，只替换指定的属性。
+
+    Args:
+        errors: 提供时收集被忽略的无效操作的说明（用于编辑预检，见 app.services.edit_validation）
+
+    Returns:
+        [{"type": "add" | "update" | "delete", "cell_id": ..., "new_xml": ...}]
+    """
+    current = _current_index(current_xml)
+    used = set(current.cells)
+    errors = errors if errors is not None else []
+    compiled: List[Dict[str, Any]] = []
+
+    # 本批次新增的连线，用于给新增节点找锚点
+    links: Dict[str, List[str]] = {}
+    for operation in operations:
+        edge = operation.get("edge") if is_dsl_operation(operation) else None
+        if isinstance(edge, dict):
+            src, dst = edge.get("from") or edge.get("source"), edge.get("to") or edge.get("target")
+            links.setdefault(str(dst), []).append(str(src))
+            links.setdefault(str(src), []).append(str(dst))
+
+    placed: Dict[str, Tuple[float, float, float, float]] = {}
+    deleted = set()
+    for operation in operations:
+        if not is_dsl_operation(operation):
+            compiled.append(operation)
+            continue
+        op = str(operation.get("op")).lower()
+        try:
+            if op == "add" and isinstance(operation.get("node"), dict):
+                node = _check_node(operation["node"])
+                nid = str(node["id"])
+                style = node_style(node)
+                size = _node_size(node, style)
+                parent = str(node.get("group") or "1")
+                anchor = next(
+                    (placed.get(n) or _box(current, n) for n in links.get(nid, []) if placed.get(n) or _box(current, n)),
+                    None
+                )
+                occupied = _boxes(current, parent) + [b for b in placed.values()]
+                x, y = _free_position(occupied, size["width"], size["height"], anchor)
+                placed[nid] = (x, y, size["width"], size["height"])
+                used.add(nid)
+                compiled.append({
+                    "type": "add", "cell_id": nid,
+                    "new_xml": _vertex_xml(nid, node.get("label", ""), style, parent, {"x": x, "y": y, **size}),
+                })
+            elif op == "add" and isinstance(operation.get("edge"), dict):
+                edge = _check_edge(operation["edge"])
+                cell_id = _edge_id(edge, used)
+                compiled.append({"type": "add", "cell_id": cell_id, "new_xml": _edge_xml(cell_id, edge)})
+            elif op == "update":
+                update = _compile_update(operation, current)
+                if update:
+                    compiled.append(update)
+                else:
+                    errors.append(f"update {operation.get('id')}：要修改的单元格不存在")
+            elif op == "delete" and operation.get("id"):
+                cell_id = str(operation["id"])
+                # 删除节点时连带删除与之相连的连线
+                for edge_id in current.edges_of.get(cell_id, []) + [cell_id]:
+                    if edge_id not in deleted:
+                        deleted.add(edge_id)
+                        compiled.append({"type": "delete", "cell_id": edge_id})
+            else:
+                logger.warning(f"[dsl] 忽略无法识别的编辑操作: {operation!r}")
+                errors.append(f"无法识别的编辑操作: {json.dumps(operation, ensure_ascii=False)}")
+        except DiagramSpecError as e:
+            logger.warning(f"[dsl] 忽略无效的编辑操作: {e}")
+            errors.append(f"无效的编辑操作: {e}")
+    return compiled
+
+
+# 换形状时去掉的旧形状相关样式项（颜色、字体等其余样式保留）
+_SHAPE_KEYS = {
+    "ellipse", "rhombus", "text", "shape", "perimeter", "rounded", "boundedLbl", "backgroundOutline",
+    "size", "fixedSize", "verticalLabelPosition", "verticalAlign", "align",
+}
+
+
+def _parse_style(style: Optional[str]) -> Dict[str, Optional[str]]:
+    """把 mxGraph 样式字符串解析为有序的 键 -> 值（「ellipse」这类无值的项值为 None）"""
+    items: Dict[str, Optional[str]] = {}
+    for part in (style or "").split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        key, sep, value = part.partition("=")
+        items[key] = value if sep else None
+    return items
+
+
+def _format_style(items: Dict[str, Optional[str]]) -> str:
+    return "".join(f"{key};" if value is None else f"{key}={value};" for key, value in items.items())
+
+
+def _merge_extra(items: Dict[str, Optional[str]], operation: Dict[str, Any]):
+    if operation.get("style"):
+        items.update(_parse_style(str(operation["style"])))
+
+
+def _set_color(items: Dict[str, Optional[str]], color: Any, stroke_only: bool = False):
+    color = str(color).lower()
+    if color not in COLORS:
+        return
+    colors = _parse_style(COLORS[color])
+    if stroke_only:
+        items["strokeColor"] = colors["strokeColor"]
+    else:
+        items.pop("fillColor", None)
+        items.pop("strokeColor", None)
+        items.update(colors)
+
+
+def _update_edge_style(style: Optional[str], operation: Dict[str, Any]) -> str:
+    """只覆盖操作中给出的连线样式项，其余保持原样"""
+    items = _parse_style(style)
+    if "route" in operation:
+        route = str(operation.get("route") or "orthogonal").lower()
+        items.pop("curved", None)
+        items.update(_parse_style(EDGE_ROUTES.get(route, EDGE_ROUTES["orthogonal"])))
+    if "arrow" in operation:
+        items["endArrow"] = "none" if operation["arrow"] is False else "classic"
+    if "dashed" in operation or "line" in operation:
+        if operation.get("dashed") or str(operation.get("line", "")).lower() == "dashed":
+            items["dashed"] = "1"
+        else:
+            items.pop("dashed", None)
+    if "color" in operation:
+        _set_color(items, operation["color"], stroke_only=True)
+    _merge_extra(items, operation)
+    return _format_style(items)
+
+
+def _update_node_style(style: Optional[str], operation: Dict[str, Any]) -> str:
+    """只覆盖操作中给出的节点样式项；只有给出 color 时才替换颜色"""
+    items = _parse_style(style)
+    if "shape" in operation:
+        shape = str(operation.get("shape") or "process").lower()
+        base, default_color = SHAPES.get(shape, SHAPES["process"])
+        had_color = "fillColor" in items
+        items = {**_parse_style(base), **{k: v for k, v in items.items() if k not in _SHAPE_KEYS}}
+        if not had_color and "color" not in operation and default_color:
+            _set_color(items, default_color)
+    if "color" in operation:
+        _set_color(items, operation["color"])
+    if "bold" in operation:
+        # fontStyle 是位掩码，1 为粗体，不影响斜体、下划线
+        font_style = int(items.get("fontStyle") or 0)
+        font_style = font_style | 1 if operation["bold"] else font_style & ~1
+        if font_style:
+            items["fontStyle"] = str(font_style)
+        else:
+            items.pop("fontStyle", None)
+    _merge_extra(items, operation)
+    return _format_style(items)
+
+
+def _compile_update(operation: Dict[str, Any], current: DiagramIndex) -> Optional[Dict[str, Any]]:
+    """在原有单元格的基础上修改 label 和样式，样式只覆盖操作中给出的项"""
+    cell_id = str(operation.get("id") or "")
+    outer = current.cells.get(cell_id)
+    if outer is None or _inner(outer) is None:
+        logger.warning(f"[dsl] 要修改的单元格不存在: {cell_id}")
+        return None
+    outer = ET.fromstring(ET.tostring(outer))
+    cell = _inner(outer)
+    if "label" in operation:
+        outer.set("value" if outer is cell else "label", str(operation["label"]))
+    if cell.get("edge") == "1":
+        if any(k in operation for k in ("dashed", "arrow", "route", "color", "style", "line")):
+            cell.set("style", _update_edge_style(cell.get("style"), operation))
+    elif any(k in operation for k in ("shape", "color", "style", "bold")):
+        cell.set("style", _update_node_style(cell.get("style"), operation))
+    return {"type": "update", "cell_id": cell_id, "new_xml": ET.tostring(outer, encoding="unicode")}
@@ -0,0 +1,303 @@
+"""
+图表单元格索引
+解析一次图表 XML，建立按 id、标签、父容器、连线邻接关系的查找表，
+供编辑上下文选择、编辑操作编译等需要按关系查找单元格的场景使用，避免反复遍历整棵 XML 树。
+
+索引按会话缓存（DiagramIndexCache），图表 XML 即修订版本：
+- XML 不变时直接复用，一轮对话中的上下文选择、编辑编译共用同一份索引；
+- 无头后端应用编辑操作后，索引按操作增量更新（只解析新增 / 修改的单元格），并对应到编辑后的 XML；
+- MCP 后端的图表可能被用户在浏览器中修改，写入后丢弃索引，下次读取时按新的 XML 重建。
+
+指标：diagram_index.hits / builds / incremental 计数，diagram_index.build（建立耗时）
+"""
+import html
+import logging
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+_TAG = re.compile(r"<[^>]+>")
+_SPACE = re.compile(r"\s+")
+
+# 根单元格（id 0 / 1）不属于图表内容
+ROOT_IDS = ("0", "1")
+
+
+def plain_label(value: Optional[str]) -> str:
+    """把单元格的 value（html=1 时含 HTML 标签和实体）转为纯文本"""
+    if not value:
+        return ""
+    text = html.unescape(_TAG.sub(" ", value))
+    return _SPACE.sub(" ", text).strip()
+
+
+class DiagramIndex:
+    """
+    单张图表的单元格索引
+
+    - cells: id -> 单元格元素（UserObject / object 包裹的单元格保存外层元素），按文档顺序
+    - labels: id -> 纯文本标签；by_label: 标签 -> id 列表
+    - parent / children: 父容器关系
+    - edges_of: 节点 id -> 相连的连线 id；endpoints: 连线 id -> (source, target)
+    """
+
+    def __init__(self):
+        self.cells: Dict[str, ET.Element] = {}
+        self.labels: Dict[str, str] = {}
+        self.by_label: Dict[str, List[str]] = {}
+        self.parent: Dict[str, Optional[str]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.edges_of: Dict[str, List[str]] = {}
+        self.endpoints: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self.vertices: Set[str] = set()
+
+    @classmethod
+    def from_xml(cls, xml: str) -> "DiagramIndex":
+        """
+        解析图表 XML 建立索引
+
+        Raises:
+            ET.ParseError: XML 无法解析
+        """
+        index = cls()
+        root = ET.fromstring(xml)
+        model = root if root.tag == "mxGraphModel" else root.find(".//mxGraphModel")
+        cell_root = model.find("root") if model is not None else None
+        for element in (cell_root if cell_root is not None else []):
+            index._add(element)
+        return index
+
+    def _add(self, element: ET.Element):
+        cell_id = element.get("id")
+        if not cell_id:
+            return
+        # UserObject / object 的标签在外层 label 属性上，关系属性在内层 mxCell 上
+        inner = element if element.tag == "mxCell" else element.find("mxCell")
+        attrs = inner.attrib if inner is not None else {}
+        label = plain_label(element.get("value") if element.tag == "mxCell" else element.get("label"))
+        element.tail = None
+        self.cells[cell_id] = element
+        self.labels[cell_id] = label
+        if label:
+            self.by_label.setdefault(label, []).append(cell_id)
+        parent = attrs.get("parent")
+        self.parent[cell_id] = parent
+        if parent:
+            self.children.setdefault(parent, []).append(cell_id)
+        if attrs.get("edge") == "1":
+            source, target = attrs.get("source"), attrs.get("target")
+            self.endpoints[cell_id] = (source, target)
+            for end in {source, target} - {None}:
+                self.edges_of.setdefault(end, []).append(cell_id)
+        elif attrs.get("vertex") == "1":
+            self.vertices.add(cell_id)
+
+    def copy(self) -> "DiagramIndex":
+        """浅拷贝关系表（单元格元素不会被修改，可以共享），修改副本不影响正在使用原索引的调用方"""
+        index = DiagramIndex()
+        index.cells = dict(self.cells)
+        index.labels = dict(self.labels)
+        index.by_label = {label: list(ids) for label, ids in self.by_label.items()}
+        index.parent = dict(self.parent)
+        index.children = {cid: list(ids) for cid, ids in self.children.items()}
+        index.edges_of = {cid: list(ids) for cid, ids in self.edges_of.items()}
+        index.endpoints = dict(self.endpoints)
+        index.vertices = set(self.vertices)
+        return index
+
+    def _unlink(self, cell_id: str):
+        """从关系表中移除单元格（保留 cells 中的位置，供修改操作原位替换）"""
+        label = self.labels.pop(cell_id, "")
+        if label in self.by_label:
+            self.by_label[label].remove(cell_id)
+            if not self.by_label[label]:
+                del self.by_label[label]
+        parent = self.parent.pop(cell_id, None)
+        if parent in self.children:
+            self.children[parent].remove(cell_id)
+            if not self.children[parent]:
+                del self.children[parent]
+        ends = self.endpoints.pop(cell_id, None)
+        for end in set(ends or ()) - {None}:
+            edges = self.edges_of.get(end)
+            if edges and cell_id in edges:
+                edges.remove(cell_id)
+                if not edges:
+                    del self.edges_of[end]
+        self.vertices.discard(cell_id)
+
+    def apply(self, operations: List[Dict[str, Any]]):
+        """
+        按 MCP edit_diagram 形式的操作（type / cell_id / new_xml）增量更新索引
+
+        删除单元格时连带删除其子单元格和相连的连线，与图表后端的删除语义一致。
+
+        Raises:
+            ValueError: 操作无法应用（调用方应丢弃索引并重建）
+        """
+        for op in operations:
+            op_type, cell_id = op.get("type"), op.get("cell_id")
+            if op_type in ("add", "update"):
+                if (op_type == "add") == (cell_id in self.cells):
+                    raise ValueError(f"无法{op_type}单元格 {cell_id}")
+                try:
+                    element = ET.fromstring((op.get("new_xml") or "").strip())
+                except ET.ParseError as e:
+                    raise ValueError(f"单元格 {cell_id} 的 XML 无效: {e}")
+                element.set("id", cell_id)
+                if op_type == "update":
+                    self._unlink(cell_id)
+                self._add(element)
+            elif op_type == "delete" and cell_id in self.cells:
+                for removed in self.cascade(cell_id):
+                    self._unlink(removed)
+                    self.edges_of.pop(removed, None)
+                    del self.cells[removed]
+            else:
+                raise ValueError(f"无法应用操作: {op_type} {cell_id}")
+
+    def cascade(self, cell_id: str) -> List[str]:
+        """删除 cell_id 时需要一并删除的单元格：子孙单元格以及与它们相连的连线"""
+        removed = {cell_id: None}
+        pending = [cell_id]
+        while pending:
+            current = pending.pop()
+            for other in self.children.get(current, []) + self.edges_of.get(current, []):
+                if other not in removed:
+                    removed[other] = None
+                    pending.append(other)
+        return list(removed)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def is_edge(self, cell_id: str) -> bool:
+        return cell_id in self.endpoints
+
+    def is_container(self, cell_id: str) -> bool:
+        return bool(self.children.get(cell_id))
+
+    def ancestors(self, cell_id: str) -> List[str]:
+        """从直接父容器到最外层的容器 id（不含根单元格）"""
+        result = []
+        parent = self.parent.get(cell_id)
+        while parent and parent not in ROOT_IDS and parent not in result:
+            result.append(parent)
+            parent = self.parent.get(parent)
+        return result
+
+    def neighbours(self, cell_id: str) -> List[str]:
+        """通过连线相连的节点 id"""
+        result = []
+        for edge_id in self.edges_of.get(cell_id, []):
+            for end in self.endpoints[edge_id]:
+                if end and end != cell_id and end not in result:
+                    result.append(end)
+        return result
+
+    def xml_of(self, cell_id: str) -> str:
+        """单个单元格序列化后的 XML"""
+        return ET.tostring(self.cells[cell_id], encoding="unicode")
+
+
+class _CachedIndex:
+    __slots__ = ("xml", "index")
+
+    def __init__(self, xml: str, index: DiagramIndex):
+        self.xml = xml
+        self.index = index
+
+
+class DiagramIndexCache:
+    """按会话缓存图表索引，以图表 XML 作为修订版本"""
+
+    def __init__(self, max_sessions: int = None):
+        self.max_sessions = max_sessions or int(os.getenv("DIAGRAM_INDEX_CACHE_SIZE", "256"))
+        self._entries: "OrderedDict[Optional[str], _CachedIndex]" = OrderedDict()
+        # 编辑编译在线程池中执行时也会读取缓存
+        self._lock = threading.Lock()
+
+    def get(self, xml: str, session_id: Optional[str] = None) -> DiagramIndex:
+        """
+        获取 xml 对应的索引，缓存中没有时解析并缓存
+
+        不指定会话时在所有会话的缓存中查找同一份 XML（一轮对话中传递的是同一个字符串对象，比较开销很小）。
+
+        Raises:
+            ET.ParseError: XML 无法解析
+        """
+        metrics = get_metrics()
+        with self._lock:
+            entry = self._find(xml, session_id)
+            if entry is not None:
+                metrics.incr("diagram_index.hits")
+                return entry.index
+        start = time.perf_counter()
+        index = DiagramIndex.from_xml(xml)
+        metrics.observe("diagram_index.build", time.perf_counter() - start)
+        metrics.incr("diagram_index.builds")
+        with self._lock:
+            self._entries[session_id] = _CachedIndex(xml, index)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+        return index
+
+    def _find(self, xml: str, session_id: Optional[str]) -> Optional[_CachedIndex]:
+        if session_id is not None:
+            entry = self._entries.get(session_id)
+            return entry if entry is not None and (entry.xml is xml or entry.xml == xml) else None
+        for entry in self._entries.values():
+            if entry.xml is xml:
+                return entry
+        for entry in self._entries.values():
+            if entry.xml == xml:
+                return entry
+        return None
+
+    def apply(self, session_id: str, operations: List[Dict[str, Any]], before: str, after: str):
+        """
+        编辑操作已在图表后端生效：把缓存的索引从 before 版本增量更新为 after 版本
+
+        缓存的不是 before 版本或操作无法应用时丢弃索引，下次读取时重建。
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            if entry.xml is not before and entry.xml != before:
+                del self._entries[session_id]
+                return
+            index = entry.index.copy()
+            try:
+                index.apply(operations)
+            except ValueError as e:
+                logger.warning(f"[index] 会话 {session_id} 的索引增量更新失败，下次读取时重建: {e}")
+                del self._entries[session_id]
+                return
+            entry.xml, entry.index = after, index
+        get_metrics().incr("diagram_index.incremental")
+
+    def invalidate(self, session_id: str):
+        """图表被整体替换或可能被外部修改时丢弃索引"""
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+
+_index_cache: Optional[DiagramIndexCache] = None
+
+
+def get_index_cache() -> DiagramIndexCache:
+    """获取图表索引缓存单例"""
+    global _index_cache
+    if _index_cache is None:
+        _index_cache = DiagramIndexCache()
+    return _index_cache
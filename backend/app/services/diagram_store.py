@@ -0,0 +1,253 @@
+"""
+无头图表存储
+面向纯 API 场景（批量生成、CI 文档构建）的会话后端：display / edit / get / export
+直接在进程内的图表存储上执行，不启动 MCP Server 子进程，也不打开浏览器预览。
+
+接口与 DrawioMCPClient 保持一致，路由层按会话模式选择后端即可，对外契约不变。
+"""
+import logging
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import quoteattr
+
+from app.services.cpu_pool import run_cpu
+from app.services.diagram_index import get_index_cache
+from app.services.mcp_client import validate_and_fix_xml, wrap_as_drawio_file
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+MODEL_ATTRS = (
+    'dx="1434" dy="780" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" '
+    'fold="1" page="1" pageScale="1" pageWidth="827" pageHeight="1169" math="0" shadow="0"'
+)
+
+
+class EditError(ValueError):
+    """编辑操作无法应用"""
+
+
+class _StoredCell(NamedTuple):
+    """存储的单元格：序列化后的 XML 以及用于级联删除的关系"""
+    xml: str
+    parent: Optional[str]
+    source: Optional[str]
+    target: Optional[str]
+
+
+def _store_cell(element: ET.Element) -> _StoredCell:
+    # UserObject / object 包裹的单元格，关系属性在内层 mxCell 上
+    inner = element if element.tag == "mxCell" else element.find("mxCell")
+    attrs = inner.attrib if inner is not None else {}
+    return _StoredCell(
+        xml=ET.tostring(element, encoding="unicode"),
+        parent=attrs.get("parent"),
+        source=attrs.get("source"),
+        target=attrs.get("target"),
+    )
+
+
+def _parse_cell(cell_id: str, new_xml: Optional[str]) -> _StoredCell:
+    if not new_xml:
+        raise EditError(f"单元格 {cell_id} 缺少 new_xml")
+    try:
+        element = ET.fromstring(new_xml.strip())
+    except ET.ParseError as e:
+        raise EditError(f"单元格 {cell_id} 的 XML 无效: {e}")
+    if element.get("id", cell_id) != cell_id:
+        raise EditError(f"new_xml 的 id 与 cell_id {cell_id} 不一致")
+    element.set("id", cell_id)
+    return _store_cell(element)
+
+
+class _Diagram:
+    """单个会话的图表：按文档顺序保存单元格，序列化结果缓存到下一次修改"""
+
+    def __init__(self, model_attrs: str = MODEL_ATTRS, cells: Optional[Dict[str, _StoredCell]] = None):
+        self.model_attrs = model_attrs
+        self.cells: Dict[str, _StoredCell] = cells or {}
+        self._xml: Optional[str] = None
+
+    @classmethod
+    def empty(cls) -> "_Diagram":
+        """只包含两个根单元格的空白图表"""
+        return cls(cells={
+            "0": _StoredCell('<mxCell id="0" />', None, None, None),
+            "1": _StoredCell('<mxCell id="1" parent="0" />', "0", None, None),
+        })
+
+    @classmethod
+    def from_xml(cls, xml: str) -> "_Diagram":
+        root = ET.fromstring(xml)
+        model = root if root.tag == "mxGraphModel" else root.find(".//mxGraphModel")
+        if model is None:
+            raise ValueError("缺少 mxGraphModel 元素")
+        cell_root = model.find("root")
+        cells = {}
+        for element in (cell_root if cell_root is not None else []):
+            cell_id = element.get("id")
+            if cell_id:
+                cells[cell_id] = _store_cell(element)
+        attrs = " ".join(f"{k}={quoteattr(v)}" for k, v in model.attrib.items())
+        return cls(attrs, cells)
+
+    def to_xml(self) -> str:
+        if self._xml is None:
+            body = "".join(cell.xml for cell in self.cells.values())
+            head = f"<mxGraphModel {self.model_attrs}>" if self.model_attrs else "<mxGraphModel>"
+            self._xml = f"{head}<root>{body}</root></mxGraphModel>"
+        return self._xml
+
+    def apply(self, operations: List[Dict[str, Any]]):
+        """
+        应用编辑操作，全部成功才生效
+
+        删除单元格时一并删除其子单元格和相连的连线，与 DSL 的删除语义一致。
+
+        Raises:
+            EditError: 任一操作无法应用
+        """
+        cells = dict(self.cells)
+        for op in operations:
+            op_type, cell_id = op.get("type"), op.get("cell_id")
+            if not cell_id:
+                raise EditError("操作缺少 cell_id")
+            if op_type == "add":
+                if cell_id in cells:
+                    raise EditError(f"单元格 {cell_id} 已存在")
+                cells[cell_id] = _parse_cell(cell_id, op.get("new_xml"))
+            elif op_type == "update":
+                if cell_id not in cells:
+                    raise EditError(f"单元格 {cell_id} 不存在")
+                cells[cell_id] = _parse_cell(cell_id, op.get("new_xml"))
+            elif op_type == "delete":
+                if cell_id not in cells:
+                    raise EditError(f"单元格 {cell_id} 不存在")
+                self._cascade_delete(cells, cell_id)
+            else:
+                raise EditError(f"未知的操作类型: {op_type}")
+        self.cells = cells
+        self._xml = None
+
+    @staticmethod
+    def _cascade_delete(cells: Dict[str, _StoredCell], cell_id: str):
+        removed = {cell_id}
+        changed = True
+        while changed:
+            changed = False
+            for cid, cell in cells.items():
+                if cid not in removed and (
+                    cell.parent in removed or cell.source in removed or cell.target in removed
+                ):
+                    removed.add(cid)
+                    changed = True
+        for cid in removed:
+            del cells[cid]
+
+
+def _load_diagram(xml: str) -> Tuple[Optional[_Diagram], str]:
+    """
+    校验、修复并解析整张图表
+
+    Returns:
+        (图表, 错误信息)，失败时图表为 None
+    """
+    is_valid, fixed_xml, error_msg = validate_and_fix_xml(xml)
+    if not is_valid:
+        return None, f"XML 验证失败: {error_msg}"
+    try:
+        return _Diagram.from_xml(fixed_xml), ""
+    except (ET.ParseError, ValueError) as e:
+        return None, f"图表解析失败: {e}"
+
+
+class HeadlessDiagramClient:
+    """
+    进程内图表后端
+
+    与 DrawioMCPClient 提供相同的 start_session / display_diagram / edit_diagram /
+    get_diagram / export_diagram 接口；每个会话持有独立的图表，互不影响。
+    除 display_diagram 解析大图表时交给线程池外，各操作内部没有 await，
+    在事件循环中天然串行，无需加锁；display_diagram 整体替换图表，只在解析完成后写入。
+    """
+
+    def __init__(self):
+        self.diagrams: Dict[str, _Diagram] = {}
+
+    async def start_session(self, session_id: str) -> Dict[str, Any]:
+        """创建空白图表，无预览地址"""
+        self.diagrams[session_id] = _Diagram.empty()
+        get_metrics().set_gauge("headless.sessions", len(self.diagrams))
+        return {"preview_url": None, "session_id": session_id, "message": "无头会话已创建"}
+
+    async def end_session(self, session_id: str):
+        """释放会话的图表"""
+        self.diagrams.pop(session_id, None)
+        get_index_cache().invalidate(session_id)
+        get_metrics().set_gauge("headless.sessions", len(self.diagrams))
+
+    async def display_diagram(self, session_id: str, xml: str) -> bool:
+        """替换整个图表，XML 无法修复时返回 False"""
+        started = session_id in self.diagrams
+        # 大图表的校验与解析在线程池中执行
+        diagram, error_msg = await run_cpu(_load_diagram, xml, size=len(xml))
+        if diagram is None:
+            logger.error(f"[headless] 会话 {session_id} {error_msg}")
+            return False
+        if started and session_id not in self.diagrams:
+            # 解析期间会话已结束
+            return False
+        self.diagrams[session_id] = diagram
+        get_index_cache().invalidate(session_id)
+        get_metrics().incr("headless.display")
+        return True
+
+    async def edit_diagram(self, session_id: str, operations: List[Dict[str, Any]]) -> bool:
+        """
+        编辑图表（添加/更新/删除元素）
+
+        操作列表整体生效：任一操作失败时图表保持不变并返回 False
+        """
+        diagram = self.diagrams.get(session_id)
+        if diagram is None:
+            logger.error(f"[headless] 会话 {session_id} 没有图表")
+            return False
+        before = diagram.to_xml()
+        try:
+            diagram.apply(operations)
+        except EditError as e:
+            logger.error(f"[headless] 会话 {session_id} 编辑失败: {e}")
+            get_metrics().incr("headless.edit_failed")
+            return False
+        # 编辑后的 XML 已知，缓存的索引按操作增量更新，无需重新解析整张图表
+        get_index_cache().apply(session_id, operations, before, diagram.to_xml())
+        get_metrics().incr("headless.edit")
+        return True
+
+    async def get_diagram(self, session_id: str) -> Optional[str]:
+        """获取当前图表 XML，会话不存在时返回 None"""
+        diagram = self.diagrams.get(session_id)
+        return diagram.to_xml() if diagram is not None else None
+
+    async def export_diagram(self, session_id: str, file_path: Optional[str] = None) -> bytes:
+        """导出为 .drawio 文件内容，指定 file_path 时同时写入文件"""
+        xml = await self.get_diagram(session_id)
+        if xml is None:
+            xml = _Diagram.empty().to_xml()
+        content = wrap_as_drawio_file(xml).encode("utf-8")
+        if file_path:
+            with open(file_path, "wb") as f:
+                f.write(content)
+        return content
+
+
+# 创建全局单例
+_headless_client: Optional[HeadlessDiagramClient] = None
+
+
+def get_headless_client() -> HeadlessDiagramClient:
+    """获取无头图表后端单例"""
+    global _headless_client
+    if _headless_client is None:
+        _headless_client = HeadlessDiagramClient()
+    return _headless_client
@@ -0,0 +1,165 @@
+"""
+手动编辑合并队列
+拖拽、微调类客户端会短时间内连续发送大量细小的编辑，每次都是一次完整的 MCP 往返。
+同一会话在 EDIT_BATCH_WINDOW_MS 毫秒内收到的编辑合并为一批，只调用一次 edit_diagram：
+
+- 同一单元格的连续 update 只保留最后一次；
+- add 之后的 update 并入 add；
+- update 之后的 delete 只保留 delete；
+- add 之后的 delete 相互抵消（期间的操作引用了该单元格时保留，交由后端级联删除）。
+
+每个调用方都收到整批的执行结果。同一会话的批次依次执行，不会交错。
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def merge_operations(operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    合并编辑操作，结果与依次执行原操作相同（依次执行本就会失败的操作序列除外）
+
+    Args:
+        operations: 按到达顺序排列的操作（type / cell_id / new_xml）
+
+    Returns:
+        合并后的操作列表
+    """
+    merged: List[Optional[Dict[str, Any]]] = []
+    # 单元格 ID -> 该单元格最近一次操作在 merged 中的位置
+    last: Dict[str, int] = {}
+
+    for op in operations:
+        cell_id = op.get("cell_id")
+        index = last.get(cell_id)
+        prev = merged[index] if index is not None else None
+
+        if prev is not None and op.get("type") == "update" and prev["type"] in ("add", "update"):
+            if prev["type"] == "add":
+                # 保持 add 的位置，之后的操作可能引用了该单元格
+                merged[index] = {**prev, "new_xml": op.get("new_xml")}
+                continue
+            merged[index] = None
+        elif prev is not None and op.get("type") == "delete" and prev["type"] == "update":
+            merged[index] = None
+        elif prev is not None and op.get("type") == "delete" and prev["type"] == "add":
+            marker = f'"{cell_id}"'
+            referenced = any(
+                later is not None and marker in (later.get("new_xml") or "")
+                for later in merged[index + 1:]
+            )
+            if not referenced:
+                merged[index] = None
+                del last[cell_id]
+                continue
+
+        last[cell_id] = len(merged)
+        merged.append(dict(op))
+
+    return [op for op in merged if op is not None]
+
+
+class _PendingBatch:
+    """等待发送的一批编辑"""
+
+    def __init__(self, client):
+        self.client = client
+        self.operations: List[Dict[str, Any]] = []
+        self.waiters: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EditQueue:
+    """按会话合并手动编辑"""
+
+    def __init__(self):
+        self.window = float(os.getenv("EDIT_BATCH_WINDOW_MS", "30")) / 1000
+        self.max_operations = int(os.getenv("EDIT_BATCH_MAX_OPS", "200"))
+        self._pending: Dict[str, _PendingBatch] = {}
+        # 每个会话最近一个执行中的批次，后续批次等它完成再执行
+        self._running: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, client, session_id: str, operations: List[Dict[str, Any]]) -> bool:
+        """
+        提交编辑，等待所在批次执行完成
+
+        Args:
+            client: 会话对应的图表后端（MCP 客户端或无头图表存储）
+
+        Returns:
+            所在批次是否执行成功
+        """
+        metrics = get_metrics()
+        metrics.incr("edit_queue.requests")
+        metrics.incr("edit_queue.ops_in", len(operations))
+        if self.window <= 0:
+            metrics.incr("edit_queue.batches")
+            metrics.incr("edit_queue.ops_out", len(operations))
+            return await client.edit_diagram(session_id, operations)
+
+        batch = self._pending.get(session_id)
+        if batch is None:
+            batch = self._pending[session_id] = _PendingBatch(client)
+            batch.timer = asyncio.get_running_loop().call_later(self.window, self._flush_soon, session_id, batch)
+        batch.operations.extend(operations)
+        waiter = asyncio.get_running_loop().create_future()
+        batch.waiters.append(waiter)
+        if len(batch.operations) >= self.max_operations:
+            batch.timer.cancel()
+            self._flush_soon(session_id, batch)
+
+        # 调用方断开不影响批次执行，其他调用方仍需要结果
+        return await asyncio.shield(waiter)
+
+    def _flush_soon(self, session_id: str, batch: _PendingBatch):
+        if self._pending.get(session_id) is batch:
+            del self._pending[session_id]
+        task = asyncio.ensure_future(self._flush(session_id, batch, self._running.get(session_id)))
+        self._running[session_id] = task
+
+        def done(t: asyncio.Task):
+            if self._running.get(session_id) is t:
+                del self._running[session_id]
+
+        task.add_done_callback(done)
+
+    async def _flush(self, session_id: str, batch: _PendingBatch, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        metrics = get_metrics()
+        merged = merge_operations(batch.operations)
+        metrics.incr("edit_queue.batches")
+        metrics.incr("edit_queue.ops_out", len(merged))
+        metrics.observe("edit_queue.batch_requests", len(batch.waiters))
+        logger.info(
+            f"[edit_queue] 会话 {session_id} 合并 {len(batch.waiters)} 次编辑: "
+            f"{len(batch.operations)} 个操作 -> {len(merged)} 个"
+        )
+
+        try:
+            # 操作全部抵消时无需调用后端
+            success = await batch.client.edit_diagram(session_id, merged) if merged else True
+        except Exception as e:
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in batch.waiters:
+            if not waiter.done():
+                waiter.set_result(success)
+
+
+_edit_queue: Optional[EditQueue] = None
+
+
+def get_edit_queue() -> EditQueue:
+    """获取编辑合并队列单例"""
+    global _edit_queue
+    if _edit_queue is None:
+        _edit_queue = EditQueue()
+    return _edit_queue
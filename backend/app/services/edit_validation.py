@@ -0,0 +1,102 @@
+"""
+编辑操作预检
+模型返回的编辑操作在调用图表后端之前，先对照当前图表的索引检查：
+- 操作类型、cell_id、new_xml 是否齐全，new_xml 能否解析、其中的 id 是否与 cell_id 一致；
+- 修改 / 删除的单元格是否存在，新增的单元格是否与已有单元格重名；
+- new_xml 中的 parent / source / target 在整批操作执行后是否指向存在的单元格。
+
+发现问题时由 GLMService 把问题列表发回给模型改正一次，而不是等图表后端报错后让用户整轮重试。
+"""
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Set
+
+from app.services.diagram_index import ROOT_IDS, DiagramIndex
+
+# 发给模型的问题列表最多保留的条数
+MAX_ERRORS = 10
+
+
+def validate_operations(operations: List[Dict[str, Any]], index: DiagramIndex) -> List[str]:
+    """
+    检查 MCP edit_diagram 形式的操作（type / cell_id / new_xml）
+
+    Args:
+        operations: 编辑操作（DSL 操作需先经 compile_operations 编译）
+        index: 当前图表的索引
+
+    Returns:
+        问题描述列表，没有问题时为空
+    """
+    errors: List[str] = []
+    added: Set[str] = set()
+    deleted: Set[str] = set()
+    # (操作描述, 属性, 引用的 id)，整批操作执行完后再检查，允许先加连线后加节点
+    references = []
+
+    def exists(cell_id: str) -> bool:
+        return cell_id in added or (cell_id in index.cells and cell_id not in deleted) or cell_id in ROOT_IDS
+
+    for op in operations:
+        if not isinstance(op, dict):
+            errors.append(f"操作 {op!r} 不是对象")
+            continue
+        op_type, cell_id = op.get("type"), op.get("cell_id")
+        if op_type not in ("add", "update", "delete"):
+            errors.append(f"操作 {cell_id or ''} 的类型「{op_type}」无效，应为 add / update / delete")
+            continue
+        if not cell_id:
+            errors.append(f"{op_type} 操作缺少 cell_id")
+            continue
+        cell_id = str(cell_id)
+        where = f"{op_type} {cell_id}"
+
+        if op_type == "delete":
+            if not exists(cell_id):
+                errors.append(f"{where}：单元格不存在")
+            elif cell_id in added:
+                added.discard(cell_id)
+            else:
+                deleted.update(index.cascade(cell_id))
+            continue
+        if op_type == "add" and exists(cell_id):
+            errors.append(f"{where}：单元格已存在，新增请使用新的 id，修改请使用 update")
+            continue
+        if op_type == "update" and not exists(cell_id):
+            errors.append(f"{where}：单元格不存在")
+            continue
+
+        new_xml = op.get("new_xml")
+        if not new_xml or not str(new_xml).strip():
+            errors.append(f"{where}：缺少 new_xml")
+            continue
+        try:
+            element = ET.fromstring(str(new_xml).strip())
+        except ET.ParseError as e:
+            errors.append(f"{where}：new_xml 不是有效的 XML（{e}）")
+            continue
+        if element.get("id") not in (None, cell_id):
+            errors.append(f"{where}：new_xml 中的 id「{element.get('id')}」与 cell_id 不一致")
+            continue
+        inner = element if element.tag == "mxCell" else element.find("mxCell")
+        if inner is None:
+            errors.append(f"{where}：new_xml 中没有 mxCell 元素")
+            continue
+        for attr in ("parent", "source", "target"):
+            ref = inner.get(attr)
+            if ref and ref != cell_id:
+                references.append((where, attr, ref))
+        if op_type == "add":
+            added.add(cell_id)
+
+    for where, attr, ref in references:
+        if not exists(ref):
+            errors.append(f"{where}：{attr}「{ref}」指向的单元格不存在")
+    return errors
+
+
+def format_errors(errors: List[str]) -> str:
+    """把问题列表整理为发给模型的紧凑文本"""
+    lines = [f"- {error}" for error in errors[:MAX_ERRORS]]
+    if len(errors) > MAX_ERRORS:
+        lines.append(f"- ……另有 {len(errors) - MAX_ERRORS} 个问题")
+    return "\n".join(lines)
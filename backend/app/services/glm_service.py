@@ -2,11 +2,26 @@
 智谱 GLM 服务封装
 处理与 GLM API 的对话，生成绘图指令
 """
+import asyncio
 import os
 import json
 import re
+import threading
+import time
 from typing import Dict, Any, List, Optional, AsyncGenerator
 
+from app.services.context_select import select_edit_context
+from app.services.cpu_pool import run_cpu
+from app.services.diagram_dsl import DiagramSpecError, compile_diagram, compile_operations, is_dsl_operation
+from app.services.diagram_index import get_index_cache
+from app.services.edit_validation import format_errors, validate_operations
+from app.services.http_pool import ensure_upstream_connection, get_upstream_client, warm_up_upstream
+from app.services.intent import EDIT_DIAGRAM, is_conversational
+from app.services.metrics import get_metrics
+from app.services.model_router import ModelRouter
+from app.services.stream_events import StreamEvent, TextEvent, CompleteEvent, ErrorEvent, RestartEvent
+from app.services.xml_stream_check import JsonXMLFieldChecker, XMLStreamError
+
 
 # GLM 系统提示词 - 优化版本
 SYSTEM_PROMPT = """# 角色设定
@@ -58,10 +73,13 @@ SYSTEM_PROMPT = """# 角色设定
 {
   "action": "display",
   "xml": "<完整的 mxGraphModel XML 代码>",
+  "layout": "flowchart",
   "reply": "你的自然语言回复，解释你创建了什么"
 }
 ```
 
+`layout` 为可选字段，指定自动布局方式：`flowchart`（分层，流程图）、`tree`（组织架构图等树形结构）、`mindmap`（思维导图）、`grid`（架构图）。
+
 ## 2. 修改现有图表
 
 当用户需要修改当前图表时，使用 `edit` 动作。**注意：`new_xml` 是 JSON 字符串，内部的双引号必须转义为 `\"`**
@@ -228,18 +246,27 @@ SYSTEM_PROMPT = """# 角色设定
 - 灰色系: fillColor=#f5f5f5;strokeColor=#666666
 - 橙色系: fillColor=#ffe6cc;strokeColor=#d79b00
 
-## 布局建议
+## 自动布局
+
+创建新图表时**只需描述拓扑**（节点、连线、分组及其 parent 关系），服务端会自动计算坐标：
 
-1. **水平间距**：节点之间保持 40-60px
-2. **垂直间距**：层级之间保持 80-100px
-3. **对齐**：同一层级的节点应水平或垂直对齐
-4. **起始位置**：通常从 (100, 50) 或 (150, 50) 开始
-5. **标准尺寸**：
+1. **可省略坐标**：节点的 `mxGeometry` 可以省略，或只写 `width`/`height`，不要逐个计算 `x`/`y`
+2. **连线**：只需写清 `source` 和 `target`，不要添加折点
+3. **标准尺寸**（省略时自动使用）：
    - 矩形节点：120x60
    - 椭圆（开始/结束）：80x40
    - 菱形（判断）：100x80
    - 数据库：80x100
 
+### 只描述拓扑的示例
+```xml
+<mxCell id="start" value="开始" style="ellipse;whiteSpace=wrap;html=1;fillColor=#d5e8d4;strokeColor=#82b366;" vertex="1" parent="1"/>
+<mxCell id="step1" value="输入账号" style="rounded=0;whiteSpace=wrap;html=1;fillColor=#dae8fc;strokeColor=#6c8ebf;" vertex="1" parent="1"/>
+<mxCell id="e1" edge="1" parent="1" source="start" target="step1"/>
+```
+
+修改现有图表（edit）时仍需为新增节点给出完整的 `mxGeometry`，并参考当前图表中相邻节点的位置。
+
 ---
 
 # 示例对话
@@ -260,7 +287,7 @@ SYSTEM_PROMPT = """# 角色设定
 1. **始终返回有效 JSON**：不要在 JSON 外添加任何文字
 2. **ID 唯一性**：每个元素的 id 必须唯一且有意义（如 start、step1、decision1）
 3. **连线完整性**：edge 必须指定有效的 source 和 target
-4. **布局美观**：合理安排元素位置，避免重叠
+4. **布局交给服务端**：创建图表时无需计算坐标，服务端会自动排版
 5. **中文友好**：节点文本使用清晰的中文
 6. **回复自然**：reply 字段要用自然、友好的语言
 
@@ -320,6 +347,122 @@ SYSTEM_PROMPT = """# 角色设定
 """
 
 
+# 轻量对话提示词 - 用于寒暄、提问等无需图表上下文的轮次
+CHAT_SYSTEM_PROMPT = """你是 **DrawIO AI 助手**，一个专业、友好的 AI 伙伴，擅长创建流程图、架构图、思维导图、UML 图、组织架构图等各类图表，也能进行日常对话。
+
+本轮用户只是在聊天或提问，不需要操作图表。请用自然、亲切的中文简洁回复，必要时可以引导用户说出想画的图（例如「帮我画一个用户登录流程图」）。
+
+你必须只返回一个有效的 JSON 对象，不要在 JSON 外添加任何文字：
+
+```json
+{"action": "none", "reply": "你的自然语言回复"}
+```
+"""
+
+
+# 紧凑图表描述提示词 - 模型只输出节点 / 连线 / 分组，由服务端编译为 mxGraph XML 并自动布局
+DSL_SYSTEM_PROMPT = """# 角色设定
+
+你是 **DrawIO AI 助手**，一个专业、友好的 AI 伙伴，擅长创建流程图、架构图、思维导图、UML 图、组织架构图等各类图表，也能进行日常对话。
+
+- 用户要求画图、描述了需要可视化的流程或结构时，创建图表（display）
+- 用户要求修改、添加、删除当前图表中的元素时，修改图表（edit）
+- 打招呼、提问、感谢等不涉及图表时，只回复文字（none）
+- 生成图表后简要说明做了什么，并询问是否需要调整；需求不清晰时主动询问细节
+
+# 输出格式
+
+你必须只返回一个有效的 JSON 对象，不要在 JSON 外添加任何文字。**不要输出 XML，也不要输出坐标**，服务端会编译为 draw.io 图表并自动布局。
+
+## 1. 创建新图表
+
+```json
+{
+  "action": "display",
+  "diagram": {
+    "layout": "flowchart",
+    "nodes": [
+      {"id": "start", "label": "开始", "shape": "start"},
+      {"id": "input", "label": "输入账号密码", "shape": "io"},
+      {"id": "check", "label": "验证通过?", "shape": "decision"},
+      {"id": "home", "label": "进入主页"},
+      {"id": "end", "label": "结束", "shape": "end"}
+    ],
+    "edges": [
+      {"from": "start", "to": "input"},
+      {"from": "input", "to": "check"},
+      {"from": "check", "to": "home", "label": "是"},
+      {"from": "check", "to": "input", "label": "否", "dashed": true},
+      {"from": "home", "to": "end"}
+    ]
+  },
+  "reply": "我为你创建了一个用户登录流程图……需要我调整任何部分吗？"
+}
+```
+
+- `layout`：`flowchart`（流程图）、`tree`（组织架构图等树形结构）、`mindmap`（思维导图）、`grid`（架构图）
+- 节点字段：`id`（唯一且有意义）、`label`（文本，换行用 `\\n`）、`shape`、`color`、`group`（所属分组 id），均可省略除 `id` 外的字段
+- `shape`：`process`（矩形，缺省）、`rounded`、`start`、`end`、`decision`、`io`、`database`、`document`、`cloud`、`actor`、`ellipse`、`topic`（思维导图中心）、`text`
+- `color`：`blue`、`green`、`yellow`、`red`、`purple`、`gray`、`orange`（缺省按形状取色）
+- 连线字段：`from`、`to`、`label`、`dashed`（虚线）、`arrow`（false 表示无箭头，思维导图使用）、`route`（`orthogonal` 缺省 / `straight` / `curved`）
+- 分组：`"groups": [{"id": "svc", "label": "服务层", "nodes": ["order", "user"]}]`，`"shape": "lane"` 表示横向泳道
+
+## 2. 修改现有图表
+
+用户消息中会附带当前图表 XML，引用其中已有的 id：
+
+```json
+{
+  "action": "edit",
+  "operations": [
+    {"op": "add", "node": {"id": "notify", "label": "发送通知", "shape": "process"}},
+    {"op": "add", "edge": {"from": "home", "to": "notify"}},
+    {"op": "update", "id": "check", "label": "身份认证", "color": "green"},
+    {"op": "delete", "id": "input"}
+  ],
+  "reply": "好的，我已经……还有其他需要修改的地方吗？"
+}
+```
+
+- `update` 只写需要改变的字段（`label`、`shape`、`color`，连线可改 `label`、`dashed`）
+- 删除节点时与之相连的连线会一并删除
+- 新增节点的位置由服务端计算
+
+## 3. 纯对话回复
+
+```json
+{"action": "none", "reply": "你的自然语言回复"}
+```
+
+# 重要提醒
+
+1. 始终返回有效 JSON，字符串中的双引号写成 `\\"`，文本中可用中文引号「」
+2. 每个 id 必须唯一，连线的 from / to 必须引用存在的 id
+3. 节点文本使用清晰的中文，reply 使用自然、友好的语言
+"""
+
+
+# 输出因长度限制被截断（finish_reason == "length"）时的续写提示词
+CONTINUATION_PROMPT = "你的上一条回复因长度限制被截断了。请从中断处继续输出，紧接最后一个字符，不要重复已输出的内容，不要添加任何解释或代码块标记。"
+
+# 流式输出中发现 XML 格式错误、中止生成后的改正提示词
+XML_CORRECTION_PROMPT = (
+    "你的上一条回复中 {field} 字段的 XML 在第 {line} 行第 {column} 列出现格式错误（{message}），输出已中止。"
+    "请重新输出完整的回复（从头开始，不要续写），确保 XML 格式正确："
+    "标签正确闭合，属性值中的 & < \" 分别写成 &amp; &lt; &quot;。"
+)
+
+# 编辑操作预检发现问题后的改正提示词
+EDIT_CORRECTION_PROMPT = (
+    "你返回的编辑操作有以下问题，尚未执行任何修改：\n{errors}\n\n"
+    "请对照当前图表改正后重新返回完整的 JSON（包含全部编辑操作和 reply），不要添加任何解释。"
+)
+
+# 续写片段开头与已有内容比对重叠的窗口（字符数），以及认定为重叠的最短长度
+CONTINUATION_OVERLAP_WINDOW = 200
+_MIN_OVERLAP = 12
+
+
 # 智谱 Coding 套餐专用 Base URL
 GLM_BASE_URL = "https://open.bigmodel.cn/api/coding/paas/v4"
 
@@ -333,39 +476,99 @@ class GLMService:
         self.base_url = os.getenv("GLM_BASE_URL", GLM_BASE_URL)
         self.temperature = float(os.getenv("GLM_TEMPERATURE", "0.7"))
         self.max_tokens = int(os.getenv("GLM_MAX_TOKENS", "8192"))
-        self.client = None
-        self._init_client()
+        # 寒暄、提问等对话类轮次的输出上限
+        self.chat_max_tokens = int(os.getenv("GLM_CHAT_MAX_TOKENS", "1024"))
+        # 输出被截断时最多续写的轮数
+        self.max_continuations = int(os.getenv("GLM_MAX_CONTINUATIONS", "3"))
+        # 流式输出时边生成边检查 XML 格式，出错后最多重新生成的次数（只在 DIAGRAM_DSL=0 时生效）
+        self.xml_stream_check = os.getenv("GLM_XML_STREAM_CHECK", "1") == "1"
+        self.xml_stream_retries = int(os.getenv("GLM_XML_STREAM_RETRIES", "1"))
+        # 编辑操作预检发现问题时，把问题列表发回给模型改正一次（1 开启 / 0 关闭，只记录指标）
+        self.edit_correction = os.getenv("GLM_EDIT_CORRECTION", "1") == "1"
+        # 修改大图表时只发送相关子图：图表上下文的 token 预算（0 表示总是发送整张图表）和邻域跳数
+        self.edit_context_budget = int(os.getenv("EDIT_CONTEXT_BUDGET", "3000"))
+        self.edit_context_hops = int(os.getenv("EDIT_CONTEXT_HOPS", "1"))
+        # 让模型输出紧凑的图表描述（由服务端编译为 XML），0 时沿用直接输出 XML 的提示词
+        self.use_dsl = os.getenv("DIAGRAM_DSL", "1") == "1"
+        # 快慢模型路由：配置 GLM_FAST_MODEL 后对话和小图表修改使用快模型，出错时升级到 GLM_MODEL
+        self.router = ModelRouter(self.model)
+        # openai 包导入较慢，客户端推迟到首次使用（或启动后的预热）时创建
+        self._client = None
+        self._client_ready = False
+        # 启动预热在后台线程中初始化客户端，与请求线程互斥
+        self._client_lock = threading.Lock()
+        # 客户端是否使用进程共享的上游连接池（测试中替换的客户端不使用）
+        self._shared_pool = False
+        # 系统提示词消息预先构建，每轮对话直接复用
+        self._system_message = {"role": "system", "content": DSL_SYSTEM_PROMPT if self.use_dsl else SYSTEM_PROMPT}
+        self._chat_system_message = {"role": "system", "content": CHAT_SYSTEM_PROMPT}
+    
+    @property
+    def client(self):
+        """GLM 客户端，首次访问时初始化；未配置 API Key 时为 None"""
+        if not self._client_ready:
+            with self._client_lock:
+                if not self._client_ready:
+                    self._init_client()
+        return self._client
+    
+    @client.setter
+    def client(self, value):
+        self._client = value
+        self._client_ready = True
+        self._shared_pool = False
     
     def _init_client(self):
         """初始化 GLM 客户端（OpenAI 兼容接口）"""
+        import logging
+        logger = logging.getLogger(__name__)
+        
         if self.api_key:
             try:
-                from openai import OpenAI
-                import httpx
-                # 创建带超时的 HTTP 客户端，禁用代理以避免 whistle 等代理工具干扰
-                http_client = httpx.Client(
-                    timeout=60.0,
-                    proxy=None,  # 显式禁用代理
-                    trust_env=False  # 不读取环境变量中的代理设置
-                )
-                self.client = OpenAI(
+                from openai import AsyncOpenAI
+                # 进程内共享同一个上游连接池，请求可随调用方取消而中断
+                http_client = get_upstream_client()
+                self._client = AsyncOpenAI(
                     api_key=self.api_key,
                     base_url=self.base_url,
                     http_client=http_client
                 )
-                print(f"[GLMService] 已连接到: {self.base_url}")
-                print(f"[GLMService] 使用模型: {self.model}")
+                self._shared_pool = True
+                logger.info(f"[GLMService] 已连接到: {self.base_url}，使用模型: {self.model}")
             except ImportError as e:
-                print(f"[Warning] OpenAI 或 httpx 包未安装: {e}")
+                logger.warning(f"[GLMService] OpenAI 或 httpx 包未安装: {e}")
+        self._client_ready = True
     
-    def _build_messages(
-        self, 
-        user_message: str, 
+    async def warm_up(self):
+        """
+        启动后的后台预热：在线程中导入 openai 并创建客户端，再预先建立到上游的连接
+        """
+        client = await asyncio.to_thread(lambda: self.client)
+        if client is not None:
+            await warm_up_upstream(self.base_url)
+    
+    async def connect(self):
+        """
+        对话轮次开始时调用：确保客户端已创建，且上游连接池中有可用连接
+
+        与读取当前图表并行执行，首次请求的客户端创建和建连不再排在 LLM 调用前
+        """
+        client = self._client if self._client_ready else await asyncio.to_thread(lambda: self.client)
+        if client is not None and self._shared_pool:
+            await ensure_upstream_connection(self.base_url)
+    
+    def prepare_history(
+        self,
         history: List[Dict[str, str]] = None,
-        current_diagram_xml: str = None
+        intent: str = None
     ) -> List[Dict[str, str]]:
-        """构建对话消息列表"""
-        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        """
+        构建消息列表中与当前图表无关的前缀：系统提示词和对话历史
+
+        可以在读取当前图表的同时准备，图表就绪后由 finish_messages 补上当前消息
+        """
+        system_message = self._chat_system_message if is_conversational(intent) else self._system_message
+        messages = [system_message]
         
         # 添加历史消息
         if history:
@@ -381,10 +584,34 @@ class GLMService:
                     "role": role,
                     "content": content
                 })
+        return messages
+    
+    def finish_messages(
+        self,
+        prefix: List[Dict[str, str]],
+        user_message: str,
+        current_diagram_xml: str = None,
+        intent: str = None,
+        session_id: str = None
+    ) -> List[Dict[str, str]]:
+        """
+        在 prepare_history 的前缀后追加当前消息（含当前图表 XML）
+
+        修改类意图且图表超过 EDIT_CONTEXT_BUDGET 时，只附带与消息相关的子图和其余部分的概要
+        """
+        if is_conversational(intent):
+            current_diagram_xml = None
         
         # 构建当前消息
         current_content = user_message
-        if current_diagram_xml:
+        context = None
+        if current_diagram_xml and intent == EDIT_DIAGRAM:
+            context = select_edit_context(
+                current_diagram_xml, user_message, self.edit_context_budget, self.edit_context_hops, session_id
+            )
+        if context:
+            current_content = context.render(user_message)
+        elif current_diagram_xml:
             current_content = f"""当前图表 XML：
 ```xml
 {current_diagram_xml}
@@ -392,9 +619,71 @@ class GLMService:
 
 用户需求：{user_message}"""
         
-        messages.append({"role": "user", "content": current_content})
+        return prefix + [{"role": "user", "content": current_content}]
+    
+    def _build_messages(
+        self, 
+        user_message: str, 
+        history: List[Dict[str, str]] = None,
+        current_diagram_xml: str = None,
+        intent: str = None
+    ) -> List[Dict[str, str]]:
+        """
+        构建对话消息列表
         
-        return messages
+        对话类意图（寒暄、提问）使用轻量提示词，且不附带图表 XML
+        """
+        prefix = self.prepare_history(history, intent)
+        return self.finish_messages(prefix, user_message, current_diagram_xml, intent)
+    
+    @staticmethod
+    def _continuation_messages(messages: List[Dict[str, str]], partial: str) -> List[Dict[str, str]]:
+        """在原始消息后附上已输出的内容和续写指令"""
+        return messages + [
+            {"role": "assistant", "content": partial},
+            {"role": "user", "content": CONTINUATION_PROMPT},
+        ]
+    
+    @staticmethod
+    def _correction_messages(
+        messages: List[Dict[str, str]], partial: str, error: XMLStreamError
+    ) -> List[Dict[str, str]]:
+        """在原始消息后附上出错的输出和改正指令"""
+        return messages + [
+            {"role": "assistant", "content": partial},
+            {"role": "user", "content": XML_CORRECTION_PROMPT.format(
+                field=error.field, line=error.line, column=error.column, message=error.message
+            )},
+        ]
+    
+    @staticmethod
+    def _edit_correction_messages(
+        messages: List[Dict[str, str]], response_text: str, errors: List[str]
+    ) -> List[Dict[str, str]]:
+        """在原始消息后附上模型的回复和编辑操作的问题列表"""
+        return messages + [
+            {"role": "assistant", "content": response_text},
+            {"role": "user", "content": EDIT_CORRECTION_PROMPT.format(errors=format_errors(errors))},
+        ]
+    
+    @staticmethod
+    def _stitch(text: str, fragment: str) -> str:
+        """
+        拼接续写片段
+        
+        去掉片段开头模型可能添加的代码块标记，以及与已有内容末尾重复的部分
+        """
+        if fragment.lstrip().startswith("```"):
+            fragment = re.sub(r"^\s*```(?:json|xml)?[ \t]*\n?", "", fragment)
+        longest = min(len(text), len(fragment), CONTINUATION_OVERLAP_WINDOW)
+        for size in range(longest, _MIN_OVERLAP - 1, -1):
+            if text.endswith(fragment[:size]):
+                return text + fragment[size:]
+        return text + fragment
+    
+    def _max_tokens_for(self, intent: str = None) -> int:
+        """根据意图选择输出 token 上限"""
+        return self.chat_max_tokens if is_conversational(intent) else self.max_tokens
     
     def _validate_xml(self, xml: str) -> tuple[bool, str]:
         """
@@ -526,6 +815,138 @@ class GLMService:
         
         return None
 
+    def _try_close_truncated_json(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        补全被截断的紧凑图表描述
+        
+        回退到最后一个完整闭合的对象或数组，再按未闭合的括号补齐，
+        截断时只丢失最后一个没写完的节点或连线。
+        """
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        start = text.find("{")
+        if start == -1:
+            return None
+        
+        stack = []
+        in_string = escaped = False
+        cut = None
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+            if ch == '"':
+                in_string = True
+            elif ch in "{[":
+                stack.append(ch)
+            elif ch in "}]":
+                if not stack:
+                    break
+                stack.pop()
+                if not stack:
+                    # 顶层对象已完整，说明不是截断导致的解析失败
+                    return None
+                cut = (i + 1, list(stack))
+        if cut is None:
+            return None
+        
+        end, unclosed = cut
+        candidate = text[start:end].rstrip().rstrip(",")
+        candidate += "".join("}" if c == "{" else "]" for c in reversed(unclosed))
+        try:
+            result = json.loads(candidate)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(result, dict) or "action" not in result:
+            return None
+        
+        logger.info("[_try_close_truncated_json] 截断的图表描述补全成功")
+        result.setdefault("reply", "图表已生成，但由于响应较长，部分内容可能被截断。如有问题请告诉我。")
+        return result
+
+    def _compile_result(self, result: Dict[str, Any], current_diagram_xml: str = None) -> Dict[str, Any]:
+        """把紧凑图表描述编译为 MCP 可直接使用的 XML 或编辑操作"""
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        action = result.get("action")
+        try:
+            if action == "display" and isinstance(result.get("diagram"), dict) and not result.get("xml"):
+                spec = result.pop("diagram")
+                result["xml"] = compile_diagram(spec)
+                result.setdefault("layout", spec.get("layout"))
+                logger.info(f"[_compile_result] 图表描述编译完成，XML 长度: {len(result['xml'])}")
+            elif action == "edit" and any(is_dsl_operation(op) for op in result.get("operations") or []):
+                errors = []
+                result["operations"] = compile_operations(result["operations"], current_diagram_xml, errors)
+                if errors:
+                    # 由 _check_edit 取出，并入编辑预检的问题列表
+                    result["compile_errors"] = errors
+                logger.info(f"[_compile_result] 编辑操作编译完成，操作数: {len(result['operations'])}")
+        except DiagramSpecError as e:
+            logger.warning(f"[_compile_result] 图表描述无效: {e}")
+            return {
+                "action": "none",
+                "reply": f"{result.get('reply', '')}\n\n（抱歉，生成的图表描述无效：{e}）".strip()
+            }
+        return result
+
+    async def _finish_response(self, response_text: str, current_diagram_xml: str = None) -> Dict[str, Any]:
+        """
+        解析响应并编译图表描述
+
+        XML 校验、截断修复和 DSL 编译都是 CPU 计算，响应较大时放到线程池执行（见 app.services.cpu_pool）
+        """
+        size = len(response_text) + len(current_diagram_xml or "")
+        return await run_cpu(
+            lambda: self._compile_result(self._parse_response(response_text), current_diagram_xml),
+            size=size
+        )
+
+    def _edit_errors(self, result: Dict[str, Any], current_diagram_xml: str = None) -> List[str]:
+        """编译时被忽略的 DSL 操作，以及对照当前图表索引检查出的编辑操作问题"""
+        import xml.etree.ElementTree as ET
+        
+        errors = result.pop("compile_errors", [])
+        if result.get("action") != "edit" or not current_diagram_xml:
+            return errors
+        try:
+            index = get_index_cache().get(current_diagram_xml)
+        except ET.ParseError:
+            return errors
+        return errors + validate_operations(result.get("operations") or [], index)
+    
+    async def _check_edit(
+        self, result: Dict[str, Any], current_diagram_xml: str = None, first_pass: bool = True
+    ) -> List[str]:
+        """
+        编辑操作预检，记录首次通过率
+
+        指标：edit_validation.checked / first_pass_ok / first_pass_failed（首次结果），
+        edit_validation.corrected / still_invalid（改正后的结果），edit_validation.first_pass_rate
+        """
+        is_edit = result.get("action") == "edit"
+        errors = await run_cpu(
+            self._edit_errors, result, current_diagram_xml, size=len(current_diagram_xml or "")
+        )
+        metrics = get_metrics()
+        if first_pass and is_edit:
+            metrics.incr("edit_validation.checked")
+            metrics.incr("edit_validation.first_pass_failed" if errors else "edit_validation.first_pass_ok")
+            metrics.set_gauge("edit_validation.first_pass_rate", round(
+                metrics.counter("edit_validation.first_pass_ok") / metrics.counter("edit_validation.checked"), 4
+            ))
+        elif not first_pass:
+            metrics.incr("edit_validation.still_invalid" if errors else "edit_validation.corrected")
+        return errors
+    
     def _parse_response(self, response_text: str) -> Dict[str, Any]:
         """解析 GLM 响应，提取 JSON 结构"""
         import logging
@@ -565,6 +986,10 @@ class GLMService:
                 except json.JSONDecodeError as e:
                     logger.warning(f"[_parse_response] 正则提取解析失败: {e}")
         
+        # 尝试补全被截断的紧凑图表描述
+        if result is None and '"diagram"' in response_text:
+            result = self._try_close_truncated_json(response_text)
+        
         # 尝试修复被截断的 JSON 响应
         if result is None:
             logger.info("[_parse_response] 尝试修复被截断的 JSON 响应")
@@ -610,7 +1035,9 @@ class GLMService:
         self,
         user_message: str,
         history: List[Dict[str, str]] = None,
-        current_diagram_xml: str = None
+        current_diagram_xml: str = None,
+        intent: str = None,
+        messages: List[Dict[str, str]] = None
     ) -> Dict[str, Any]:
         """
         与 GLM 对话，返回绘图指令
@@ -619,6 +1046,8 @@ class GLMService:
             user_message: 用户消息
             history: 对话历史
             current_diagram_xml: 当前图表 XML
+            intent: 预分类的意图（见 app.services.intent），对话类意图使用轻量提示词
+            messages: 已构建好的消息列表（见 app.services.turn），提供时忽略 history
             
         Returns:
             {
@@ -632,65 +1061,275 @@ class GLMService:
             # 返回模拟响应（开发测试用）
             return self._mock_response(user_message)
         
-        messages = self._build_messages(user_message, history, current_diagram_xml)
+        import logging
+        logger = logging.getLogger(__name__)
         
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
-            
-            response_text = response.choices[0].message.content
-            return self._parse_response(response_text)
+        if messages is None:
+            messages = self._build_messages(user_message, history, current_diagram_xml, intent)
         
+        route = self.router.choose(intent, current_diagram_xml)
+        try:
+            try:
+                response_text = await self._complete(messages, intent, route.model)
+            except Exception as e:
+                # 快模型请求出错时改用强模型重试
+                if not route.escalatable:
+                    raise
+                logger.warning(f"[chat] 快模型 {route.model} 请求出错: {e}")
+                self.router.record(route, ok=False)
+                route = self.router.escalate(route)
+                response_text = await self._complete(messages, intent, route.model)
+            result = await self._finish_response(response_text, current_diagram_xml)
+
+            # 编辑操作先对照当前图表预检，有问题时让模型改正一次（快模型的输出交给强模型改正）
+            errors = await self._check_edit(result, current_diagram_xml)
+            if errors and (self.edit_correction or route.escalatable):
+                logger.info(f"[chat] 编辑操作预检发现 {len(errors)} 个问题，请模型改正: {errors[:3]}")
+                if route.escalatable:
+                    self.router.record(route, ok=False)
+                    route = self.router.escalate(route)
+                messages = self._edit_correction_messages(messages, response_text, errors)
+                response_text = await self._complete(messages, intent, route.model)
+                result = await self._finish_response(response_text, current_diagram_xml)
+                errors = await self._check_edit(result, current_diagram_xml, first_pass=False)
+                if errors:
+                    logger.warning(f"[chat] 改正后的编辑操作仍有 {len(errors)} 个问题: {errors[:3]}")
+            self.router.record(route, ok=not errors)
+            return result
+
         except Exception as e:
+            self.router.record(route, ok=False)
             return {
                 "action": "none",
                 "reply": f"抱歉，处理请求时出错：{str(e)}"
             }
     
+    async def _complete(self, messages: List[Dict[str, str]], intent: str = None, model: str = None) -> str:
+        """非流式调用，输出被截断时从中断处续写，直到完整或达到续写上限"""
+        import logging
+        logger = logging.getLogger(__name__)
+        metrics = get_metrics()
+        
+        model = model or self.model
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self._max_tokens_for(intent)
+        )
+        
+        choice = response.choices[0]
+        response_text = choice.message.content or ""
+        
+        rounds = 0
+        while choice.finish_reason == "length" and rounds < self.max_continuations:
+            rounds += 1
+            metrics.incr("glm.continuations")
+            logger.info(f"[chat] 输出被截断（已输出 {len(response_text)} 字符），第 {rounds} 次续写")
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=self._continuation_messages(messages, response_text),
+                temperature=self.temperature,
+                max_tokens=self._max_tokens_for(intent)
+            )
+            choice = response.choices[0]
+            response_text = self._stitch(response_text, choice.message.content or "")
+        if choice.finish_reason == "length":
+            metrics.incr("glm.truncated")
+            logger.warning(f"[chat] 续写 {rounds} 次后仍被截断，交给截断修复逻辑处理")
+        return response_text
+    
     async def chat_stream(
         self,
         user_message: str,
         history: List[Dict[str, str]] = None,
-        current_diagram_xml: str = None
-    ) -> AsyncGenerator[str, None]:
+        current_diagram_xml: str = None,
+        intent: str = None,
+        messages: List[Dict[str, str]] = None
+    ) -> AsyncGenerator[StreamEvent, None]:
         """
         流式对话
         
+        开启 GLM_XML_STREAM_CHECK 且模型直接输出 XML（DIAGRAM_DSL=0）时，输出中的 XML 字段边生成边检查格式，
+        第一个结构错误出现时立即中止本次生成，发送 RestartEvent 并要求模型改正后重新输出。
+        本轮使用快模型（见 app.services.model_router）时，请求出错或输出未通过校验即升级到强模型重新生成。
+
         Yields:
-            JSON 格式的响应片段
+            流式事件：TextEvent（文本增量）、RestartEvent（重新生成）、CompleteEvent（解析结果）或 ErrorEvent
         """
         if not self.client:
-            yield json.dumps({"type": "text", "content": "GLM 客户端未初始化"})
+            yield TextEvent(content="GLM 客户端未初始化")
             return
         
-        messages = self._build_messages(user_message, history, current_diagram_xml)
+        import logging
+        logger = logging.getLogger(__name__)
         
+        if messages is None:
+            messages = self._build_messages(user_message, history, current_diagram_xml, intent)
+        metrics = get_metrics()
+        route = self.router.choose(intent, current_diagram_xml)
+
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-                stream=True
-            )
-            
-            full_content = ""
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    content = chunk.choices[0].delta.content
-                    full_content += content
-                    yield json.dumps({"type": "text", "content": content})
+            parts = []
+            request_messages = messages
+            rounds = 0
+            restarts = 0
+            corrected = False
+            checker = self._stream_checker()
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=route.model,
+                        messages=request_messages,
+                        temperature=self.temperature,
+                        max_tokens=self._max_tokens_for(intent),
+                        stream=True
+                    )
+                except Exception as e:
+                    # 快模型请求出错时改用强模型重新生成
+                    if not route.escalatable:
+                        raise
+                    logger.warning(f"[stream] 快模型 {route.model} 请求出错: {e}")
+                    self.router.record(route, ok=False)
+                    route = self.router.escalate(route)
+                    if parts:
+                        yield RestartEvent(reason=f"改用 {route.model} 重新生成")
+                    request_messages = messages
+                    parts = []
+                    rounds = 0
+                    checker = self._stream_checker()
+                    continue
+
+                finish_reason = None
+                xml_error = None
+                first_token = True
+                # 续写片段的开头先缓冲，与已输出内容去重后再发送
+                pending = [] if rounds else None
+                pending_len = 0
+                try:
+                    async for chunk in response:
+                        if not chunk.choices:
+                            continue
+                        choice = chunk.choices[0]
+                        finish_reason = choice.finish_reason or finish_reason
+                        content = choice.delta.content
+                        if not content:
+                            continue
+                        if first_token:
+                            first_token = False
+                            self.router.observe_latency(route, time.perf_counter() - started)
+                        if pending is None:
+                            parts.append(content)
+                            delta = content
+                        else:
+                            pending.append(content)
+                            pending_len += len(content)
+                            if pending_len < CONTINUATION_OVERLAP_WINDOW:
+                                continue
+                            delta = self._stitch_delta(parts, "".join(pending))
+                            pending = None
+                            if not delta:
+                                continue
+                        yield TextEvent(content=delta)
+                        if checker is not None and checker.feed(delta) is not None:
+                            xml_error = checker.error
+                            metrics.incr("glm.xml_stream_errors")
+                            # 快模型的输出有误时总是中止，升级到强模型重新生成
+                            if restarts < self.xml_stream_retries or route.escalatable:
+                                break
+                            # 重试次数用尽：继续输出，交给解析后的修复逻辑处理
+                            logger.warning(f"[stream] XML 格式错误且重试次数已用尽，继续输出: {xml_error}")
+                            checker = None
+                            xml_error = None
+                finally:
+                    # 调用方取消、提前退出或中止生成时立即关闭上游连接
+                    await response.close()
+                
+                if xml_error is not None:
+                    # 中止生成，带上出错位置要求模型从头重新输出
+                    restarts += 1
+                    metrics.incr("glm.xml_stream_restarts")
+                    metrics.observe("glm.xml_stream_abort_chars", sum(map(len, parts)))
+                    logger.info(f"[stream] 输出中的 XML 格式错误，中止生成并第 {restarts} 次重新生成: {xml_error}")
+                    if route.escalatable:
+                        self.router.record(route, ok=False)
+                        route = self.router.escalate(route)
+                    yield RestartEvent(reason=str(xml_error))
+                    messages = self._correction_messages(messages, "".join(parts), xml_error)
+                    request_messages = messages
+                    parts = []
+                    rounds = 0
+                    checker = self._stream_checker()
+                    continue
+                
+                if pending:
+                    delta = self._stitch_delta(parts, "".join(pending))
+                    if delta:
+                        yield TextEvent(content=delta)
+                        if checker is not None and checker.feed(delta) is not None:
+                            # 最后一段已输出完毕，不再中止
+                            metrics.incr("glm.xml_stream_errors")
+                
+                if finish_reason == "length" and rounds < self.max_continuations:
+                    # 输出被截断，从中断处续写
+                    rounds += 1
+                    metrics.incr("glm.continuations")
+                    logger.info(f"[stream] 输出被截断，第 {rounds} 次续写")
+                    request_messages = self._continuation_messages(messages, "".join(parts))
+                    continue
+                
+                if finish_reason == "length":
+                    metrics.incr("glm.truncated")
+                    logger.warning(f"[stream] 续写 {rounds} 次后仍被截断，交给截断修复逻辑处理")
+                
+                response_text = "".join(parts)
+                result = await self._finish_response(response_text, current_diagram_xml)
+                # 编辑操作先对照当前图表预检，有问题时让模型改正一次
+                errors = await self._check_edit(result, current_diagram_xml, first_pass=not corrected)
+                if not errors or corrected or not (self.edit_correction or route.escalatable):
+                    if errors:
+                        logger.warning(f"[stream] 编辑操作仍有 {len(errors)} 个问题: {errors[:3]}")
+                    break
+                corrected = True
+                logger.info(f"[stream] 编辑操作预检发现 {len(errors)} 个问题，请模型改正: {errors[:3]}")
+                if route.escalatable:
+                    # 快模型的输出交给强模型改正
+                    self.router.record(route, ok=False)
+                    route = self.router.escalate(route)
+                yield RestartEvent(reason=f"编辑操作有 {len(errors)} 个问题，正在改正")
+                messages = self._edit_correction_messages(messages, response_text, errors)
+                request_messages = messages
+                parts = []
+                rounds = 0
+                checker = self._stream_checker()
             
+            self.router.record(route, ok=not errors)
             # 最后发送完整的解析结果
-            result = self._parse_response(full_content)
-            yield json.dumps({"type": "complete", "result": result})
+            yield CompleteEvent(result=result)
         
         except Exception as e:
-            yield json.dumps({"type": "error", "message": str(e)})
+            self.router.record(route, ok=False)
+            yield ErrorEvent(message=str(e))
+    
+    def _stream_checker(self) -> Optional[JsonXMLFieldChecker]:
+        """
+        流式 XML 检查器
+
+        DSL 模式下提示词要求模型输出 JSON 图表描述而不输出 XML，没有 xml / new_xml 字段可查，
+        不创建检查器，省去逐个增量的扫描；模型仍输出了 XML 时由解析后的校验修复逻辑处理
+        """
+        if not self.xml_stream_check or self.use_dsl:
+            return None
+        return JsonXMLFieldChecker()
+
+    def _stitch_delta(self, parts: List[str], fragment: str) -> str:
+        """把续写片段拼到 parts 末尾，返回实际新增的文本"""
+        text = "".join(parts)
+        delta = self._stitch(text, fragment)[len(text):]
+        if delta:
+            parts.append(delta)
+        return delta
     
     def _mock_response(self, user_message: str) -> Dict[str, Any]:
         """模拟响应（开发测试用）- 智能对话版"""
@@ -0,0 +1,199 @@
+"""
+上游 HTTP 连接池
+每个进程只维护一个访问 LLM 上游的 httpx.AsyncClient，所有 GLMService 共用：
+- Limits 控制最大连接数与保活连接数，高并发时复用连接，TLS 握手不落在请求路径上；
+- 安装了 h2 时启用 HTTP/2，多个流式请求复用同一条连接；
+- 启动后预先解析 DNS 并建立连接（warm_up_upstream）；
+- 对话轮次中与图表读取并行确认有可用连接（ensure_upstream_connection）；
+- 记录连接池使用情况，通过 /metrics 查看。
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlsplit
+
+from app.services.metrics import get_metrics
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def _pool_stats(transport) -> dict:
+    """从 httpcore 连接池读取连接数，httpx 未公开该信息，读取失败时返回空字典"""
+    pool = getattr(transport, "_pool", None)
+    try:
+        connections = list(pool.connections)
+    except AttributeError:
+        return {}
+    return {
+        "connections": len(connections),
+        "idle": sum(1 for c in connections if c.is_idle()),
+        # 可以立即承接新请求的连接：空闲的 HTTP/1.1 连接，或还有空余流的 HTTP/2 连接
+        "available": sum(1 for c in connections if c.is_available()),
+        "http2": sum(1 for c in connections if "HTTP/2" in c.info()),
+    }
+
+
+def _make_metered_transport(transport):
+    """包装传输层：统计进行中的请求、首包耗时和连接池状态"""
+    import httpx
+
+    class MeteredTransport(httpx.AsyncBaseTransport):
+        def __init__(self, inner: httpx.AsyncBaseTransport):
+            self.inner = inner
+            self.active = 0
+
+        def _update(self):
+            metrics = get_metrics()
+            metrics.set_gauge("upstream.pool.active", self.active)
+            for name, value in _pool_stats(self.inner).items():
+                metrics.set_gauge(f"upstream.pool.{name}", value)
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            metrics = get_metrics()
+            metrics.incr("upstream.requests")
+            self.active += 1
+            self._update()
+            start = time.perf_counter()
+            try:
+                response = await self.inner.handle_async_request(request)
+            except Exception:
+                self.active -= 1
+                metrics.incr("upstream.errors")
+                self._update()
+                raise
+            metrics.observe("upstream.time_to_headers", time.perf_counter() - start)
+            response.stream = _MeteredStream(response.stream, self)
+            return response
+
+        async def aclose(self):
+            await self.inner.aclose()
+
+    class _MeteredStream(httpx.AsyncByteStream):
+        """响应体读完或关闭时才算请求结束（流式响应可能持续很久）"""
+
+        def __init__(self, inner, owner: MeteredTransport):
+            self.inner = inner
+            self.owner = owner
+            self.closed = False
+
+        async def __aiter__(self):
+            async for chunk in self.inner:
+                yield chunk
+
+        async def aclose(self):
+            if not self.closed:
+                self.closed = True
+                self.owner.active -= 1
+            await self.inner.aclose()
+            self.owner._update()
+
+    return MeteredTransport(transport)
+
+
+def _http2_enabled() -> bool:
+    if os.getenv("UPSTREAM_HTTP2", "1") != "1":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("[upstream] 未安装 h2，上游连接使用 HTTP/1.1（pip install 'httpx[http2]' 启用 HTTP/2）")
+        return False
+    return True
+
+
+_upstream_client: Optional["httpx.AsyncClient"] = None
+_upstream_transport = None
+
+
+def get_upstream_client() -> "httpx.AsyncClient":
+    """获取上游 HTTP 客户端单例"""
+    import httpx
+
+    global _upstream_client, _upstream_transport
+    if _upstream_client is None:
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "60")),
+        )
+        timeout = httpx.Timeout(
+            float(os.getenv("UPSTREAM_TIMEOUT", "60")),
+            connect=float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10")),
+        )
+        http2 = _http2_enabled()
+        # 禁用代理以避免 whistle 等代理工具干扰
+        _upstream_transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2, trust_env=False)
+        _upstream_client = httpx.AsyncClient(
+            transport=_make_metered_transport(_upstream_transport),
+            timeout=timeout,
+            trust_env=False,
+        )
+        logger.info(
+            f"[upstream] 连接池已创建: max_connections={limits.max_connections}, "
+            f"max_keepalive={limits.max_keepalive_connections}, http2={http2}"
+        )
+    return _upstream_client
+
+
+async def warm_up_upstream(base_url: str):
+    """
+    预热上游连接：解析 DNS 并建立 UPSTREAM_WARM_CONNECTIONS 条连接（含 TLS 握手）
+
+    只发送 HEAD 请求，响应状态码无关紧要；失败只记录日志，不影响启动
+    """
+    count = int(os.getenv("UPSTREAM_WARM_CONNECTIONS", "2"))
+    if count <= 0:
+        return
+    metrics = get_metrics()
+    client = get_upstream_client()
+    parts = urlsplit(base_url)
+    start = time.perf_counter()
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        await asyncio.get_running_loop().getaddrinfo(parts.hostname, port)
+        # HTTP/2 下一条连接即可承载并发请求，HTTP/1.1 需要并发请求才能建立多条连接
+        await asyncio.gather(*(client.head(base_url) for _ in range(count)))
+        metrics.observe("upstream.warm_up", time.perf_counter() - start)
+        logger.info(f"[upstream] 上游连接预热完成: {parts.hostname}，耗时 {time.perf_counter() - start:.3f}s")
+    except Exception as e:
+        metrics.incr("upstream.warm_up_failed")
+        logger.warning(f"[upstream] 上游连接预热失败: {e}")
+
+
+async def ensure_upstream_connection(base_url: str) -> bool:
+    """
+    连接池中没有可用连接时提前建立一条，供紧接着的 LLM 请求复用
+
+    与图表读取等步骤并行调用，把 DNS 解析和 TCP/TLS 握手移出关键路径；
+    已有可用连接时直接返回（HTTP/2 连接即使有进行中的请求也能多路复用，不要求空闲）。
+    失败只记录日志，由后续请求自行建连
+
+    Returns:
+        是否新建了连接
+    """
+    client = get_upstream_client()
+    if _pool_stats(_upstream_transport).get("available", 0) > 0:
+        return False
+    metrics = get_metrics()
+    try:
+        with metrics.timer("upstream.connect_ahead"):
+            await client.head(base_url)
+        return True
+    except Exception as e:
+        metrics.incr("upstream.connect_ahead_failed")
+        logger.warning(f"[upstream] 提前建立连接失败: {e}")
+        return False
+
+
+async def close_upstream_client():
+    """关闭上游 HTTP 客户端"""
+    global _upstream_client, _upstream_transport
+    if _upstream_client is not None:
+        await _upstream_client.aclose()
+        _upstream_client = None
+        _upstream_transport = None
@@ -0,0 +1,106 @@
+"""
+用户意图预分类
+在构建 GLM 消息之前，用本地关键字规则快速判断本轮对话的意图：
+- greeting: 打招呼、感谢、告别
+- question: 询问助手能力或一般性问题
+- create_diagram: 创建新图表
+- edit_diagram: 修改当前图表
+
+寒暄和提问走轻量提示词，不附带图表上下文，也无需从 MCP 获取当前图表。
+分类偏保守：只要消息中出现任何与图表相关的词，就走完整的图表流程；
+询问当前图表的问题（“这个图是什么意思”）同样需要图表上下文，不按提问处理。
+"""
+import re
+from typing import Optional
+
+GREETING = "greeting"
+QUESTION = "question"
+CREATE_DIAGRAM = "create_diagram"
+EDIT_DIAGRAM = "edit_diagram"
+
+CONVERSATIONAL_INTENTS = (GREETING, QUESTION)
+
+GREETING_KEYWORDS = [
+    "你好", "您好", "嗨", "哈喽", "早上好", "中午好", "下午好", "晚上好", "早安", "晚安",
+    "谢谢", "感谢", "多谢", "辛苦了", "再见", "拜拜",
+    "hello", "hi", "hey", "thanks", "thank you", "bye",
+]
+
+QUESTION_KEYWORDS = [
+    "你能做什么", "你会什么", "你是谁", "能力", "功能", "帮我什么", "怎么用", "如何使用",
+    "什么是", "为什么", "是什么", "区别", "介绍一下",
+]
+
+CREATE_KEYWORDS = [
+    "画", "绘制", "创建", "生成", "做一个", "做个", "设计一个", "新建", "重新",
+    "流程图", "架构图", "思维导图", "脑图", "组织架构", "时序图", "类图", "用例图", "拓扑",
+    "draw", "create", "diagram", "chart",
+]
+
+EDIT_KEYWORDS = [
+    "修改", "改成", "改为", "改一下", "换成", "替换", "删除", "删掉", "去掉", "移除",
+    "添加", "增加", "加上", "加一个", "插入", "移动", "调整", "对齐", "颜色", "变成",
+    "放大", "缩小", "连线", "连接", "节点", "布局",
+    "edit", "change", "delete", "remove", "add", "move", "rename",
+]
+
+# 提到图表本身（询问、评价当前图表）的词，需要附带当前图表
+DIAGRAM_REFERENCE_KEYWORDS = [
+    "图", "这张", "当前", "画布", "节点", "模块",
+    "canvas", "node",
+]
+
+# 英文关键字需要按单词匹配，避免 "this" 命中 "hi"
+_ASCII_WORD = re.compile(r"^[a-z ]+$")
+
+# 超过该长度的消息不视为寒暄
+_MAX_GREETING_LENGTH = 24
+
+
+def _contains(text: str, keywords) -> bool:
+    for kw in keywords:
+        if _ASCII_WORD.match(kw):
+            if re.search(rf"\b{re.escape(kw)}\b", text):
+                return True
+        elif kw in text:
+            return True
+    return False
+
+
+def classify_intent(message: str, has_diagram: Optional[bool] = None) -> str:
+    """
+    判断用户消息的意图
+
+    Args:
+        message: 用户消息
+        has_diagram: 当前是否已有图表（未知时为 None），用于区分创建与修改
+
+    Returns:
+        greeting / question / create_diagram / edit_diagram
+    """
+    text = message.strip().lower()
+
+    wants_edit = _contains(text, EDIT_KEYWORDS)
+    wants_create = _contains(text, CREATE_KEYWORDS)
+
+    if wants_edit:
+        # 出现修改类动词，但画布为空时按创建处理
+        return EDIT_DIAGRAM if has_diagram is not False else CREATE_DIAGRAM
+    if wants_create:
+        return CREATE_DIAGRAM
+    if _contains(text, DIAGRAM_REFERENCE_KEYWORDS):
+        # 询问当前图表：走完整流程，读取并附带当前图表
+        return EDIT_DIAGRAM if has_diagram is not False else CREATE_DIAGRAM
+
+    if len(text) <= _MAX_GREETING_LENGTH and _contains(text, GREETING_KEYWORDS):
+        return GREETING
+    if _contains(text, QUESTION_KEYWORDS):
+        return QUESTION
+
+    # 无法确定时走完整的图表流程，由模型自行判断
+    return EDIT_DIAGRAM if has_diagram else CREATE_DIAGRAM
+
+
+def is_conversational(intent: Optional[str]) -> bool:
+    """是否为无需图表上下文的对话类意图"""
+    return intent in CONVERSATIONAL_INTENTS
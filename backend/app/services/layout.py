@@ -0,0 +1,845 @@
+"""
+图表自动布局
+在 display_diagram 之前对解析后的 mxGraph 模型计算节点坐标，
+模型只需描述拓扑（节点、连线、分组），无需输出绝对坐标
+
+布局算法（纯 Python 实现）：
+- layered: 分层布局（Sugiyama），用于流程图
+- tree: 自顶向下的树布局，用于组织架构图
+- mindmap: 中心主题向左右两侧展开，用于思维导图
+- grid: 网格布局，用于架构图
+
+容器（泳道、分组框）先布局其子节点，再按内容大小参与上一层布局。
+"""
+import logging
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+LAYERED = "layered"
+TREE = "tree"
+MINDMAP = "mindmap"
+GRID = "grid"
+
+# 模型返回的 layout 字段或图表类型到布局算法的映射
+LAYOUT_ALIASES = {
+    "layered": LAYERED, "flowchart": LAYERED, "sugiyama": LAYERED, "dag": LAYERED,
+    "tree": TREE, "orgchart": TREE, "org": TREE, "hierarchy": TREE,
+    "mindmap": MINDMAP, "mind_map": MINDMAP,
+    "grid": GRID, "architecture": GRID,
+}
+
+# 间距
+MARGIN = 40
+NODE_GAP = 40
+LAYER_GAP = 60
+CONTAINER_PADDING = 20
+SWIMLANE_HEADER = 30
+
+# 缺省尺寸
+DEFAULT_SIZE = (120, 60)
+MAX_AUTO_WIDTH = 240
+
+# 交叉最小化的扫描轮数，连续若干轮没有改进时提前结束
+_ORDER_ITERATIONS = 12
+_ORDER_PATIENCE = 4
+# 超过该规模（含虚拟节点）的图只做少量扫描，避免大图阻塞过久
+_LARGE_GRAPH = 2000
+# 坐标对齐的迭代轮数
+_ALIGN_ITERATIONS = 4
+
+Size = Tuple[float, float]
+Point = Tuple[float, float]
+
+
+def default_size(style: str, label: str) -> Size:
+    """按形状给出缺省尺寸，长文本适当加宽"""
+    style = style or ""
+    if "ellipse" in style and "shape=cloud" not in style:
+        width, height = 80, 40
+    elif "rhombus" in style:
+        width, height = 100, 80
+    elif "cylinder" in style:
+        width, height = 80, 100
+    elif "umlActor" in style:
+        width, height = 30, 60
+    else:
+        width, height = DEFAULT_SIZE
+    # 中文字符约 14px，去掉 HTML 标签和换行后估算
+    text = re.sub(r"<[^>]+>", "", label or "")
+    longest = max((len(line) for line in re.split(r"\n|&#xa;", text)), default=0)
+    if "umlActor" not in style:
+        width = max(width, min(MAX_AUTO_WIDTH, longest * 14 + 20))
+    return float(width), float(height)
+
+
+def _resolve_layout(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    return LAYOUT_ALIASES.get(str(name).strip().lower())
+
+
+# ----------------------------------------------------------------------
+# 布局算法：输入节点 id、有向边和尺寸，输出左上角坐标（从 0 开始）
+# ----------------------------------------------------------------------
+
+def _break_cycles(nodes: List[str], edges: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """DFS 找出回边并反转，得到无环图"""
+    succ = defaultdict(list)
+    for u, v in edges:
+        succ[u].append(v)
+    state: Dict[str, int] = {}  # 1: 在栈上, 2: 已完成
+    back = set()
+    for start in nodes:
+        if start in state:
+            continue
+        state[start] = 1
+        stack = [(start, iter(succ[start]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if state.get(child) == 1:
+                    back.add((node, child))
+                elif child not in state:
+                    state[child] = 1
+                    stack.append((child, iter(succ[child])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+    return [(v, u) if (u, v) in back else (u, v) for u, v in edges]
+
+
+def _assign_layers(nodes: List[str], edges: List[Tuple[str, str]]) -> Dict[str, int]:
+    """最长路径分层，再把只有出边的源点下移到紧贴后继的位置"""
+    succ = defaultdict(list)
+    pred = defaultdict(list)
+    indegree = {n: 0 for n in nodes}
+    for u, v in edges:
+        succ[u].append(v)
+        pred[v].append(u)
+        indegree[v] += 1
+
+    layer = {n: 0 for n in nodes}
+    queue = deque(n for n in nodes if indegree[n] == 0)
+    while queue:
+        node = queue.popleft()
+        for child in succ[node]:
+            layer[child] = max(layer[child], layer[node] + 1)
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                queue.append(child)
+
+    for node in nodes:
+        if not pred[node] and succ[node]:
+            layer[node] = min(layer[child] for child in succ[node]) - 1
+    return layer
+
+
+def _count_crossings(upper: List[str], lower: List[str], edges: List[Tuple[str, str]]) -> int:
+    """统计相邻两层之间的交叉数（按上层顺序排序后计算下层位置的逆序对）"""
+    upper_pos = {n: i for i, n in enumerate(upper)}
+    lower_pos = {n: i for i, n in enumerate(lower)}
+    pairs = sorted((upper_pos[u], lower_pos[v]) for u, v in edges if u in upper_pos and v in lower_pos)
+    # 树状数组统计逆序对
+    tree = [0] * (len(lower) + 1)
+    crossings = 0
+    for seen, (_, pos) in enumerate(pairs):
+        i = pos + 1
+        not_greater = 0
+        while i > 0:
+            not_greater += tree[i]
+            i -= i & -i
+        crossings += seen - not_greater
+        i = pos + 1
+        while i <= len(lower):
+            tree[i] += 1
+            i += i & -i
+    return crossings
+
+
+def _order_layers(layers: List[List[str]], edges: List[Tuple[str, str]]) -> List[List[str]]:
+    """重心法交替上下扫描，减少边交叉，保留交叉数最少的结果"""
+    pred = defaultdict(list)
+    succ = defaultdict(list)
+    for u, v in edges:
+        pred[v].append(u)
+        succ[u].append(v)
+    layer_edges = defaultdict(list)
+    index_of = {n: i for i, layer in enumerate(layers) for n in layer}
+    for u, v in edges:
+        layer_edges[index_of[u]].append((u, v))
+
+    def total_crossings(order):
+        return sum(_count_crossings(order[i], order[i + 1], layer_edges[i]) for i in range(len(order) - 1))
+
+    order = [list(layer) for layer in layers]
+    best, best_crossings = [list(layer) for layer in order], total_crossings(order)
+    iterations = _ORDER_ITERATIONS if len(index_of) <= _LARGE_GRAPH else 2
+    stale = 0
+    for iteration in range(iterations):
+        if best_crossings == 0 or stale >= _ORDER_PATIENCE:
+            break
+        downward = iteration % 2 == 0
+        indices = range(1, len(order)) if downward else range(len(order) - 2, -1, -1)
+        for i in indices:
+            ref = order[i - 1] if downward else order[i + 1]
+            ref_pos = {n: p for p, n in enumerate(ref)}
+            neighbours = pred if downward else succ
+
+            def barycenter(item):
+                pos, node = item
+                linked = [ref_pos[n] for n in neighbours[node] if n in ref_pos]
+                return sum(linked) / len(linked) if linked else pos
+
+            order[i] = [n for _, n in sorted(enumerate(order[i]), key=barycenter)]
+        crossings = total_crossings(order)
+        if crossings < best_crossings:
+            best, best_crossings = [list(layer) for layer in order], crossings
+            stale = 0
+        else:
+            stale += 1
+    return best
+
+
+def _pack(desired: List[float], sizes: List[float], gap: float) -> List[float]:
+    """
+    在保持顺序和最小间距的前提下，让各中心点尽量靠近期望位置
+
+    分别从左、从右压紧后取平均，再做一次从左的修正
+    """
+    n = len(desired)
+    if n == 0:
+        return []
+
+    def sep(i):
+        return (sizes[i - 1] + sizes[i]) / 2 + gap
+
+    left = list(desired)
+    for i in range(1, n):
+        left[i] = max(left[i], left[i - 1] + sep(i))
+    right = list(desired)
+    for i in range(n - 2, -1, -1):
+        right[i] = min(right[i], right[i + 1] - sep(i + 1))
+    centers = [(a + b) / 2 for a, b in zip(left, right)]
+    for i in range(1, n):
+        centers[i] = max(centers[i], centers[i - 1] + sep(i))
+    return centers
+
+
+def layered_layout(
+    nodes: List[str],
+    edges: List[Tuple[str, str]],
+    sizes: Dict[str, Size],
+    horizontal: bool = False
+) -> Dict[str, Point]:
+    """
+    分层布局（Sugiyama）
+
+    1. 反转回边去环  2. 最长路径分层  3. 长边插入虚拟节点
+    4. 重心法减少交叉  5. 按邻居重心对齐坐标
+
+    Args:
+        horizontal: True 时从左到右分层，否则从上到下
+    """
+    edges = [(u, v) for u, v in dict.fromkeys(edges) if u != v]
+    edges = _break_cycles(nodes, edges)
+    layer_of = _assign_layers(nodes, edges)
+
+    # breadth 为层内方向的尺寸，depth 为层方向的尺寸
+    def breadth(n):
+        return sizes[n][1] if horizontal else sizes[n][0]
+
+    def depth(n):
+        return sizes[n][0] if horizontal else sizes[n][1]
+
+    # 跨越多层的边拆成经过虚拟节点的短边；虚拟节点过多时（大而稠密的图）
+    # 长边不参与排序和对齐，只保留连线
+    dummy_sizes: Dict[str, float] = {}
+    short_edges = []
+    unique_edges = list(dict.fromkeys(edges))
+    split_long = sum(max(0, layer_of[v] - layer_of[u] - 1) for u, v in unique_edges) <= _LARGE_GRAPH
+    for u, v in unique_edges:
+        span = layer_of[v] - layer_of[u]
+        if span > 1 and not split_long:
+            continue
+        prev = u
+        for k in range(1, span):
+            dummy = f"\0{u}\0{v}\0{k}"
+            layer_of[dummy] = layer_of[u] + k
+            dummy_sizes[dummy] = 0.0
+            short_edges.append((prev, dummy))
+            prev = dummy
+        short_edges.append((prev, v))
+
+    count = max(layer_of.values()) + 1 if layer_of else 0
+    layers: List[List[str]] = [[] for _ in range(count)]
+    for node in list(nodes) + list(dummy_sizes):
+        layers[layer_of[node]].append(node)
+    layers = _order_layers(layers, short_edges)
+
+    def size_of(n):
+        return dummy_sizes[n] if n in dummy_sizes else breadth(n)
+
+    pred = defaultdict(list)
+    succ = defaultdict(list)
+    for u, v in short_edges:
+        pred[v].append(u)
+        succ[u].append(v)
+
+    center: Dict[str, float] = {}
+    for layer in layers:
+        center.update(zip(layer, _pack([0.0] * len(layer), [size_of(n) for n in layer], NODE_GAP)))
+
+    for iteration in range(_ALIGN_ITERATIONS):
+        downward = iteration % 2 == 0
+        indices = range(1, count) if downward else range(count - 2, -1, -1)
+        neighbours = pred if downward else succ
+        for i in indices:
+            layer = layers[i]
+            desired = []
+            for n in layer:
+                linked = neighbours[n]
+                desired.append(sum(center[m] for m in linked) / len(linked) if linked else center[n])
+            center.update(zip(layer, _pack(desired, [size_of(n) for n in layer], NODE_GAP)))
+
+    depths = [max((depth(n) for n in layer if n not in dummy_sizes), default=0.0) for layer in layers]
+    offsets, position = [], 0.0
+    for d in depths:
+        offsets.append(position)
+        position += d + LAYER_GAP
+
+    result = {}
+    for i, layer in enumerate(layers):
+        for n in layer:
+            if n in dummy_sizes:
+                continue
+            b = center[n] - breadth(n) / 2
+            d = offsets[i] + (depths[i] - depth(n)) / 2
+            result[n] = (d, b) if horizontal else (b, d)
+    return _normalize(result)
+
+
+def _spanning_forest(nodes: List[str], edges: List[Tuple[str, str]]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """按输入顺序取生成森林，返回根节点列表和子节点表"""
+    succ = defaultdict(list)
+    has_parent = set()
+    for u, v in edges:
+        if u != v:
+            succ[u].append(v)
+            has_parent.add(v)
+    roots = [n for n in nodes if n not in has_parent] or nodes[:1]
+    children: Dict[str, List[str]] = defaultdict(list)
+    visited = set()
+    for root in roots + nodes:
+        if root in visited:
+            continue
+        if root not in roots:
+            # 环上的节点，作为额外的根
+            roots.append(root)
+        visited.add(root)
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            for child in succ[node]:
+                if child not in visited:
+                    visited.add(child)
+                    children[node].append(child)
+                    queue.append(child)
+    return roots, children
+
+
+def _tree_extents(roots: List[str], children: Dict[str, List[str]], breadth) -> Dict[str, float]:
+    """自底向上计算每棵子树在层内方向上占用的宽度（迭代实现，避免深树递归溢出）"""
+    extent: Dict[str, float] = {}
+    for root in roots:
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                kids = children.get(node, [])
+                total = sum(extent[c] for c in kids) + NODE_GAP * max(0, len(kids) - 1)
+                extent[node] = max(breadth(node), total)
+            else:
+                stack.append((node, True))
+                stack.extend((c, False) for c in children.get(node, []))
+    return extent
+
+
+def _place_tree(
+    root: str,
+    children: Dict[str, List[str]],
+    extent: Dict[str, float],
+    start: float,
+    depth_of_level: List[float],
+    level_offset: List[float],
+    breadth,
+    depth,
+    base_level: int = 0
+) -> Dict[str, Tuple[float, float]]:
+    """把一棵子树放进 [start, start + extent] 区间，父节点居中于子节点之上，返回 (breadth, depth) 坐标"""
+    result = {}
+    stack = [(root, start, base_level)]
+    while stack:
+        node, left, level = stack.pop()
+        kids = children.get(node, [])
+        if kids:
+            total = sum(extent[c] for c in kids) + NODE_GAP * (len(kids) - 1)
+            cursor = left + (extent[node] - total) / 2
+            first_center = cursor + extent[kids[0]] / 2
+            for child in kids:
+                stack.append((child, cursor, level + 1))
+                cursor += extent[child] + NODE_GAP
+            last_center = cursor - NODE_GAP - extent[kids[-1]] / 2
+            mid = (first_center + last_center) / 2
+        else:
+            mid = left + extent[node] / 2
+        d = level_offset[level] + (depth_of_level[level] - depth(node)) / 2
+        result[node] = (mid - breadth(node) / 2, d)
+    return result
+
+
+def _levels(roots: List[str], children: Dict[str, List[str]]) -> Dict[str, int]:
+    level = {}
+    queue = deque((r, 0) for r in roots)
+    while queue:
+        node, lv = queue.popleft()
+        level[node] = lv
+        queue.extend((c, lv + 1) for c in children.get(node, []))
+    return level
+
+
+def _level_offsets(level: Dict[str, int], depth) -> Tuple[List[float], List[float]]:
+    count = max(level.values()) + 1 if level else 0
+    depths = [0.0] * count
+    for node, lv in level.items():
+        depths[lv] = max(depths[lv], depth(node))
+    offsets, position = [], 0.0
+    for d in depths:
+        offsets.append(position)
+        position += d + LAYER_GAP
+    return depths, offsets
+
+
+def tree_layout(
+    nodes: List[str],
+    edges: List[Tuple[str, str]],
+    sizes: Dict[str, Size],
+    horizontal: bool = False
+) -> Dict[str, Point]:
+    """
+    树布局：父节点居中于子树之上，多棵树并排放置
+
+    非树边（多父节点、环）不参与布局，只保留连线
+    """
+    roots, children = _spanning_forest(nodes, edges)
+
+    def breadth(n):
+        return sizes[n][1] if horizontal else sizes[n][0]
+
+    def depth(n):
+        return sizes[n][0] if horizontal else sizes[n][1]
+
+    extent = _tree_extents(roots, children, breadth)
+    depths, offsets = _level_offsets(_levels(roots, children), depth)
+
+    result = {}
+    cursor = 0.0
+    for root in roots:
+        placed = _place_tree(root, children, extent, cursor, depths, offsets, breadth, depth)
+        for node, (b, d) in placed.items():
+            result[node] = (d, b) if horizontal else (b, d)
+        cursor += extent[root] + NODE_GAP
+    return _normalize(result)
+
+
+def mindmap_layout(
+    nodes: List[str],
+    edges: List[Tuple[str, str]],
+    sizes: Dict[str, Size]
+) -> Dict[str, Point]:
+    """
+    思维导图布局：中心主题居中，一级分支按子树大小均衡分到左右两侧，向外水平展开
+
+    存在多个中心主题时自上而下依次排列
+    """
+    undirected = [(u, v) for u, v in edges if u != v]
+    roots, children = _spanning_forest(nodes, undirected)
+    # 以度数最高的节点为中心，重新生成无向的生成树
+    degree = defaultdict(int)
+    for u, v in undirected:
+        degree[u] += 1
+        degree[v] += 1
+    adjacency = defaultdict(list)
+    for u, v in undirected:
+        adjacency[u].append(v)
+        adjacency[v].append(u)
+
+    def breadth(n):
+        return sizes[n][1]
+
+    def depth(n):
+        return sizes[n][0]
+
+    result = {}
+    visited = set()
+    top = 0.0
+    for root in roots:
+        component = []
+        queue = deque([root])
+        seen = {root}
+        while queue:
+            node = queue.popleft()
+            component.append(node)
+            for m in adjacency[node]:
+                if m not in seen:
+                    seen.add(m)
+                    queue.append(m)
+        if visited & seen:
+            continue
+        visited |= seen
+        center = max(enumerate(component), key=lambda item: (degree[item[1]], -item[0]))[1]
+
+        tree_children: Dict[str, List[str]] = defaultdict(list)
+        queue = deque([center])
+        reached = {center}
+        while queue:
+            node = queue.popleft()
+            for m in adjacency[node]:
+                if m not in reached:
+                    reached.add(m)
+                    tree_children[node].append(m)
+                    queue.append(m)
+
+        extent = _tree_extents([center], tree_children, breadth)
+        sides = ([], [])
+        weights = [0.0, 0.0]
+        for branch in tree_children[center]:
+            # 右侧优先，保持与常见思维导图一致
+            side = 0 if weights[0] <= weights[1] else 1
+            sides[side].append(branch)
+            weights[side] += extent[branch] + NODE_GAP
+
+        cw, ch = sizes[center]
+        height = max([ch] + weights)
+        component_result = {center: (0.0, top + (height - ch) / 2)}
+        for side, branches in enumerate(sides):
+            if not branches:
+                continue
+            level = _levels(branches, tree_children)
+            depths, offsets = _level_offsets(level, depth)
+            cursor = top + (height - weights[side] + NODE_GAP) / 2
+            for branch in branches:
+                placed = _place_tree(branch, tree_children, extent, cursor, depths, offsets, breadth, depth)
+                for node, (b, d) in placed.items():
+                    if side == 0:
+                        x = cw + LAYER_GAP + d
+                    else:
+                        x = -LAYER_GAP - d - sizes[node][0]
+                    component_result[node] = (x, b)
+                cursor += extent[branch] + NODE_GAP
+        result.update(component_result)
+        bottom = max(y + sizes[n][1] for n, (_, y) in component_result.items())
+        top = bottom + LAYER_GAP
+    return _normalize(result)
+
+
+def grid_layout(
+    nodes: List[str],
+    edges: List[Tuple[str, str]],
+    sizes: Dict[str, Size]
+) -> Dict[str, Point]:
+    """
+    网格布局：按连通关系的广度优先顺序填入网格，相连的组件尽量相邻
+    """
+    adjacency = defaultdict(list)
+    for u, v in edges:
+        adjacency[u].append(v)
+        adjacency[v].append(u)
+    ordered, seen = [], set()
+    for start in nodes:
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            ordered.append(node)
+            for m in adjacency[node]:
+                if m not in seen:
+                    seen.add(m)
+                    queue.append(m)
+
+    columns = max(1, math.ceil(math.sqrt(len(ordered))))
+    cell_w = max((sizes[n][0] for n in ordered), default=0) + NODE_GAP
+    cell_h = max((sizes[n][1] for n in ordered), default=0) + LAYER_GAP
+    result = {}
+    for i, node in enumerate(ordered):
+        row, col = divmod(i, columns)
+        w, h = sizes[node]
+        result[node] = (col * cell_w + (cell_w - NODE_GAP - w) / 2, row * cell_h + (cell_h - LAYER_GAP - h) / 2)
+    return _normalize(result)
+
+
+def _normalize(positions: Dict[str, Point]) -> Dict[str, Point]:
+    """平移到从 (0, 0) 开始，并对齐到整数像素"""
+    if not positions:
+        return positions
+    min_x = min(x for x, _ in positions.values())
+    min_y = min(y for _, y in positions.values())
+    return {n: (round(x - min_x), round(y - min_y)) for n, (x, y) in positions.items()}
+
+
+def infer_layout(nodes: List[str], edges: List[Tuple[str, str]], edge_styles: List[str] = ()) -> str:
+    """
+    根据拓扑推断布局算法
+
+    - 没有连线：网格
+    - 无箭头连线构成的树：思维导图
+    - 分叉较多的树：树布局
+    - 其他：分层布局
+    """
+    if not edges:
+        return GRID
+    indegree = defaultdict(int)
+    outdegree = defaultdict(int)
+    for u, v in edges:
+        indegree[v] += 1
+        outdegree[u] += 1
+    is_forest = all(indegree[n] <= 1 for n in nodes) and len(edges) < len(nodes)
+    if is_forest and edge_styles and all("endArrow=none" in (s or "") for s in edge_styles):
+        return MINDMAP
+    if is_forest and max(outdegree.values()) >= 3:
+        return TREE
+    return LAYERED
+
+
+# ----------------------------------------------------------------------
+# mxGraph 模型处理
+# ----------------------------------------------------------------------
+
+class _Cell:
+    """mxCell 的布局视图（兼容 UserObject 包装）"""
+
+    def __init__(self, wrapper: ET.Element, cell: ET.Element):
+        self.id = wrapper.get("id") or cell.get("id")
+        self.cell = cell
+        self.parent = cell.get("parent")
+        self.label = wrapper.get("label") or cell.get("value") or ""
+        self.style = cell.get("style") or ""
+        self.is_vertex = cell.get("vertex") == "1"
+        self.is_edge = cell.get("edge") == "1"
+        self.source = cell.get("source")
+        self.target = cell.get("target")
+
+    @property
+    def geometry(self) -> ET.Element:
+        geo = self.cell.find("mxGeometry")
+        if geo is None:
+            geo = ET.SubElement(self.cell, "mxGeometry", {"as": "geometry"})
+        return geo
+
+    def has_position(self) -> bool:
+        geo = self.cell.find("mxGeometry")
+        return geo is not None and geo.get("x") is not None and geo.get("y") is not None
+
+    def size(self) -> Size:
+        geo = self.cell.find("mxGeometry")
+        default = default_size(self.style, self.label)
+        if geo is None:
+            return default
+        try:
+            return float(geo.get("width") or default[0]), float(geo.get("height") or default[1])
+        except ValueError:
+            return default
+
+    def box(self) -> Tuple[float, float, float, float]:
+        geo = self.cell.find("mxGeometry")
+        width, height = self.size()
+        try:
+            return float(geo.get("x") or 0), float(geo.get("y") or 0), width, height
+        except ValueError:
+            return 0.0, 0.0, width, height
+
+    def set_box(self, x: float, y: float, width: float, height: float):
+        geo = self.geometry
+        for key, value in (("x", x), ("y", y), ("width", width), ("height", height)):
+            geo.set(key, str(int(round(value))))
+
+
+def _overlaps(cells: List[_Cell]) -> bool:
+    """同一父节点下的节点是否有重叠（按 x 排序后扫描）"""
+    boxes = sorted(c.box() for c in cells)
+    for i, (x, y, w, h) in enumerate(boxes):
+        for ox, oy, ow, oh in boxes[i + 1:]:
+            if ox >= x + w:
+                break
+            if oy < y + h and y < oy + oh:
+                return True
+    return False
+
+
+class LayoutEngine:
+    """mxGraph 自动布局"""
+
+    def __init__(self, mode: str = None):
+        # auto: 缺少坐标或存在重叠时布局；always: 始终重新布局；off: 关闭
+        self.mode = (mode or os.getenv("LAYOUT_MODE", "auto")).lower()
+
+    def apply(self, xml: str, layout: Optional[str] = None) -> str:
+        """
+        对 mxGraphModel XML 执行自动布局
+
+        Args:
+            xml: 完整的 mxGraphModel XML
+            layout: 布局算法或图表类型提示（flowchart / tree / mindmap / grid 等），为空时按拓扑推断
+
+        Returns:
+            布局后的 XML；无需布局或无法解析时原样返回
+        """
+        if self.mode == "off" or not xml:
+            return xml
+        metrics = get_metrics()
+        try:
+            model = ET.fromstring(xml)
+        except ET.ParseError:
+            return xml
+        root = model if model.tag == "root" else model.find("root")
+        if root is None:
+            return xml
+
+        with metrics.timer("layout.duration"):
+            changed = self._layout_model(root, _resolve_layout(layout))
+        if not changed:
+            metrics.incr("layout.skipped")
+            return xml
+        metrics.incr("layout.applied")
+        return ET.tostring(model, encoding="unicode")
+
+    def _layout_model(self, root: ET.Element, layout: Optional[str]) -> bool:
+        cells: Dict[str, _Cell] = {}
+        for element in root:
+            inner = element if element.tag == "mxCell" else element.find("mxCell")
+            if inner is None:
+                continue
+            cell = _Cell(element, inner)
+            if cell.id:
+                cells[cell.id] = cell
+
+        # 既不是节点也不是连线的单元格为根单元格和图层
+        layers = {cid for cid, c in cells.items() if not c.is_vertex and not c.is_edge}
+        vertices = {cid for cid, c in cells.items() if c.is_vertex and cid not in layers}
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for cid, cell in cells.items():
+            if cid in vertices:
+                groups[cell.parent].append(cid)
+        edges = [c for c in cells.values() if c.is_edge and c.source in vertices and c.target in vertices]
+
+        def ancestor_in(group: str, cid: str) -> Optional[str]:
+            """cid 在 group 下的直接子节点祖先"""
+            seen = set()
+            while cid in cells and cid not in seen:
+                seen.add(cid)
+                if cells[cid].parent == group:
+                    return cid
+                cid = cells[cid].parent
+            return None
+
+        # 自底向上处理：先布局容器内部，再布局外层
+        order, stack = [], [g for g in groups if g in layers]
+        while stack:
+            group = stack.pop()
+            order.append(group)
+            stack.extend(c for c in groups.get(group, []) if c in groups)
+
+        positioned = {cid: cells[cid].has_position() for cid in vertices}
+        changed_groups = set()
+        for group in reversed(order):
+            members = groups[group]
+            member_cells = [cells[m] for m in members]
+            is_container = group not in layers
+            needs = self.mode == "always" or not all(positioned[m] for m in members) or _overlaps(member_cells)
+            if needs:
+                group_edges, edge_styles = [], []
+                for edge in edges:
+                    u, v = ancestor_in(group, edge.source), ancestor_in(group, edge.target)
+                    if u and v and u != v:
+                        group_edges.append((u, v))
+                        edge_styles.append(edge.style)
+                sizes = {m: cells[m].size() for m in members}
+                algorithm = layout if layout and not is_container else infer_layout(members, group_edges, edge_styles)
+                positions = self._run(algorithm, members, group_edges, sizes)
+                if is_container:
+                    dx, dy = self._container_offset(cells[group])
+                else:
+                    dx = dy = MARGIN
+                for m in members:
+                    x, y = positions[m]
+                    cells[m].set_box(x + dx, y + dy, *sizes[m])
+                logger.info(f"[layout] {algorithm} 布局 {len(members)} 个节点（父节点 {group}）")
+                changed_groups.add(group)
+
+            if is_container and (needs or not positioned[group]):
+                self._fit_container(cells[group], member_cells)
+                changed_groups.add(group)
+
+        if changed_groups:
+            # 坐标改变后，连线上原有的折点不再有效；只描述拓扑的连线补上相对几何
+            laid_out = {m for g in changed_groups for m in groups.get(g, [])}
+            for edge in edges:
+                geo = edge.cell.find("mxGeometry")
+                if geo is None:
+                    ET.SubElement(edge.cell, "mxGeometry", {"relative": "1", "as": "geometry"})
+                elif edge.source in laid_out or edge.target in laid_out:
+                    points = geo.find("Array")
+                    if points is not None:
+                        geo.remove(points)
+        return bool(changed_groups)
+
+    @staticmethod
+    def _run(algorithm: str, nodes, edges, sizes) -> Dict[str, Point]:
+        if algorithm == TREE:
+            return tree_layout(nodes, edges, sizes)
+        if algorithm == MINDMAP:
+            return mindmap_layout(nodes, edges, sizes)
+        if algorithm == GRID:
+            return grid_layout(nodes, edges, sizes)
+        return layered_layout(nodes, edges, sizes)
+
+    @staticmethod
+    def _container_offset(container: _Cell) -> Point:
+        """子节点相对容器的起始偏移，泳道需要让出标题栏"""
+        header = 0
+        if "swimlane" in container.style:
+            match = re.search(r"startSize=(\d+)", container.style)
+            header = int(match.group(1)) if match else SWIMLANE_HEADER
+        if "horizontal=0" in container.style:
+            return CONTAINER_PADDING + header, CONTAINER_PADDING
+        return CONTAINER_PADDING, CONTAINER_PADDING + header
+
+    def _fit_container(self, container: _Cell, members: List[_Cell]):
+        """按子节点包围盒调整容器大小"""
+        if not members:
+            return
+        right = max(x + w for x, _, w, _ in (m.box() for m in members))
+        bottom = max(y + h for _, y, _, h in (m.box() for m in members))
+        x, y, width, height = container.box() if container.has_position() else (0, 0, 0, 0)
+        container.set_box(x, y, max(width, right + CONTAINER_PADDING), max(height, bottom + CONTAINER_PADDING))
+
+
+_layout_engine: Optional[LayoutEngine] = None
+
+
+def get_layout_engine() -> LayoutEngine:
+    """获取布局引擎单例"""
+    global _layout_engine
+    if _layout_engine is None:
+        _layout_engine = LayoutEngine()
+    return _layout_engine
@@ -0,0 +1,38 @@
+"""
+事件循环延迟监控
+后台任务每隔 LOOP_LAG_INTERVAL 秒休眠一次，实际唤醒时间比预期晚多少，
+事件循环就被阻塞了多久。记录为 loop.lag 分布（/metrics 中查看 p95 / max），
+用于发现在事件循环中执行的 CPU 密集操作（见 app.services.cpu_pool）。
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+async def monitor_loop_lag(interval: float = None):
+    """持续测量事件循环延迟，直到被取消"""
+    interval = interval or float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+    # 超过该值时记录警告日志（秒）
+    warn_threshold = float(os.getenv("LOOP_LAG_WARN", "0.1"))
+    metrics = get_metrics()
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        metrics.observe("loop.lag", lag)
+        metrics.set_gauge("loop.lag", round(lag, 6))
+        if lag > warn_threshold:
+            logger.warning(f"[loop] 事件循环被阻塞 {lag * 1000:.0f}ms")
+
+
+def start_loop_monitor() -> Optional[asyncio.Task]:
+    """启动监控任务，LOOP_LAG_INTERVAL=0 时不启动"""
+    if float(os.getenv("LOOP_LAG_INTERVAL", "0.1")) <= 0:
+        return None
+    return asyncio.create_task(monitor_loop_lag())
@@ -12,15 +12,122 @@ import json
 import asyncio
 import logging
 import re
+import time
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, List, Optional
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Any, List, Optional, Tuple
 from contextlib import AsyncExitStack
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from app.services.cpu_pool import run_cpu
+from app.services.diagram_index import get_index_cache
+from app.services.metrics import get_metrics
+
+if TYPE_CHECKING:
+    from mcp import ClientSession
 
 logger = logging.getLogger(__name__)
 
+# 会改变图表的工具，调用前后都会使读取缓存失效
+_WRITE_TOOLS = {"start_session", "display_diagram", "edit_diagram"}
+
+
+def validate_and_fix_xml(xml: str) -> tuple[bool, str, str]:
+    """
+    验证并尝试修复 XML
+    
+    Args:
+        xml: 原始 XML 字符串
+        
+    Returns:
+        (is_valid, fixed_xml, error_message)
+    """
+    # 先尝试直接解析
+    try:
+        ET.fromstring(xml)
+        return True, xml, ""
+    except ET.ParseError as e:
+        logger.warning(f"[XML验证] 原始 XML 解析失败: {e}")
+    
+    fixed_xml = xml
+    
+    # 修复1: 移除 XML 前后的空白和杂字符
+    fixed_xml = fixed_xml.strip()
+    
+    # 修复2: 确保以 <mxGraphModel 开头
+    if not fixed_xml.startswith('<mxGraphModel'):
+        match = re.search(r'<mxGraphModel[\s\S]*</mxGraphModel>', fixed_xml)
+        if match:
+            fixed_xml = match.group()
+            logger.info("[XML修复] 提取了 mxGraphModel 内容")
+    
+    # 修复3: 确保 </mxGraphModel> 闭合标签存在
+    if '<mxGraphModel' in fixed_xml and '</mxGraphModel>' not in fixed_xml:
+        fixed_xml = fixed_xml + '</mxGraphModel>'
+        logger.info("[XML修复] 添加了 </mxGraphModel> 闭合标签")
+    
+    # 修复4: 确保 </root> 闭合标签存在
+    if '<root>' in fixed_xml and '</root>' not in fixed_xml:
+        # 在 </mxGraphModel> 前插入 </root>
+        fixed_xml = fixed_xml.replace('</mxGraphModel>', '</root></mxGraphModel>')
+        logger.info("[XML修复] 添加了 </root> 闭合标签")
+    
+    # 修复5: 修复未闭合的 mxCell 标签（自闭合）
+    # 查找 <mxCell ...> 后面没有 </mxCell> 或 /> 的情况
+    def fix_unclosed_mxcell(match):
+        content = match.group(0)
+        # 如果已经是自闭合或有闭合标签，保持不变
+        if content.rstrip().endswith('/>') or '</mxCell>' in content:
+            return content
+        # 检查是否包含 mxGeometry 子元素
+        if '<mxGeometry' in content:
+            # 确保 mxGeometry 是自闭合的
+            content = re.sub(r'<mxGeometry([^>]*)>\s*</mxGeometry>', r'<mxGeometry\1/>', content)
+            content = re.sub(r'<mxGeometry([^/])>(?!</mxGeometry>)', r'<mxGeometry\1/>', content)
+        return content
+    
+    # 再次尝试解析
+    try:
+        ET.fromstring(fixed_xml)
+        logger.info("[XML修复] 修复成功")
+        return True, fixed_xml, ""
+    except ET.ParseError as e:
+        error_msg = str(e)
+        logger.error(f"[XML验证] 修复后仍然失败: {error_msg}")
+        logger.error(f"[XML验证] XML 前200字符: {fixed_xml[:200]}")
+        logger.error(f"[XML验证] XML 后200字符: {fixed_xml[-200:]}")
+        return False, fixed_xml, error_msg
+
+
+def wrap_as_drawio_file(xml: str) -> str:
+    """
+    将 mxGraphModel XML 包装为完整的 .drawio 文件格式
+    """
+    # 如果已经是完整的 mxfile 格式，直接返回
+    if '<mxfile' in xml:
+        return xml
+    
+    # 如果是 mxGraphModel 格式，包装为 mxfile
+    if '<mxGraphModel' in xml:
+        return f'''<?xml version="1.0" encoding="UTF-8"?>
+<mxfile host="drawio-ai" modified="2024-01-01T00:00:00.000Z" agent="DrawIO AI" version="1.0.0">
+  <diagram id="default" name="Page-1">
+{xml}
+  </diagram>
+</mxfile>'''
+    
+    # 其他情况，尝试作为 diagram 内容
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<mxfile host="drawio-ai" modified="2024-01-01T00:00:00.000Z" agent="DrawIO AI" version="1.0.0">
+  <diagram id="default" name="Page-1">
+<mxGraphModel dx="1434" dy="780" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="827" pageHeight="1169" math="0" shadow="0">
+  <root>
+    <mxCell id="0" />
+    <mxCell id="1" parent="0" />
+{xml}
+  </root>
+</mxGraphModel>
+  </diagram>
+</mxfile>'''
+
 
 class DrawioMCPClient:
     """
@@ -43,54 +150,134 @@ class DrawioMCPClient:
         self.sessions: Dict[str, Any] = {}
         
         # MCP 客户端状态
-        self._client_session: Optional[ClientSession] = None
-        self._exit_stack: Optional[AsyncExitStack] = None
+        self._client_session: Optional["ClientSession"] = None
+        self._connection_task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
         self._initialized = False
         self._lock = asyncio.Lock()
+        
+        # 读取合并：相同的并发读取共用一次进行中的调用，结果短暂缓存
+        self.read_cache_ttl = float(os.getenv("MCP_READ_CACHE_TTL", "0.5"))
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._read_cache: Dict[str, Tuple[float, Any]] = {}
+        # 每次写入前后递增，读取期间发生过写入时结果不缓存
+        self._generation = 0
     
-    async def _ensure_connected(self) -> ClientSession:
+    async def _ensure_connected(self) -> "ClientSession":
         """
         确保与 MCP Server 建立连接
-        使用懒加载模式，第一次调用时建立连接
+        使用懒加载模式，第一次调用时建立连接；mcp 包导入较慢，也推迟到此时导入
+        
+        连接由专门的后台任务建立和关闭：stdio 连接基于 anyio 的取消范围，
+        必须在同一个任务中进入和退出，调用方（请求、启动预热任务）可能各不相同
         """
         async with self._lock:
             if self._client_session is not None and self._initialized:
                 return self._client_session
             
-            logger.info(f"正在连接 MCP Server: {self.server_command} {' '.join(self.server_args)}")
-            
-            # 创建服务器参数
-            server_params = StdioServerParameters(
-                command=self.server_command,
-                args=self.server_args,
-                env=None  # 继承当前环境变量
-            )
-            
-            # 创建退出栈管理资源
-            self._exit_stack = AsyncExitStack()
-            
-            # 建立 stdio 连接
-            stdio_transport = await self._exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            
-            # 创建客户端会话
-            read_stream, write_stream = stdio_transport
-            self._client_session = await self._exit_stack.enter_async_context(
-                ClientSession(read_stream, write_stream)
-            )
-            
-            # 初始化会话
-            await self._client_session.initialize()
-            self._initialized = True
-            
-            logger.info("MCP Server 连接成功")
-            
-            # 列出可用工具（用于调试）
-            tools = await self._client_session.list_tools()
-            logger.info(f"可用工具: {[t.name for t in tools.tools]}")
-            
-            return self._client_session
+            ready = asyncio.get_running_loop().create_future()
+            self._closing = asyncio.Event()
+            self._connection_task = asyncio.create_task(self._run_connection(ready))
+            # 调用方被取消不影响连接的建立
+            return await asyncio.shield(ready)
+    
+    async def _run_connection(self, ready: asyncio.Future):
+        """持有 MCP 连接的后台任务：建立连接后等待 close()，在同一任务中释放资源"""
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+        
+        try:
+            async with AsyncExitStack() as exit_stack:
+                logger.info(f"正在连接 MCP Server: {self.server_command} {' '.join(self.server_args)}")
+                
+                # 创建服务器参数
+                server_params = StdioServerParameters(
+                    command=self.server_command,
+                    args=self.server_args,
+                    env=None  # 继承当前环境变量
+                )
+                
+                # 建立 stdio 连接
+                stdio_transport = await exit_stack.enter_async_context(
+                    stdio_client(server_params)
+                )
+                
+                # 创建客户端会话
+                read_stream, write_stream = stdio_transport
+                session = await exit_stack.enter_async_context(
+                    ClientSession(read_stream, write_stream)
+                )
+                
+                # 初始化会话
+                await session.initialize()
+                
+                logger.info("MCP Server 连接成功")
+                
+                # 列出可用工具（用于调试）
+                tools = await session.list_tools()
+                logger.info(f"可用工具: {[t.name for t in tools.tools]}")
+                
+                self._client_session = session
+                self._initialized = True
+                ready.set_result(session)
+                await self._closing.wait()
+        except asyncio.CancelledError:
+            if not ready.done():
+                ready.cancel()
+            raise
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.error(f"MCP 连接异常断开: {e}")
+        finally:
+            self._client_session = None
+            self._initialized = False
+    
+    def _invalidate_reads(self):
+        """写入图表时调用：清空读取缓存，进行中的读取不再被新调用方复用"""
+        self._generation += 1
+        if self._read_cache or self._inflight:
+            get_metrics().incr("mcp.read_cache_invalidations")
+        self._read_cache.clear()
+        self._inflight.clear()
+    
+    async def _coalesced_read(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        合并相同的并发读取
+        
+        - 缓存未过期时直接返回缓存结果；
+        - 已有相同读取在进行中时等待同一个结果，不再单独调用 MCP；
+        - 否则发起调用，完成时若期间没有写入则缓存 read_cache_ttl 秒。
+        
+        单个调用方被取消不会取消共享的调用，其他等待方仍能拿到结果
+        """
+        metrics = get_metrics()
+        cached = self._read_cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            metrics.incr("mcp.read_cache_hits")
+            return cached[1]
+        
+        flight = self._inflight.get(key)
+        if flight is not None:
+            metrics.incr("mcp.coalesced")
+            metrics.incr(f"mcp.coalesced.{key}")
+            return await asyncio.shield(flight)
+        
+        generation = self._generation
+        flight = asyncio.ensure_future(fetch())
+        self._inflight[key] = flight
+        
+        def done(f: asyncio.Future):
+            if self._inflight.get(key) is f:
+                del self._inflight[key]
+            if f.cancelled():
+                return
+            if f.exception() is None and generation == self._generation and self.read_cache_ttl > 0:
+                self._read_cache[key] = (time.monotonic() + self.read_cache_ttl, f.result())
+        
+        flight.add_done_callback(done)
+        return await asyncio.shield(flight)
     
     async def _call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
         """
@@ -103,6 +290,16 @@ class DrawioMCPClient:
         Returns:
             工具返回结果
         """
+        if tool_name not in _WRITE_TOOLS:
+            return await self._invoke_tool(tool_name, arguments)
+        self._invalidate_reads()
+        try:
+            return await self._invoke_tool(tool_name, arguments)
+        finally:
+            self._invalidate_reads()
+    
+    async def _invoke_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        """通过 MCP 会话调用工具并解析结果"""
         session = await self._ensure_connected()
         
         logger.info(f"调用工具: {tool_name}, 参数长度: {len(json.dumps(arguments, ensure_ascii=False))}")
@@ -192,61 +389,7 @@ class DrawioMCPClient:
         Returns:
             (is_valid, fixed_xml, error_message)
         """
-        # 先尝试直接解析
-        try:
-            ET.fromstring(xml)
-            return True, xml, ""
-        except ET.ParseError as e:
-            logger.warning(f"[XML验证] 原始 XML 解析失败: {e}")
-        
-        fixed_xml = xml
-        
-        # 修复1: 移除 XML 前后的空白和杂字符
-        fixed_xml = fixed_xml.strip()
-        
-        # 修复2: 确保以 <mxGraphModel 开头
-        if not fixed_xml.startswith('<mxGraphModel'):
-            match = re.search(r'<mxGraphModel[\s\S]*</mxGraphModel>', fixed_xml)
-            if match:
-                fixed_xml = match.group()
-                logger.info("[XML修复] 提取了 mxGraphModel 内容")
-        
-        # 修复3: 确保 </mxGraphModel> 闭合标签存在
-        if '<mxGraphModel' in fixed_xml and '</mxGraphModel>' not in fixed_xml:
-            fixed_xml = fixed_xml + '</mxGraphModel>'
-            logger.info("[XML修复] 添加了 </mxGraphModel> 闭合标签")
-        
-        # 修复4: 确保 </root> 闭合标签存在
-        if '<root>' in fixed_xml and '</root>' not in fixed_xml:
-            # 在 </mxGraphModel> 前插入 </root>
-            fixed_xml = fixed_xml.replace('</mxGraphModel>', '</root></mxGraphModel>')
-            logger.info("[XML修复] 添加了 </root> 闭合标签")
-        
-        # 修复5: 修复未闭合的 mxCell 标签（自闭合）
-        # 查找 <mxCell ...> 后面没有 </mxCell> 或 /> 的情况
-        def fix_unclosed_mxcell(match):
-            content = match.group(0)
-            # 如果已经是自闭合或有闭合标签，保持不变
-            if content.rstrip().endswith('/>') or '</mxCell>' in content:
-                return content
-            # 检查是否包含 mxGeometry 子元素
-            if '<mxGeometry' in content:
-                # 确保 mxGeometry 是自闭合的
-                content = re.sub(r'<mxGeometry([^>]*)>\s*</mxGeometry>', r'<mxGeometry\1/>', content)
-                content = re.sub(r'<mxGeometry([^/])>(?!</mxGeometry>)', r'<mxGeometry\1/>', content)
-            return content
-        
-        # 再次尝试解析
-        try:
-            ET.fromstring(fixed_xml)
-            logger.info("[XML修复] 修复成功")
-            return True, fixed_xml, ""
-        except ET.ParseError as e:
-            error_msg = str(e)
-            logger.error(f"[XML验证] 修复后仍然失败: {error_msg}")
-            logger.error(f"[XML验证] XML 前200字符: {fixed_xml[:200]}")
-            logger.error(f"[XML验证] XML 后200字符: {fixed_xml[-200:]}")
-            return False, fixed_xml, error_msg
+        return validate_and_fix_xml(xml)
 
     async def display_diagram(self, session_id: str, xml: str) -> bool:
         """
@@ -264,8 +407,8 @@ class DrawioMCPClient:
         try:
             logger.info(f"[display_diagram] 开始调用，session_id={session_id}, XML长度={len(xml)}")
             
-            # 验证并尝试修复 XML
-            is_valid, fixed_xml, error_msg = self._validate_and_fix_xml(xml)
+            # 验证并尝试修复 XML（大图表在线程池中执行）
+            is_valid, fixed_xml, error_msg = await run_cpu(self._validate_and_fix_xml, xml, size=len(xml))
             if not is_valid:
                 logger.error(f"[display_diagram] XML 验证失败: {error_msg}")
                 # 尝试继续发送，让 MCP Server 处理
@@ -283,6 +426,7 @@ class DrawioMCPClient:
             # 更新本地缓存
             if session_id in self.sessions:
                 self.sessions[session_id]["xml"] = xml
+            get_index_cache().invalidate(session_id)
             
             logger.info(f"会话 {session_id} 图表已更新")
             return True
@@ -313,6 +457,8 @@ class DrawioMCPClient:
             result = await self._call_tool("edit_diagram", {
                 "operations": operations
             })
+            # 浏览器中的图表可能同时被用户修改，编辑后的 XML 以下次读取为准，索引届时重建
+            get_index_cache().invalidate(session_id)
             
             logger.info(f"会话 {session_id} 图表编辑完成，操作数: {len(operations)}")
             return True
@@ -334,7 +480,8 @@ class DrawioMCPClient:
             图表 XML 字符串，如果没有图表则返回 None
         """
         try:
-            result = await self._call_tool("get_diagram", {})
+            # MCP Server 只维护一张图表，并发的读取合并为一次调用
+            result = await self._coalesced_read("get_diagram", lambda: self._call_tool("get_diagram", {}))
             
             # 解析返回的 XML
             xml = None
@@ -413,41 +560,33 @@ class DrawioMCPClient:
         """
         将 mxGraphModel XML 包装为完整的 .drawio 文件格式
         """
-        # 如果已经是完整的 mxfile 格式，直接返回
-        if '<mxfile' in xml:
-            return xml
-        
-        # 如果是 mxGraphModel 格式，包装为 mxfile
-        if '<mxGraphModel' in xml:
-            return f'''<?xml version="1.0" encoding="UTF-8"?>
-<mxfile host="drawio-ai" modified="2024-01-01T00:00:00.000Z" agent="DrawIO AI" version="1.0.0">
-  <diagram id="default" name="Page-1">
-{xml}
-  </diagram>
-</mxfile>'''
-        
-        # 其他情况，尝试作为 diagram 内容
-        return f'''<?xml version="1.0" encoding="UTF-8"?>
-<mxfile host="drawio-ai" modified="2024-01-01T00:00:00.000Z" agent="DrawIO AI" version="1.0.0">
-  <diagram id="default" name="Page-1">
-    <mxGraphModel dx="1434" dy="780" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="827" pageHeight="1169" math="0" shadow="0">
-      <root>
-        <mxCell id="0" />
-        <mxCell id="1" parent="0" />
-{xml}
-      </root>
-    </mxGraphModel>
-  </diagram>
-</mxfile>'''
+        return wrap_as_drawio_file(xml)
     
+    async def connect(self):
+        """
+        预先建立 stdio 连接并完成 initialize
+
+        只启动 MCP Server 子进程并握手，不调用任何工具：start_session 会打开浏览器窗口，
+        且 MCP Server 只维护一张图表，必须留在创建会话的请求中调用
+        """
+        await self._ensure_connected()
+
+    async def wait_disconnected(self):
+        """等待当前连接断开（未连接时立即返回），调用方被取消不影响连接"""
+        task = self._connection_task
+        if task is not None and not task.done():
+            await asyncio.wait({task})
+
     async def close(self):
         """关闭 MCP 连接"""
         async with self._lock:
-            if self._exit_stack:
-                await self._exit_stack.aclose()
-                self._exit_stack = None
+            if self._connection_task is not None:
+                self._closing.set()
+                await asyncio.gather(self._connection_task, return_exceptions=True)
+                self._connection_task = None
             self._client_session = None
             self._initialized = False
+            self._invalidate_reads()
             logger.info("MCP 连接已关闭")
     
     async def list_available_tools(self) -> List[str]:
@@ -455,13 +594,16 @@ class DrawioMCPClient:
         列出 MCP Server 提供的所有工具
         用于调试和验证连接
         """
-        session = await self._ensure_connected()
-        tools = await session.list_tools()
-        return [tool.name for tool in tools.tools]
+        async def fetch():
+            session = await self._ensure_connected()
+            tools = await session.list_tools()
+            return [tool.name for tool in tools.tools]
+        
+        return list(await self._coalesced_read("list_tools", fetch))
     
     def __del__(self):
         """析构函数，确保资源释放"""
-        if self._exit_stack:
+        if self._connection_task is not None and not self._connection_task.done():
             # 注意：这里不能使用 await，所以只能记录警告
             logger.warning("DrawioMCPClient 未正确关闭，请调用 close() 方法")
 
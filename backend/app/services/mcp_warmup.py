@@ -0,0 +1,79 @@
+"""
+MCP 连接预热
+第一次创建 preview 会话时要先通过 npx 启动 MCP Server 子进程并完成 initialize 握手，是创建会话最慢的一步。
+启动后在后台预先建立这条 stdio 连接，连接断开后在 MCP_PREWARM_RETRY_DELAY 秒后重新建立。
+
+只预热连接，不预先调用 start_session：该工具会启动内嵌预览服务并打开浏览器窗口，
+且 MCP Server 只维护一张图表，预先启动的“会话”只是同一张图表上的又一次 start_session，
+会打开无人使用的窗口，还可能重置用户刚领取的预览。
+
+指标：
+- mcp_warmup.connect:    建立连接的耗时
+- mcp_warmup.connected / failed / reconnects
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MCPWarmup:
+    """在后台保持 MCP stdio 连接可用"""
+
+    def __init__(self):
+        self.enabled = os.getenv("MCP_PREWARM", "1") == "1"
+        # 连接失败或断开后的重试间隔（秒），避免 MCP Server 不可用时反复启动子进程
+        self.retry_delay = float(os.getenv("MCP_PREWARM_RETRY_DELAY", "10"))
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动后台预热任务，在 lifespan 启动阶段调用"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("[mcp_warmup] 后台预先建立 MCP 连接")
+
+    async def stop(self):
+        """停止后台预热任务（连接由 cleanup_mcp_client 关闭）"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        from app.services.mcp_client import get_mcp_client
+
+        metrics = get_metrics()
+        connected_before = False
+        while True:
+            client = get_mcp_client()
+            start = time.perf_counter()
+            try:
+                await client.connect()
+            except Exception as e:
+                metrics.incr("mcp_warmup.failed")
+                logger.warning(f"[mcp_warmup] 建立 MCP 连接失败: {e}，{self.retry_delay:g}s 后重试")
+                await asyncio.sleep(self.retry_delay)
+                continue
+            metrics.observe("mcp_warmup.connect", time.perf_counter() - start)
+            metrics.incr("mcp_warmup.reconnects" if connected_before else "mcp_warmup.connected")
+            connected_before = True
+            await client.wait_disconnected()
+            logger.info(f"[mcp_warmup] MCP 连接已断开，{self.retry_delay:g}s 后重新建立")
+            await asyncio.sleep(self.retry_delay)
+
+
+_mcp_warmup: Optional[MCPWarmup] = None
+
+
+def get_mcp_warmup() -> MCPWarmup:
+    """获取 MCP 连接预热单例"""
+    global _mcp_warmup
+    if _mcp_warmup is None:
+        _mcp_warmup = MCPWarmup()
+    return _mcp_warmup
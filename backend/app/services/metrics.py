@@ -0,0 +1,96 @@
+"""
+进程内指标统计
+提供计数器、瞬时值和耗时分布，通过 /metrics 接口查看
+"""
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict
+
+# 每个耗时指标保留的最近样本数（用于计算分位数）
+_MAX_SAMPLES = 1024
+
+
+class _Timing:
+    """耗时分布"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=_MAX_SAMPLES)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 6) if self.count else 0.0,
+            "p50": round(pct(50), 6),
+            "p95": round(pct(95), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class Metrics:
+    """指标注册表"""
+
+    def __init__(self):
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, _Timing] = defaultdict(_Timing)
+
+    def incr(self, name: str, value: int = 1):
+        """计数器累加"""
+        self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        """设置瞬时值"""
+        self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """记录一次耗时（秒）或其他分布型数值"""
+        self._timings[name].observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """计时上下文，退出时记录耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "counters": dict(self._counters),
+            "gauges": dict(self._gauges),
+            "timings": {name: timing.snapshot() for name, timing in self._timings.items()},
+        }
+
+    def reset(self):
+        self._counters.clear()
+        self._gauges.clear()
+        self._timings.clear()
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """获取全局指标注册表"""
+    return _metrics
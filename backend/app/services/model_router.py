@@ -0,0 +1,142 @@
+"""
+快慢模型路由
+未配置 GLM_FAST_MODEL 时所有轮次都使用 GLM_MODEL（强模型）。配置后按轮次选择模型：
+- 寒暄、提问等对话类轮次，以及修改不超过 GLM_FAST_EDIT_MAX_CELLS 个单元格的图表，使用快模型；
+- 新建图表和修改大图表使用强模型；
+- 按模型统计首字延迟和出错率（指数滑动平均）：快模型近期出错率超过 GLM_ROUTE_MAX_ERROR_RATE，
+  或首字延迟反而高于强模型时，本应使用快模型的轮次改用强模型；
+  超过 GLM_ROUTE_COOLDOWN 秒没有新样本后不再参考旧的统计，重新尝试快模型；
+- 快模型请求出错、输出未通过校验（编辑操作预检失败、流式 XML 格式错误）时，
+  由 GLMService 升级到强模型重新生成（escalate）。
+
+指标：route.<fast|strong>.turns / failed 计数、route.fast.escalated / skipped 计数，
+route.<fast|strong>.first_token（首字延迟），route.<fast|strong>.error_rate / latency 瞬时值
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from app.services.intent import EDIT_DIAGRAM, is_conversational
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+FAST = "fast"
+STRONG = "strong"
+
+# 滑动平均的权重，以及统计生效前需要的最少样本数
+EWMA_ALPHA = 0.2
+MIN_SAMPLES = 3
+
+
+@dataclass(frozen=True)
+class Route:
+    """一轮对话选定的模型"""
+    name: str
+    model: str
+
+    @property
+    def escalatable(self) -> bool:
+        """出错时能否升级到强模型"""
+        return self.name == FAST
+
+
+class _ModelStats:
+    __slots__ = ("samples", "error_rate", "latency", "updated")
+
+    def __init__(self):
+        self.samples = 0
+        self.error_rate = 0.0
+        # 首字延迟（秒），只有流式请求能测得
+        self.latency: Optional[float] = None
+        self.updated = 0.0
+
+
+def _ewma(current: Optional[float], value: float) -> float:
+    return value if current is None else current + EWMA_ALPHA * (value - current)
+
+
+class ModelRouter:
+    """按意图、图表规模和各模型近期表现选择快模型或强模型"""
+
+    def __init__(self, strong_model: str, fast_model: str = None):
+        self.strong_model = strong_model
+        self.fast_model = fast_model if fast_model is not None else os.getenv("GLM_FAST_MODEL", "")
+        self.fast_edit_max_cells = int(os.getenv("GLM_FAST_EDIT_MAX_CELLS", "40"))
+        self.max_error_rate = float(os.getenv("GLM_ROUTE_MAX_ERROR_RATE", "0.3"))
+        self.cooldown = float(os.getenv("GLM_ROUTE_COOLDOWN", "60"))
+        self._stats: Dict[str, _ModelStats] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.fast_model) and self.fast_model != self.strong_model
+
+    def _route(self, name: str) -> Route:
+        return Route(name, self.fast_model if name == FAST else self.strong_model)
+
+    def choose(self, intent: str = None, current_diagram_xml: str = None) -> Route:
+        """
+        选择本轮使用的模型
+
+        Args:
+            intent: 预分类的意图（见 app.services.intent）
+            current_diagram_xml: 当前图表 XML，用于估计修改的图表规模
+        """
+        name = STRONG
+        if self.enabled and self._prefers_fast(intent, current_diagram_xml):
+            if self._healthy(self.fast_model):
+                name = FAST
+            else:
+                get_metrics().incr("route.fast.skipped")
+                logger.info(f"[route] 快模型 {self.fast_model} 近期出错率或延迟偏高，本轮改用强模型")
+        get_metrics().incr(f"route.{name}.turns")
+        return self._route(name)
+
+    def _prefers_fast(self, intent: Optional[str], current_diagram_xml: Optional[str]) -> bool:
+        if is_conversational(intent):
+            return True
+        if intent == EDIT_DIAGRAM and current_diagram_xml:
+            # 只数一下单元格标签，不解析整张图表
+            return current_diagram_xml.count("<mxCell") <= self.fast_edit_max_cells
+        return False
+
+    def _healthy(self, model: str) -> bool:
+        stats = self._stats.get(model)
+        if stats is None or stats.samples < MIN_SAMPLES:
+            return True
+        if time.monotonic() - stats.updated > self.cooldown:
+            return True
+        if stats.error_rate > self.max_error_rate:
+            return False
+        strong = self._stats.get(self.strong_model)
+        if stats.latency is not None and strong is not None and strong.latency is not None:
+            return stats.latency <= strong.latency
+        return True
+
+    def escalate(self, route: Route) -> Route:
+        """快模型的输出不可用时改用强模型"""
+        get_metrics().incr(f"route.{route.name}.escalated")
+        logger.info(f"[route] 快模型 {route.model} 的输出不可用，升级到强模型 {self.strong_model}")
+        return self._route(STRONG)
+
+    def observe_latency(self, route: Route, seconds: float):
+        """记录一次流式请求的首字延迟"""
+        stats = self._stats.setdefault(route.model, _ModelStats())
+        stats.latency = _ewma(stats.latency, seconds)
+        stats.updated = time.monotonic()
+        metrics = get_metrics()
+        metrics.observe(f"route.{route.name}.first_token", seconds)
+        metrics.set_gauge(f"route.{route.name}.latency", round(stats.latency, 4))
+
+    def record(self, route: Route, ok: bool):
+        """记录一轮（或升级前的一次尝试）的结果：请求是否成功、输出是否通过校验"""
+        stats = self._stats.setdefault(route.model, _ModelStats())
+        stats.samples += 1
+        stats.error_rate = _ewma(stats.error_rate if stats.samples > 1 else None, 0.0 if ok else 1.0)
+        stats.updated = time.monotonic()
+        metrics = get_metrics()
+        if not ok:
+            metrics.incr(f"route.{route.name}.failed")
+        metrics.set_gauge(f"route.{route.name}.error_rate", round(stats.error_rate, 4))
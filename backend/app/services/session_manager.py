@@ -7,50 +7,84 @@ from datetime import datetime
 from typing import Dict, Optional, Any
 import os
 import logging
+import time
+
+from app.services.diagram_index import get_index_cache
+from app.services.metrics import get_metrics
+from app.services.session_store import get_session_store
 
 logger = logging.getLogger(__name__)
 
-# TODO: 后续可替换为 Redis 存储
-_sessions: Dict[str, Dict[str, Any]] = {}
+# 会话模式：preview 通过 MCP Server 驱动浏览器预览；headless 使用进程内图表存储
+PREVIEW = "preview"
+HEADLESS = "headless"
+SESSION_MODES = (PREVIEW, HEADLESS)
+
+
+def new_session_id() -> str:
+    """生成会话 ID（短 ID）"""
+    return str(uuid.uuid4())[:8]
 
 
 class SessionManager:
-    """会话管理器"""
+    """
+    会话管理器
+    
+    会话元数据保存在会话存储中（进程内或 Redis，见 SESSION_STORE）；
+    worker 字段记录创建会话的工作进程，多进程部署时据此把请求转发到会话所属进程
+    """
     
     def __init__(self):
         self.base_preview_url = os.getenv("PREVIEW_BASE_URL", "http://localhost:6274")
+        self.default_mode = os.getenv("SESSION_DEFAULT_MODE", PREVIEW)
     
-    async def create_session(self) -> Dict[str, Any]:
+    async def create_session(self, mode: Optional[str] = None) -> Dict[str, Any]:
         """
         创建新会话
-        同时调用 MCP Server 启动绘图会话
+        preview 模式调用 MCP Server 启动绘图会话（MCP 连接由启动预热提前建立，见 app.services.mcp_warmup）；
+        headless 模式只在进程内创建空白图表
         返回包含 session_id 和 preview_url 的字典
         """
+        from app.services.affinity import worker_url
         from app.services.mcp_client import get_mcp_client
         
-        session_id = str(uuid.uuid4())[:8]  # 使用短 ID
+        mode = mode or self.default_mode
+        if mode not in SESSION_MODES:
+            raise ValueError(f"未知的会话模式: {mode}")
+        
+        session_id = new_session_id()
         created_at = datetime.now().isoformat()
         
-        # 调用 MCP Server 启动会话
-        try:
-            mcp_client = get_mcp_client()
-            mcp_result = await mcp_client.start_session(session_id)
-            preview_url = mcp_result.get("preview_url", f"{self.base_preview_url}")
-            logger.info(f"MCP 会话已启动: {session_id}, 预览 URL: {preview_url}")
-        except Exception as e:
-            logger.warning(f"MCP 会话启动失败: {e}，使用默认预览 URL")
-            preview_url = f"{self.base_preview_url}?session={session_id}"
+        if mode == HEADLESS:
+            from app.services.diagram_store import get_headless_client
+            await get_headless_client().start_session(session_id)
+            preview_url = None
+            logger.info(f"无头会话已创建: {session_id}")
+        else:
+            # 调用 MCP Server 启动会话
+            start = time.perf_counter()
+            try:
+                mcp_client = get_mcp_client()
+                mcp_result = await mcp_client.start_session(session_id)
+                preview_url = mcp_result.get("preview_url", f"{self.base_preview_url}")
+                logger.info(f"MCP 会话已启动: {session_id}, 预览 URL: {preview_url}")
+            except Exception as e:
+                logger.warning(f"MCP 会话启动失败: {e}，使用默认预览 URL")
+                preview_url = f"{self.base_preview_url}?session={session_id}"
+            get_metrics().observe("session.start", time.perf_counter() - start)
         
         session_info = {
             "session_id": session_id,
             "status": "active",
+            "mode": mode,
+            "worker": worker_url(),  # 会话所属工作进程，单进程部署时为 None
             "created_at": created_at,
             "preview_url": preview_url,
             "diagram_xml": None,  # 当前图表 XML
             "chat_history": [],   # 对话历史
         }
         
-        _sessions[session_id] = session_info
+        await get_session_store().set(session_id, session_info)
         
         return session_info
     
@@ -58,33 +92,33 @@ class SessionManager:
         """
         获取会话信息
         """
-        return _sessions.get(session_id)
+        return await get_session_store().get(session_id)
     
     async def update_session(self, session_id: str, updates: Dict[str, Any]) -> bool:
         """
         更新会话信息
         """
-        if session_id not in _sessions:
-            return False
-        
-        _sessions[session_id].update(updates)
-        return True
+        return await get_session_store().update(session_id, lambda info: info.update(updates)) is not None
     
     async def delete_session(self, session_id: str) -> bool:
         """
         删除会话
         """
-        if session_id not in _sessions:
+        session_info = await get_session_store().delete(session_id)
+        if session_info is None:
             return False
         
-        del _sessions[session_id]
+        get_index_cache().invalidate(session_id)
+        if session_info.get("mode") == HEADLESS:
+            from app.services.diagram_store import get_headless_client
+            await get_headless_client().end_session(session_id)
         return True
     
     async def list_sessions(self) -> list:
         """
         列出所有会话
         """
-        return list(_sessions.values())
+        return await get_session_store().list()
     
     async def update_diagram_xml(self, session_id: str, xml: str) -> bool:
         """
@@ -96,12 +130,24 @@ class SessionManager:
         """
         添加聊天消息到历史记录
         """
-        if session_id not in _sessions:
-            return False
-        
-        _sessions[session_id]["chat_history"].append({
+        message = {
             "role": role,
             "content": content,
             "timestamp": datetime.now().isoformat()
-        })
-        return True
+        }
+        return await get_session_store().update(
+            session_id, lambda info: info["chat_history"].append(message)
+        ) is not None
+
+
+def get_diagram_client(session_info: Dict[str, Any]):
+    """
+    按会话模式选择图表后端
+
+    两种后端接口一致：headless 会话使用进程内图表存储，其余使用 MCP 客户端
+    """
+    if session_info.get("mode") == HEADLESS:
+        from app.services.diagram_store import get_headless_client
+        return get_headless_client()
+    from app.services.mcp_client import get_mcp_client
+    return get_mcp_client()
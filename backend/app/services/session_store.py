@@ -0,0 +1,139 @@
+"""
+会话元数据存储
+- memory: 进程内字典（默认），单进程部署使用
+- redis: 存放在 Redis 中，多工作进程部署时所有进程共享同一份会话元数据
+
+修改已有会话（追加聊天记录、更新图表 XML）使用 update 原子地读取-修改-写入，
+并发的轮次或编辑（包括转发到同一进程的请求）不会互相覆盖。
+
+会话元数据只包含可 JSON 序列化的字段；图表本身仍由会话所属进程的 MCP 客户端或无头存储持有，
+因此多进程时还需要按 worker 字段把请求转发到会话所属的进程（见 affinity 模块）。
+"""
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MEMORY = "memory"
+REDIS = "redis"
+
+
+class MemorySessionStore:
+    """进程内会话存储"""
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self._sessions.get(session_id)
+
+    async def set(self, session_id: str, session_info: Dict[str, Any]):
+        self._sessions[session_id] = session_info
+
+    async def update(
+        self, session_id: str, mutate: Callable[[Dict[str, Any]], None]
+    ) -> Optional[Dict[str, Any]]:
+        """原子地修改会话（读取与写入之间没有 await），会话不存在时返回 None"""
+        session_info = self._sessions.get(session_id)
+        if session_info is not None:
+            mutate(session_info)
+        return session_info
+
+    async def delete(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """删除会话，返回被删除的会话信息"""
+        return self._sessions.pop(session_id, None)
+
+    async def list(self) -> List[Dict[str, Any]]:
+        return list(self._sessions.values())
+
+
+class RedisSessionStore:
+    """
+    Redis 会话存储
+
+    每个会话一个 JSON 字符串键，空闲超过 SESSION_TTL 秒后由 Redis 自动过期
+    """
+
+    def __init__(self, url: Optional[str] = None, ttl: Optional[int] = None):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_STORE=redis 需要安装 redis 包") from e
+
+        self.url = url or os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.ttl = ttl or int(os.getenv("SESSION_TTL", "86400"))
+        self.prefix = os.getenv("SESSION_KEY_PREFIX", "drawio:session:")
+        self._redis = redis.from_url(self.url, decode_responses=True)
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}"
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.get(self._key(session_id))
+        return json.loads(raw) if raw else None
+
+    async def set(self, session_id: str, session_info: Dict[str, Any]):
+        await self._redis.set(self._key(session_id), json.dumps(session_info, ensure_ascii=False), ex=self.ttl)
+
+    async def update(
+        self, session_id: str, mutate: Callable[[Dict[str, Any]], None]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        原子地修改会话，会话不存在时返回 None
+
+        WATCH 会话键后读取、修改，在 MULTI 事务中写回；期间键被其他请求修改时事务失败，重新读取后再试
+        """
+        from redis.exceptions import WatchError
+
+        key = self._key(session_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    raw = await pipe.get(key)
+                    if not raw:
+                        await pipe.unwatch()
+                        return None
+                    session_info = json.loads(raw)
+                    mutate(session_info)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(session_info, ensure_ascii=False), ex=self.ttl)
+                    await pipe.execute()
+                    return session_info
+                except WatchError:
+                    logger.debug(f"[session] 会话 {session_id} 写入冲突，重试")
+                    continue
+
+    async def delete(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """删除会话，返回被删除的会话信息"""
+        raw = await self._redis.getdel(self._key(session_id))
+        return json.loads(raw) if raw else None
+
+    async def list(self) -> List[Dict[str, Any]]:
+        sessions = []
+        async for key in self._redis.scan_iter(match=f"{self.prefix}*"):
+            raw = await self._redis.get(key)
+            if raw:
+                sessions.append(json.loads(raw))
+        return sessions
+
+
+# 创建全局单例
+_session_store = None
+
+
+def get_session_store():
+    """获取会话存储单例，类型由 SESSION_STORE 决定"""
+    global _session_store
+    if _session_store is None:
+        kind = os.getenv("SESSION_STORE", MEMORY)
+        if kind == REDIS:
+            _session_store = RedisSessionStore()
+            logger.info(f"[session] 使用 Redis 会话存储: {_session_store.url}")
+        elif kind == MEMORY:
+            _session_store = MemorySessionStore()
+        else:
+            raise ValueError(f"未知的会话存储类型: {kind}")
+    return _session_store
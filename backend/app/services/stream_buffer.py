@@ -0,0 +1,167 @@
+"""
+流式输出缓冲与背压
+在 LLM 读取任务与 SSE 写出之间放置有界缓冲区：
+- 缓冲帧数超过水位线后，新的文本增量合并进末尾的文本帧，内存占用有上限
+- 客户端断开时立即取消读取任务，从而关闭上游 LLM 连接
+- 客户端长时间不读取时丢弃该流
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, List, Optional, Union
+
+from app.services.cancellation import disconnect_poll_interval
+from app.services.metrics import get_metrics
+from app.services.stream_events import StreamEvent, TextEvent
+
+logger = logging.getLogger(__name__)
+
+
+class StreamStalled(Exception):
+    """客户端长时间未读取，缓冲区停滞"""
+
+
+class StreamBuffer:
+    """
+    单个流的有界缓冲区
+
+    文本帧在内部以片段列表保存，合并时只追加片段，取出时再拼接。
+    """
+
+    def __init__(
+        self,
+        max_frames: int = None,
+        high_watermark: int = None,
+        stall_timeout: float = None
+    ):
+        self.max_frames = max_frames or int(os.getenv("SSE_BUFFER_MAX_FRAMES", "256"))
+        self.high_watermark = high_watermark or int(os.getenv("SSE_BUFFER_HIGH_WATERMARK", "32"))
+        self.stall_timeout = stall_timeout or float(os.getenv("SSE_STALL_TIMEOUT", "30"))
+        self._items: Deque[Union[List[str], StreamEvent]] = deque()
+        self._cond = asyncio.Condition()
+        self._closed = False
+        # 缓冲区中最早一批数据开始等待写出的时间
+        self._pending_since: Optional[float] = None
+        self.coalesced = 0
+        self.stalled = False
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def put(self, event: StreamEvent):
+        """
+        写入事件
+
+        缓冲帧数达到水位线时合并文本增量；缓冲区满时等待写出端消费。
+
+        Raises:
+            StreamStalled: 写出端超过 stall_timeout 未取走任何数据
+        """
+        async with self._cond:
+            if self._pending_since and time.monotonic() - self._pending_since > self.stall_timeout:
+                self.stalled = True
+                raise StreamStalled()
+
+            is_text = isinstance(event, TextEvent)
+            if is_text and len(self._items) >= self.high_watermark and isinstance(self._items[-1], list):
+                self._items[-1].append(event.content)
+                self.coalesced += 1
+            else:
+                if len(self._items) >= self.max_frames:
+                    try:
+                        await asyncio.wait_for(
+                            self._cond.wait_for(lambda: len(self._items) < self.max_frames),
+                            timeout=self.stall_timeout
+                        )
+                    except asyncio.TimeoutError:
+                        self.stalled = True
+                        raise StreamStalled()
+                if not self._items:
+                    self._pending_since = time.monotonic()
+                self._items.append([event.content] if is_text else event)
+            self._cond.notify_all()
+
+    async def close(self):
+        """标记写入结束"""
+        async with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    async def get(self) -> Optional[StreamEvent]:
+        """
+        取出一个事件，缓冲区关闭且为空时返回 None
+        """
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._items or self._closed)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._pending_since = time.monotonic() if self._items else None
+            self._cond.notify_all()
+        if isinstance(item, list):
+            return TextEvent(content="".join(item))
+        return item
+
+
+async def buffered_events(
+    events: AsyncIterator[StreamEvent],
+    request=None,
+    poll_interval: float = None
+) -> AsyncIterator[StreamEvent]:
+    """
+    通过有界缓冲区转发事件
+
+    读取任务在后台消费 events；写出端等待期间定期检查客户端是否断开，
+    断开或被取消时立即取消读取任务。
+
+    Args:
+        events: 上游事件流
+        request: Starlette Request，用于检测客户端断开（可选）
+        poll_interval: 断开检测间隔（秒）
+    """
+    metrics = get_metrics()
+    poll_interval = poll_interval or disconnect_poll_interval()
+    buffer = StreamBuffer()
+
+    async def reader():
+        try:
+            async for event in events:
+                await buffer.put(event)
+        except StreamStalled:
+            logger.warning("[stream] 客户端长时间未读取，丢弃该流")
+        finally:
+            await buffer.close()
+            # 显式关闭上游生成器，使其 finally 中的连接清理立即执行
+            aclose = getattr(events, "aclose", None)
+            if aclose:
+                await aclose()
+
+    task = asyncio.create_task(reader())
+    outcome = "completed"
+    metrics.incr("stream.started")
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(buffer.get(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                if request is not None and await request.is_disconnected():
+                    outcome = "cancelled"
+                    logger.info("[stream] 客户端已断开，取消上游生成")
+                    break
+                continue
+            if event is None:
+                break
+            yield event
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        if buffer.stalled:
+            outcome = "dropped"
+        metrics.incr(f"stream.{outcome}")
+        metrics.incr("stream.coalesced_deltas", buffer.coalesced)
@@ -0,0 +1,124 @@
+"""
+流式对话事件
+GLMService 与路由之间传递类型化的事件对象，只在 SSE 出口处序列化一次
+"""
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Literal, Union
+
+from pydantic import BaseModel
+
+
+class TextEvent(BaseModel):
+    """模型输出的文本增量"""
+    type: Literal["text"] = "text"
+    content: str
+
+
+class CompleteEvent(BaseModel):
+    """生成结束，携带解析后的结果"""
+    type: Literal["complete"] = "complete"
+    result: Dict[str, Any]
+
+
+class DiagramStatusEvent(BaseModel):
+    """图表操作执行结果"""
+    type: Literal["diagram_status"] = "diagram_status"
+    updated: bool
+
+
+class RestartEvent(BaseModel):
+    """已输出的内容作废，模型重新生成（前端清空正在显示的内容）"""
+    type: Literal["restart"] = "restart"
+    reason: str
+
+
+class ErrorEvent(BaseModel):
+    """错误信息"""
+    type: Literal["error"] = "error"
+    message: str
+
+
+StreamEvent = Union[TextEvent, CompleteEvent, DiagramStatusEvent, RestartEvent, ErrorEvent]
+
+
+def encode_sse(event: StreamEvent) -> str:
+    """将事件编码为一帧 SSE 数据"""
+    return f"data: {event.model_dump_json()}\n\n"
+
+
+class CoalesceConfig:
+    """
+    文本增量合并配置
+
+    max_chars 为 0 时不合并，每个增量单独成帧。
+    """
+
+    def __init__(self, max_chars: int = None, max_delay: float = None):
+        self.max_chars = max_chars if max_chars is not None else int(os.getenv("SSE_COALESCE_MAX_CHARS", "0"))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv("SSE_COALESCE_MAX_DELAY_MS", "50")) / 1000
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_chars > 0
+
+
+async def coalesce_text(
+    events: AsyncIterator[StreamEvent],
+    config: CoalesceConfig = None
+) -> AsyncIterator[StreamEvent]:
+    """
+    合并相邻的文本增量
+
+    缓冲的文本达到 max_chars 或距第一个缓冲增量超过 max_delay 时输出一帧；
+    上游暂停（续写、重新生成的往返）时不等下一个增量，到期即输出缓冲内容。
+    遇到非文本事件或流结束时先输出缓冲内容，保证事件顺序不变。
+    """
+    config = config or CoalesceConfig()
+    if not config.enabled:
+        async for event in events:
+            yield event
+        return
+
+    iterator = events.__aiter__()
+    buffer = []
+    size = 0
+    deadline = 0.0
+    # 读取下一个事件的任务：等待超时只刷出缓冲，不取消读取（取消会中止上游生成器）
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            if buffer:
+                done, _ = await asyncio.wait({pending}, timeout=max(0.0, deadline - time.monotonic()))
+                if not done:
+                    yield TextEvent(content="".join(buffer))
+                    buffer, size = [], 0
+                    continue
+            try:
+                event = await pending
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+            if isinstance(event, TextEvent):
+                if not buffer:
+                    deadline = time.monotonic() + config.max_delay
+                buffer.append(event.content)
+                size += len(event.content)
+                if size >= config.max_chars or time.monotonic() >= deadline:
+                    yield TextEvent(content="".join(buffer))
+                    buffer, size = [], 0
+                continue
+            if buffer:
+                yield TextEvent(content="".join(buffer))
+                buffer, size = [], 0
+            yield event
+        if buffer:
+            yield TextEvent(content="".join(buffer))
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
@@ -0,0 +1,331 @@
+"""
+图表模板快速通道
+对描述清晰的简单请求（如「画一个流程图：登录、验证、进入主页」），
+直接用参数化的 mxGraph 模板生成图表，无需调用 GLM
+
+流程：
+1. 识别图表类型（流程图 / 架构图 / 思维导图）
+2. 槽位填充：节点文本、数量、布局方向、中心主题
+3. 计算置信度，低于阈值时回退到 GLM
+4. 按模板生成节点和连线，并计算坐标
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+# 节点样式
+STYLE_START = "ellipse;whiteSpace=wrap;html=1;fillColor=#d5e8d4;strokeColor=#82b366;"
+STYLE_END = "ellipse;whiteSpace=wrap;html=1;fillColor=#f8cecc;strokeColor=#b85450;"
+STYLE_PROCESS = "rounded=0;whiteSpace=wrap;html=1;fillColor=#dae8fc;strokeColor=#6c8ebf;"
+STYLE_DECISION = "rhombus;whiteSpace=wrap;html=1;fillColor=#fff2cc;strokeColor=#d6b656;"
+STYLE_COMPONENT = "rounded=1;whiteSpace=wrap;html=1;fillColor=#dae8fc;strokeColor=#6c8ebf;"
+STYLE_DATABASE = "shape=cylinder3;whiteSpace=wrap;html=1;boundedLbl=1;backgroundOutline=1;size=15;fillColor=#f5f5f5;strokeColor=#666666;"
+STYLE_CENTER = "ellipse;whiteSpace=wrap;html=1;fillColor=#e1d5e7;strokeColor=#9673a6;fontStyle=1;fontSize=14;"
+BRANCH_COLORS = [
+    "fillColor=#dae8fc;strokeColor=#6c8ebf;",
+    "fillColor=#d5e8d4;strokeColor=#82b366;",
+    "fillColor=#fff2cc;strokeColor=#d6b656;",
+    "fillColor=#f8cecc;strokeColor=#b85450;",
+    "fillColor=#e1d5e7;strokeColor=#9673a6;",
+    "fillColor=#ffe6cc;strokeColor=#d79b00;",
+]
+STYLE_EDGE = "edgeStyle=orthogonalEdgeStyle;rounded=0;orthogonalLoop=1;jettySize=auto;html=1;endArrow=classic;"
+STYLE_BRANCH_EDGE = "edgeStyle=none;rounded=1;orthogonalLoop=1;jettySize=auto;html=1;endArrow=none;curved=1;"
+
+MODEL_OPEN = (
+    '<mxGraphModel dx="1434" dy="780" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" '
+    'arrows="1" fold="1" page="1" pageScale="1" pageWidth="827" pageHeight="1169" math="0" shadow="0">'
+)
+
+FLOWCHART = "flowchart"
+ARCHITECTURE = "architecture"
+MINDMAP = "mindmap"
+
+TYPE_KEYWORDS = {
+    FLOWCHART: ["流程图", "流程"],
+    ARCHITECTURE: ["架构图", "系统架构", "架构"],
+    MINDMAP: ["思维导图", "脑图", "mind map", "mindmap"],
+}
+
+TYPE_NAMES = {FLOWCHART: "流程图", ARCHITECTURE: "架构图", MINDMAP: "思维导图"}
+
+# 出现这些描述说明需求较复杂，交给 GLM 处理
+COMPLEX_HINTS = [
+    "如果", "判断", "循环", "并行", "泳道", "同时", "否则", "失败", "成功则",
+    "子图", "嵌套", "分组", "时序", "类图", "配色", "颜色", "样式",
+]
+
+DATABASE_HINTS = ["数据库", "db", "mysql", "postgres", "redis", "缓存", "存储", "mongodb", "es"]
+# 英文提示词按单词匹配，避免 "services"、"messages" 命中 "es"
+_DATABASE_PATTERN = re.compile("|".join(
+    rf"(?<![a-z]){hint}(?![a-z])" if hint.isascii() else hint for hint in DATABASE_HINTS
+))
+
+# 槽位中标签列表的引导词；文字引导词须位于句首、标点之后或紧跟图表类型（「流程图包含」），
+# 避免「没有」「分为」这类词中的字被当作引导词
+_LABEL_LEADS = (
+    r"(?:[:：]|(?:^|(?<=[，,。；;！!\s图]))"
+    r"(?:包含|包括|分别是|分别为|依次是|依次为|步骤为|步骤是|步骤有|组件有|组件为|分支为|分支有|分支是))"
+)
+# 消息中出现列举但未能提取标签时，说明列表的写法模板无法理解
+_ENUMERATION = re.compile(r"、|->|→|=>")
+_LABEL_SPLIT = re.compile(r"\s*(?:、|，|,|；|;|->|→|=>|—>|然后|再到|接着)\s*")
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+# 模板支持的最大节点数
+MAX_TEMPLATE_NODES = 12
+
+
+def _parse_number(text: str) -> Optional[int]:
+    """解析阿拉伯数字或 1-99 的中文数字"""
+    if text.isdigit():
+        return int(text)
+    if text == "十":
+        return 10
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        return _CN_DIGITS.get(tens, 1) * 10 + _CN_DIGITS.get(ones, 0)
+    return _CN_DIGITS.get(text)
+
+
+class TemplateMatch:
+    """模板匹配结果"""
+
+    def __init__(self, diagram_type: str, confidence: float, slots: Dict[str, Any]):
+        self.diagram_type = diagram_type
+        self.confidence = confidence
+        self.slots = slots
+        self.result: Optional[Dict[str, Any]] = None
+
+
+class TemplateEngine:
+    """参数化的 mxGraph 模板库"""
+
+    def __init__(self, min_confidence: float = None):
+        self.enabled = os.getenv("TEMPLATE_FAST_PATH", "1") == "1"
+        self.min_confidence = min_confidence if min_confidence is not None else float(
+            os.getenv("TEMPLATE_MIN_CONFIDENCE", "0.8")
+        )
+
+    # ------------------------------------------------------------------
+    # 槽位填充
+    # ------------------------------------------------------------------
+
+    def _detect_type(self, text: str) -> Optional[str]:
+        for diagram_type in (MINDMAP, ARCHITECTURE, FLOWCHART):
+            if any(kw in text for kw in TYPE_KEYWORDS[diagram_type]):
+                return diagram_type
+        return None
+
+    def _extract_labels(self, message: str) -> List[str]:
+        match = re.search(_LABEL_LEADS + r"[\s:：]*(.+)$", message, re.S)
+        if not match:
+            return []
+        body = match.group(1).strip().rstrip("。.！!")
+        # 只去掉包住整个标签的引号
+        parts = [re.sub(r"^[「“\"'](.*)[」”\"']$", r"\1", p.strip()) for p in _LABEL_SPLIT.split(body)]
+        labels = []
+        for part in parts:
+            # 去掉「……等」以及「……的流程图」这类收尾
+            part = re.sub(r"(?:的)?(?:流程图|架构图|思维导图|脑图)$", "", part)
+            part = re.sub(r"等$", "", part).strip()
+            if part:
+                labels.append(part)
+        # 只有一个片段说明不是列表
+        return labels if len(labels) >= 2 else []
+
+    def _extract_count(self, text: str) -> Optional[int]:
+        match = re.search(
+            r"(\d+|[一二两三四五六七八九十]{1,3})\s*(?:个|项|条)?\s*(?:步骤|步|节点|分支|组件|层|阶段|环节|模块|服务)",
+            text
+        )
+        if not match:
+            return None
+        return _parse_number(match.group(1))
+
+    def _extract_direction(self, text: str) -> str:
+        if any(kw in text for kw in ["横向", "水平", "从左到右", "左右"]):
+            return "horizontal"
+        return "vertical"
+
+    def _extract_topic(self, message: str) -> Optional[str]:
+        for pattern in [r"关于(.+?)的(?:思维导图|脑图)", r"主题(?:是|为)\s*[「“\"]?([^，,。；;「」“”\"：:]+)",
+                        r"以(.+?)为(?:中心|主题)"]:
+            match = re.search(pattern, message)
+            if match:
+                return match.group(1).strip()
+        return None
+
+    def match(self, message: str) -> Optional[TemplateMatch]:
+        """
+        识别请求并填充槽位
+
+        Returns:
+            匹配结果（含置信度），无法识别图表类型时返回 None
+        """
+        text = message.strip().lower()
+        diagram_type = self._detect_type(text)
+        if not diagram_type:
+            return None
+
+        labels = self._extract_labels(message)
+        count = self._extract_count(text)
+        slots = {
+            "labels": labels,
+            "count": count,
+            "direction": self._extract_direction(text),
+            "topic": self._extract_topic(message) if diagram_type == MINDMAP else None,
+        }
+
+        confidence = 0.5
+        if labels:
+            confidence += 0.4
+        elif count:
+            confidence += 0.3
+        if diagram_type == MINDMAP and slots["topic"]:
+            confidence += 0.1
+        if any(hint in text for hint in COMPLEX_HINTS):
+            confidence -= 0.4
+        if not labels and _ENUMERATION.search(message):
+            confidence -= 0.4
+        nodes = len(labels) or count or 0
+        if nodes > MAX_TEMPLATE_NODES or (count and labels and count != len(labels)):
+            confidence -= 0.4
+        if len(message) > 120:
+            confidence -= 0.2
+
+        return TemplateMatch(diagram_type, round(max(0.0, min(1.0, confidence)), 2), slots)
+
+    # ------------------------------------------------------------------
+    # 模板渲染
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _vertex(cell_id: str, label: str, style: str, x: int, y: int, width: int, height: int) -> str:
+        return (
+            f'<mxCell id="{cell_id}" value="{escape(label, {chr(34): "&quot;"})}" style="{style}" '
+            f'vertex="1" parent="1"><mxGeometry x="{x}" y="{y}" width="{width}" height="{height}" '
+            f'as="geometry"/></mxCell>'
+        )
+
+    @staticmethod
+    def _edge(cell_id: str, source: str, target: str, style: str = STYLE_EDGE) -> str:
+        return (
+            f'<mxCell id="{cell_id}" style="{style}" edge="1" parent="1" source="{source}" '
+            f'target="{target}"><mxGeometry relative="1" as="geometry"/></mxCell>'
+        )
+
+    @staticmethod
+    def _wrap(cells: List[str]) -> str:
+        return (
+            MODEL_OPEN + '<root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+            + "".join(cells) + "</root></mxGraphModel>"
+        )
+
+    @staticmethod
+    def _chain_positions(count: int, direction: str, width: int, height: int) -> List[tuple]:
+        """沿一个方向等距排列，返回每个节点的中心坐标"""
+        if direction == "horizontal":
+            return [(100 + width // 2 + i * (width + 60), 150) for i in range(count)]
+        return [(380, 60 + height // 2 + i * (height + 40)) for i in range(count)]
+
+    def _render_flowchart(self, slots: Dict[str, Any]) -> tuple[str, str]:
+        steps = slots["labels"] or [f"步骤 {i + 1}" for i in range(slots["count"] or 3)]
+        nodes = [("start", "开始", STYLE_START, 80, 40)]
+        nodes += [(f"step{i + 1}", label, STYLE_PROCESS, 120, 60) for i, label in enumerate(steps)]
+        nodes.append(("end", "结束", STYLE_END, 80, 40))
+
+        centers = self._chain_positions(len(nodes), slots["direction"], 120, 60)
+        cells = [
+            self._vertex(cid, label, style, cx - w // 2, cy - h // 2, w, h)
+            for (cid, label, style, w, h), (cx, cy) in zip(nodes, centers)
+        ]
+        cells += [self._edge(f"arrow{i + 1}", nodes[i][0], nodes[i + 1][0]) for i in range(len(nodes) - 1)]
+        reply = (
+            f"我为你创建了一个包含 {len(steps)} 个步骤的流程图 🎨\n\n"
+            f"开始 → {' → '.join(steps)} → 结束\n\n需要我调整任何部分吗？"
+        )
+        return self._wrap(cells), reply
+
+    def _render_architecture(self, slots: Dict[str, Any]) -> tuple[str, str]:
+        components = slots["labels"] or [f"组件 {i + 1}" for i in range(slots["count"] or 3)]
+        nodes = []
+        for i, label in enumerate(components):
+            is_db = _DATABASE_PATTERN.search(label.lower()) is not None
+            style, w, h = (STYLE_DATABASE, 80, 100) if is_db else (STYLE_COMPONENT, 120, 60)
+            nodes.append((f"component{i + 1}", label, style, w, h))
+
+        centers = self._chain_positions(len(nodes), slots["direction"], 120, 100)
+        cells = [
+            self._vertex(cid, label, style, cx - w // 2, cy - h // 2, w, h)
+            for (cid, label, style, w, h), (cx, cy) in zip(nodes, centers)
+        ]
+        cells += [self._edge(f"link{i + 1}", nodes[i][0], nodes[i + 1][0]) for i in range(len(nodes) - 1)]
+        reply = (
+            f"我为你创建了一个分层架构图 🏗️\n\n{' → '.join(components)}\n\n"
+            "你可以告诉我组件之间更具体的调用关系，我来帮你完善！"
+        )
+        return self._wrap(cells), reply
+
+    def _render_mindmap(self, slots: Dict[str, Any]) -> tuple[str, str]:
+        topic = slots["topic"] or "中心主题"
+        branches = slots["labels"] or [f"分支 {i + 1}" for i in range(slots["count"] or 4)]
+        cx, cy = 380, 80 + max(1, (len(branches) + 1) // 2) * 40
+        cells = [self._vertex("center", topic, STYLE_CENTER, cx - 60, cy - 30, 120, 60)]
+
+        # 分支左右交替排列
+        left = [b for i, b in enumerate(branches) if i % 2 == 0]
+        right = [b for i, b in enumerate(branches) if i % 2 == 1]
+        index = 0
+        for side, items in ((-1, left), (1, right)):
+            top = cy - (len(items) * 80 - 40) // 2
+            for j, label in enumerate(items):
+                index += 1
+                bx = cx + side * 240 - 50
+                by = top + j * 80 - 20
+                color = BRANCH_COLORS[(index - 1) % len(BRANCH_COLORS)]
+                style = f"rounded=1;whiteSpace=wrap;html=1;{color}"
+                cells.append(self._vertex(f"branch{index}", label, style, bx, by, 100, 40))
+                cells.append(self._edge(f"line{index}", "center", f"branch{index}", STYLE_BRANCH_EDGE))
+        reply = (
+            f"我为你创建了一个以「{topic}」为中心的思维导图 🧠\n\n"
+            f"包含 {len(branches)} 个分支：{'、'.join(branches)}\n\n需要继续展开某个分支吗？"
+        )
+        return self._wrap(cells), reply
+
+    def render(self, match: TemplateMatch) -> Dict[str, Any]:
+        """按匹配结果生成与 GLMService.chat 相同结构的结果"""
+        renderer = {
+            FLOWCHART: self._render_flowchart,
+            ARCHITECTURE: self._render_architecture,
+            MINDMAP: self._render_mindmap,
+        }[match.diagram_type]
+        xml, reply = renderer(match.slots)
+        return {"action": "display", "xml": xml, "reply": reply, "source": "template"}
+
+    def try_serve(self, message: str) -> Optional[Dict[str, Any]]:
+        """
+        尝试用模板直接生成图表
+
+        Returns:
+            置信度足够时返回结果，否则返回 None（应回退到 GLM）
+        """
+        if not self.enabled:
+            return None
+        match = self.match(message)
+        if not match or match.confidence < self.min_confidence:
+            return None
+        return self.render(match)
+
+
+_template_engine: Optional[TemplateEngine] = None
+
+
+def get_template_engine() -> TemplateEngine:
+    """获取模板引擎单例"""
+    global _template_engine
+    if _template_engine is None:
+        _template_engine = TemplateEngine()
+    return _template_engine
@@ -0,0 +1,128 @@
+"""
+对话轮次编排
+调用 LLM 之前的几个步骤互不依赖，并行执行以缩短关键路径：
+
+- fetch_diagram: 从图表后端（MCP / 无头存储）读取当前图表
+- connect:       确保 GLM 客户端已创建、上游连接池中有可用连接
+- history:       构建系统提示词与对话历史前缀
+
+fetch_diagram 和 history 完成后补上当前消息（含图表 XML）即可发起 LLM 调用。
+connect 只是预热，不在关键路径上：它作为后台任务启动，准备阶段不等待它完成，
+建连慢于读取图表（或对话类轮次根本不读取图表）时留在后台继续，LLM 请求会复用或自行建立连接。
+
+各步骤耗时记录为 turn.<步骤> 指标（connect 只在准备阶段结束前完成时记录，否则计入 turn.connect_pending），
+turn.prepare 为准备阶段的墙钟耗时，turn.prepare_saved 为相比依次执行节省的时间（各步骤耗时之和减去墙钟耗时）。
+
+TURN_OVERLAP=0 时依次执行各步骤（含 connect），便于对比。
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Dict, List, Optional
+
+from app.services.intent import is_conversational
+from app.services.metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("fetch_diagram", "connect", "history")
+
+# 仍在后台进行的建连任务，保留引用避免任务被垃圾回收
+_background_connects = set()
+
+
+@dataclass
+class PreparedTurn:
+    """准备好的对话轮次"""
+    messages: List[Dict[str, str]]
+    current_xml: Optional[str] = None
+    # 各步骤及准备阶段的耗时（秒）
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def overlap_enabled() -> bool:
+    return os.getenv("TURN_OVERLAP", "1") == "1"
+
+
+async def _timed(timings: Dict[str, float], stage: str, awaitable: Awaitable) -> Any:
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+async def _connect(glm_service):
+    """建连失败不影响本轮对话，LLM 请求会自行建连"""
+    try:
+        await glm_service.connect()
+    except Exception as e:
+        logger.warning(f"[turn] 预先建连失败: {e}")
+
+
+async def _history(glm_service, history, intent) -> List[Dict[str, str]]:
+    return glm_service.prepare_history(history, intent)
+
+
+async def prepare_turn(
+    glm_service,
+    client,
+    session_id: str,
+    user_message: str,
+    history: List[Any] = None,
+    intent: str = None,
+) -> PreparedTurn:
+    """
+    并行完成调用 LLM 前的准备工作，上游建连在后台进行，不延长准备阶段
+
+    Args:
+        glm_service: GLMService
+        client: 会话对应的图表后端（MCP 客户端或无头图表存储）
+        intent: 预分类的意图，对话类意图不读取当前图表
+
+    Returns:
+        PreparedTurn，messages 可直接传给 glm_service.chat / chat_stream
+    """
+    timings: Dict[str, float] = {}
+    jobs = {"history": _history(glm_service, history, intent)}
+    if not is_conversational(intent):
+        jobs["fetch_diagram"] = client.get_diagram(session_id)
+
+    metrics = get_metrics()
+    start = time.perf_counter()
+    if overlap_enabled():
+        # 建连单独计时：后台任务可能在本函数返回后才完成，不能再写入返回的 timings
+        connect_timings: Dict[str, float] = {}
+        connect = asyncio.ensure_future(_timed(connect_timings, "connect", _connect(glm_service)))
+        _background_connects.add(connect)
+        connect.add_done_callback(_background_connects.discard)
+        tasks = {stage: asyncio.ensure_future(_timed(timings, stage, job)) for stage, job in jobs.items()}
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            # 读取图表失败或调用方取消时，一并取消其余步骤；建连不取消，留给后续请求复用
+            for task in tasks.values():
+                task.cancel()
+        results = {stage: task.result() for stage, task in tasks.items()}
+        if connect.done():
+            timings.update(connect_timings)
+        else:
+            metrics.incr("turn.connect_pending")
+    else:
+        await _timed(timings, "connect", _connect(glm_service))
+        results = {stage: await _timed(timings, stage, job) for stage, job in jobs.items()}
+    current_xml = results.get("fetch_diagram")
+    messages = glm_service.finish_messages(results["history"], user_message, current_xml, intent, session_id)
+    timings["prepare"] = time.perf_counter() - start
+
+    saved = max(0.0, sum(timings[stage] for stage in STAGES if stage in timings) - timings["prepare"])
+    for stage, seconds in timings.items():
+        metrics.observe(f"turn.{stage}", seconds)
+    metrics.observe("turn.prepare_saved", saved)
+    logger.info(
+        "[turn] 准备完成: " + ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+        + f", 节省 {saved * 1000:.1f}ms"
+    )
+    return PreparedTurn(messages=messages, current_xml=current_xml, timings=timings)
@@ -0,0 +1,207 @@
+"""
+流式 XML 格式检查
+模型以 JSON 输出图表时，XML 位于 "xml"（display）或 "new_xml"（edit 操作）字符串中。
+生成过程中边接收边解码这些 JSON 字符串，交给 expat 增量解析，第一个结构错误
+（标签不匹配、属性值中未转义的 & / <、非法字符等）出现时立即报告，
+调用方可以中止生成并重新请求，而不必等整个响应生成完才发现 XML 无效。
+
+只报告生成过程中就能确定的错误：
+- 值开头第一个 < 之前的内容被忽略，根元素闭合后的内容也不再检查（与 validate_and_fix_xml 的修复范围一致）；
+- 不做结束检查，缺少闭合标签（输出被截断）交给续写和截断修复处理。
+
+只适用于模型直接输出 XML 的模式（DIAGRAM_DSL=0）。默认的 DSL 模式下模型输出 JSON 图表描述，
+没有 xml / new_xml 字段，GLMService 不创建检查器。
+"""
+import xml.parsers.expat
+from typing import Iterable, Optional
+
+# 需要检查的 JSON 字段
+XML_FIELDS = ("xml", "new_xml")
+
+# 判断字符串是否为字段名时最多保留的长度
+_MAX_KEY_LEN = 32
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+_JUNK_AFTER_ROOT = xml.parsers.expat.errors.codes[xml.parsers.expat.errors.XML_ERROR_JUNK_AFTER_DOC_ELEMENT]
+
+
+class XMLStreamError(Exception):
+    """生成中的 XML 出现结构错误"""
+
+    def __init__(self, field: str, message: str, line: int, column: int):
+        self.field = field
+        self.message = message
+        self.line = line
+        self.column = column
+        super().__init__(f"{field} 第 {line} 行第 {column} 列: {message}")
+
+
+class StreamingXMLChecker:
+    """增量检查单个 XML 文档的格式"""
+
+    def __init__(self, field: str = "xml"):
+        self.field = field
+        self.error: Optional[XMLStreamError] = None
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._parser = xml.parsers.expat.ParserCreate()
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+
+    def _start(self, name, attrs):
+        self._depth += 1
+
+    def _end(self, name):
+        self._depth -= 1
+        if self._depth == 0:
+            self._finished = True
+
+    def feed(self, text: str) -> Optional[XMLStreamError]:
+        """送入一段已解码的 XML 文本，返回第一个结构错误（没有错误时返回 None）"""
+        if self.error is not None or self._finished:
+            return self.error
+        if not self._started:
+            start = text.find("<")
+            if start == -1:
+                return None
+            text = text[start:]
+            self._started = True
+        try:
+            self._parser.Parse(text, False)
+        except xml.parsers.expat.ExpatError as e:
+            if not (self._finished and e.code == _JUNK_AFTER_ROOT):
+                self.error = XMLStreamError(
+                    self.field, xml.parsers.expat.errors.messages[e.code], e.lineno, e.offset
+                )
+        return self.error
+
+
+class JsonXMLFieldChecker:
+    """
+    扫描模型输出的 JSON 文本，检查其中 XML 字段的格式
+
+    不要求输出是合法 JSON（可能带代码块标记或前后说明文字），只识别形如 "xml": "..." 的字段，
+    逐段解码 JSON 转义后交给 StreamingXMLChecker。每个字段值单独检查。
+    """
+
+    def __init__(self, fields: Iterable[str] = XML_FIELDS):
+        self.fields = set(fields)
+        self.error: Optional[XMLStreamError] = None
+        # 扫描状态：out / string / after_string / after_colon / value
+        self._state = "out"
+        self._string: Optional[list] = []
+        self._key: Optional[str] = None
+        # 跨片段的未完成转义（含反斜杠）
+        self._escape = ""
+        # 等待配对的高位代理项
+        self._surrogate = ""
+        self._checker: Optional[StreamingXMLChecker] = None
+
+    def feed(self, text: str) -> Optional[XMLStreamError]:
+        """送入一段模型输出，返回第一个 XML 结构错误（没有错误时返回 None）"""
+        if self.error is not None:
+            return self.error
+        i, n = 0, len(text)
+        while i < n and self.error is None:
+            state = self._state
+            if state == "value" or state == "string":
+                i = self._scan_string(text, i)
+                continue
+            ch = text[i]
+            if state == "out":
+                if ch == '"':
+                    self._enter_string()
+            elif state == "after_string":
+                if ch == ":":
+                    self._state = "after_colon"
+                elif not ch.isspace():
+                    self._state = "out"
+                    continue
+            elif state == "after_colon":
+                if ch == '"':
+                    if self._key in self.fields:
+                        self._state = "value"
+                        self._checker = StreamingXMLChecker(self._key)
+                    else:
+                        self._enter_string()
+                elif not ch.isspace():
+                    self._state = "out"
+                    continue
+            i += 1
+        return self.error
+
+    def _enter_string(self):
+        self._state = "string"
+        self._string = []
+
+    def _scan_string(self, text: str, i: int) -> int:
+        """处理字符串内容直到字符串结束或片段结束，返回下一个待处理的位置"""
+        decoded = []
+        n = len(text)
+        while i < n:
+            if self._escape:
+                # 补齐跨片段的转义序列
+                if len(self._escape) == 1:
+                    self._escape += text[i]
+                    i += 1
+                need = 6 if self._escape[1] == "u" else 2
+                take = min(need - len(self._escape), n - i)
+                self._escape += text[i:i + take]
+                i += take
+                if len(self._escape) < need:
+                    break
+                decoded.append(self._decode_escape(self._escape))
+                self._escape = ""
+                continue
+            end = i
+            while end < n and text[end] != '"' and text[end] != "\\":
+                end += 1
+            if end > i:
+                decoded.append(text[i:end])
+            if end == n:
+                i = n
+                break
+            if text[end] == "\\":
+                self._escape = "\\"
+                i = end + 1
+                continue
+            # 字符串结束
+            self._emit("".join(decoded), closing=True)
+            return end + 1
+        self._emit("".join(decoded), closing=False)
+        return i
+
+    def _decode_escape(self, escape: str) -> str:
+        if escape[1] != "u":
+            return _ESCAPES.get(escape[1], escape[1])
+        try:
+            code = int(escape[2:], 16)
+        except ValueError:
+            return ""
+        if 0xD800 <= code < 0xDC00:
+            self._surrogate = chr(code)
+            return ""
+        if 0xDC00 <= code < 0xE000 and self._surrogate:
+            pair = (self._surrogate + chr(code)).encode("utf-16-le", "surrogatepass").decode("utf-16-le")
+            self._surrogate = ""
+            return pair
+        return chr(code)
+
+    def _emit(self, decoded: str, closing: bool):
+        if self._state == "value":
+            if decoded:
+                self.error = self._checker.feed(decoded)
+            if closing:
+                self._checker = None
+                self._state = "out"
+            return
+        # 普通字符串：只保留较短的内容，用于判断是否为字段名
+        if self._string is not None:
+            self._string.append(decoded)
+            if sum(map(len, self._string)) > _MAX_KEY_LEN:
+                self._string = None
+        if closing:
+            self._key = "".join(self._string) if self._string is not None else None
+            self._state = "after_string"
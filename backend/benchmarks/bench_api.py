@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+API 吞吐与延迟基准测试
+在进程内运行完整的 FastAPI 应用，后端连接桩 LLM 与桩 MCP Server，无需网络和 npx
+
+覆盖接口：
+- POST /api/chat/{id}
+- POST /api/chat/{id}/stream（额外记录首字节时间 TTFB）
+- GET  /api/diagram/{id}
+- GET  /api/diagram/{id}/download
+
+运行方式：
+    cd backend
+    python -m benchmarks.bench_api
+    python -m benchmarks.bench_api --concurrency 1,8,32 --requests 64
+    python -m benchmarks.bench_api --save-baseline        # 保存基线
+    python -m benchmarks.bench_api --compare              # 与基线对比
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Dict, Any, List, Callable, Awaitable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from benchmarks.harness import BackgroundServer, configure_stub_environment
+from benchmarks.stats import (
+    summarize, save_baseline, load_baseline, compare_results,
+    print_table, print_comparison,
+)
+from benchmarks.stub_llm import StubLLMServer
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "api_baseline.json")
+
+SCENARIOS = ["chat", "chat_stream", "diagram", "download"]
+
+DRAW_MESSAGE = "帮我画一个流程图"
+
+
+async def _scenario_chat(client: httpx.AsyncClient, session_id: str) -> Dict[str, float]:
+    resp = await client.post(f"/api/chat/{session_id}", json={"message": DRAW_MESSAGE, "history": []})
+    resp.raise_for_status()
+    return {}
+
+
+async def _scenario_chat_stream(client: httpx.AsyncClient, session_id: str) -> Dict[str, float]:
+    start = time.perf_counter()
+    ttfb = None
+    async with client.stream(
+        "POST", f"/api/chat/{session_id}/stream",
+        json={"message": DRAW_MESSAGE, "history": []}
+    ) as resp:
+        resp.raise_for_status()
+        async for _ in resp.aiter_bytes():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+    return {"ttfb": ttfb or 0.0}
+
+
+async def _scenario_diagram(client: httpx.AsyncClient, session_id: str) -> Dict[str, float]:
+    resp = await client.get(f"/api/diagram/{session_id}")
+    resp.raise_for_status()
+    return {}
+
+
+async def _scenario_download(client: httpx.AsyncClient, session_id: str) -> Dict[str, float]:
+    resp = await client.get(f"/api/diagram/{session_id}/download")
+    resp.raise_for_status()
+    return {}
+
+
+SCENARIO_FUNCS: Dict[str, Callable[[httpx.AsyncClient, str], Awaitable[Dict[str, float]]]] = {
+    "chat": _scenario_chat,
+    "chat_stream": _scenario_chat_stream,
+    "diagram": _scenario_diagram,
+    "download": _scenario_download,
+}
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    scenario: str,
+    session_ids: List[str],
+    concurrency: int,
+    total_requests: int
+) -> Dict[str, Any]:
+    """以固定并发数执行 total_requests 次请求并汇总"""
+    func = SCENARIO_FUNCS[scenario]
+    latencies: List[float] = []
+    ttfbs: List[float] = []
+    errors = 0
+    remaining = total_requests
+
+    async def worker(worker_id: int):
+        nonlocal remaining, errors
+        session_id = session_ids[worker_id % len(session_ids)]
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            try:
+                extra = await func(client, session_id)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if "ttfb" in extra:
+                ttfbs.append(extra["ttfb"])
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    stats = summarize(latencies, time.perf_counter() - wall_start, errors)
+    if ttfbs:
+        ttfb_stats = summarize(ttfbs, 1.0)
+        stats["ttfb_p50_ms"] = ttfb_stats["p50_ms"]
+        stats["ttfb_p95_ms"] = ttfb_stats["p95_ms"]
+    return stats
+
+
+async def run_benchmark(base_url: str, scenarios: List[str], levels: List[int], requests: int) -> Dict[str, Any]:
+    """依次运行所有场景和并发档位"""
+    results: Dict[str, Any] = {}
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        # 准备会话，并画一张初始图供读取类场景使用
+        session_ids = []
+        for _ in range(min(max(levels), 4)):
+            resp = await client.post("/api/session")
+            resp.raise_for_status()
+            session_ids.append(resp.json()["session_id"])
+        await _scenario_chat(client, session_ids[0])
+
+        for scenario in scenarios:
+            # 预热
+            await SCENARIO_FUNCS[scenario](client, session_ids[0])
+            results[scenario] = {}
+            for level in levels:
+                stats = await run_level(client, scenario, session_ids, level, max(requests, level))
+                results[scenario][f"c={level}"] = stats
+                print(
+                    f"  {scenario:<14} c={level:<4} p50={stats['p50_ms']:.1f}ms "
+                    f"p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms "
+                    f"rps={stats['rps']:.1f} errors={stats['errors']}"
+                )
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DrawIO AI API 基准测试（离线桩环境）")
+    parser.add_argument("--concurrency", default="1,4,16", help="并发档位，逗号分隔 (默认: 1,4,16)")
+    parser.add_argument("--requests", type=int, default=16, help="每个档位的请求数 (默认: 16)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"场景列表 (默认: {','.join(SCENARIOS)})")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="桩 LLM 首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="桩 LLM token 速率")
+    parser.add_argument("--nodes", type=int, default=8, help="桩 LLM 生成流程图的节点数")
+    parser.add_argument("--mcp-latency", type=float, default=0.002, help="桩 MCP 每次工具调用耗时（秒）")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--compare", action="store_true", help="与基线对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定退化的相对变化阈值 (默认: 0.2)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="存在退化时以非零状态码退出")
+    parser.add_argument("--verbose", "-v", action="store_true", help="显示后端日志")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIO_FUNCS]
+    if unknown:
+        print(f"未知场景: {unknown}，可用场景: {SCENARIOS}")
+        return 2
+
+    stub_llm = StubLLMServer(
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second,
+        diagram_nodes=args.nodes,
+    )
+    stub_llm.start()
+    configure_stub_environment(stub_llm.base_url, args.mcp_latency)
+
+    from app.main import app
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    server = BackgroundServer(app)
+    server.start()
+
+    print("=" * 60)
+    print("DrawIO AI API 基准测试")
+    print("=" * 60)
+    print(f"桩 LLM: {stub_llm.base_url} (首 token {args.first_token_latency}s, {args.tokens_per_second} tok/s)")
+    print(f"后端:   {server.base_url}")
+    print(f"并发档位: {levels}, 每档请求数: {args.requests}")
+    print()
+
+    try:
+        results = asyncio.run(run_benchmark(server.base_url, scenarios, levels, args.requests))
+    finally:
+        server.stop()
+        stub_llm.stop()
+
+    print()
+    print_table(results, ["p50_ms", "p95_ms", "p99_ms", "rps", "errors"])
+
+    meta = {
+        "concurrency": levels,
+        "requests": args.requests,
+        "first_token_latency": args.first_token_latency,
+        "tokens_per_second": args.tokens_per_second,
+        "nodes": args.nodes,
+        "mcp_latency": args.mcp_latency,
+    }
+
+    exit_code = 0
+    if args.compare:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"\n⚠️ 基线文件不存在: {args.baseline}")
+        else:
+            if baseline.get("meta") != meta:
+                print("\n⚠️ 基线参数与本次不同，对比结果仅供参考")
+            print(f"\n与基线对比 ({args.baseline}):")
+            regressions = print_comparison(compare_results(baseline["results"], results, args.threshold))
+            if regressions and args.fail_on_regression:
+                exit_code = 1
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, meta)
+        print(f"\n✓ 基线已保存: {args.baseline}")
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+编辑上下文选择基准测试
+在不同形态、不同规模的图表上构造一组编辑请求（按标签 / id 引用节点、修改两节点间的连线、
+在节点后插入新节点），对比发送整张图表与只发送相关子图 + 概要的 token 数，
+并检查完成编辑所需的单元格是否都出现在选出的上下文中（上下文召回率）：
+所需单元格缺失时模型无法正确引用它们，召回率即选择后编辑准确率的上限。
+
+运行方式：
+    cd backend
+    python -m benchmarks.bench_context
+    python -m benchmarks.bench_context --cells 200 1000 3000 --budget 3000
+"""
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import time
+from typing import Dict, List, Set, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import diagrams
+from benchmarks.stats import print_table
+from app.services.context_select import estimate_tokens, select_edit_context
+from app.services.diagram_index import DiagramIndex
+
+DOMAINS = ["订单", "用户", "支付", "库存", "物流", "消息", "认证", "搜索", "推荐", "评论", "优惠券", "结算"]
+ROLES = ["服务", "数据库", "缓存", "网关", "队列", "接口", "调度器", "日志"]
+
+
+def architecture(cells: int, seed: int = 0) -> str:
+    """带业务含义标签的稠密图（标签之间共享「服务」「数据库」等常见词）"""
+    xml = diagrams.dense(cells, seed=seed, edges_per_node=2)
+    counter = iter(range(cells))
+
+    def relabel(match):
+        i = next(counter)
+        label = DOMAINS[i % len(DOMAINS)] + ROLES[(i // len(DOMAINS)) % len(ROLES)]
+        round_ = i // (len(DOMAINS) * len(ROLES))
+        return f'value="{label}{f" {round_ + 1}" if round_ else ""}"'
+
+    return re.sub(r'value="服务 \d+"', relabel, xml)
+
+
+FIXTURES = {
+    "flowchart": diagrams.flowchart,
+    "nested": diagrams.nested,
+    "architecture": architecture,
+}
+
+
+def make_requests(index: DiagramIndex, count: int, seed: int = 0) -> List[Tuple[str, Set[str]]]:
+    """构造编辑请求及完成编辑所需的单元格"""
+    rng = random.Random(seed)
+    nodes = sorted(cid for cid in index.vertices if index.labels.get(cid) and not index.is_container(cid))
+    edges = sorted(index.endpoints)
+    requests = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            cid = rng.choice(nodes)
+            requests.append((f"把「{index.labels[cid]}」改成红色", {cid}))
+        elif kind == 1:
+            cid = rng.choice(nodes)
+            requests.append((f"删除 {cid} 这个节点", {cid}))
+        elif kind == 2 and edges:
+            eid = rng.choice(edges)
+            source, target = index.endpoints[eid]
+            requests.append((
+                f"把{index.labels[source]}和{index.labels[target]}之间的连线改成虚线",
+                {source, target, eid},
+            ))
+        else:
+            cid = rng.choice(nodes)
+            requests.append((f"在{index.labels[cid]}后面加一个「人工审核」节点", {cid}))
+    return requests
+
+
+def run_fixture(name: str, cells: int, budget: int, hops: int, count: int) -> Dict[str, float]:
+    xml = FIXTURES[name](cells)
+    index = DiagramIndex.from_xml(xml)
+    full_tokens = estimate_tokens(xml)
+    selected_tokens, hits, fallbacks, elapsed = 0, 0, 0, 0.0
+    requests = make_requests(index, count)
+    for message, needed in requests:
+        start = time.perf_counter()
+        context = select_edit_context(xml, message, budget, hops)
+        elapsed += time.perf_counter() - start
+        if context is None:
+            # 发送整张图表，所需单元格必然都在
+            fallbacks += 1
+            selected_tokens += full_tokens
+            hits += 1
+            continue
+        selected_tokens += context.tokens
+        ids = set(re.findall(r'<mxCell id="([^"]+)"', context.xml))
+        hits += needed <= ids
+    avg = selected_tokens / len(requests)
+    return {
+        "full_tok": full_tokens,
+        "sent_tok": round(avg),
+        "reduction": f"{full_tokens / avg:.1f}x",
+        "recall": f"{hits / len(requests) * 100:.0f}%",
+        "fallback": fallbacks,
+        "select_ms": round(elapsed / len(requests) * 1000, 2),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DrawIO AI 编辑上下文选择基准测试")
+    parser.add_argument("--cells", type=int, nargs="+", default=[200, 1000, 3000], help="图表单元格数")
+    parser.add_argument("--budget", type=int, default=3000, help="图表上下文 token 预算 (默认: 3000)")
+    parser.add_argument("--hops", type=int, default=1, help="邻域跳数 (默认: 1)")
+    parser.add_argument("--requests", type=int, default=40, help="每张图表的编辑请求数 (默认: 40)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    print("=" * 60)
+    print(f"DrawIO AI 编辑上下文选择基准测试: 预算 {args.budget} tokens, {args.hops} 跳")
+    print("=" * 60)
+
+    results = {
+        name: {f"{cells}": run_fixture(name, cells, args.budget, args.hops, args.requests) for cells in args.cells}
+        for name in FIXTURES
+    }
+    print_table(results, ["full_tok", "sent_tok", "reduction", "recall", "fallback", "select_ms"], level_name="cells")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+事件循环延迟基准测试
+并发处理多个大图表（响应解析 → 自动布局 → XML 校验修复，与一轮对话的 CPU 阶段相同）的同时，
+用 loop_monitor 采样事件循环延迟，对比两种模式：
+
+- inline:  所有 CPU 阶段在事件循环中执行（CPU_OFFLOAD_THRESHOLD=-1）
+- offload: 超过阈值的输入交给 cpu_pool 线程池
+
+延迟越低，其他连接（流式输出、断开检测、小请求）受大图表的影响越小。
+
+运行方式：
+    cd backend
+    python -m benchmarks.bench_loop_lag
+    python -m benchmarks.bench_loop_lag --cells 3000 --jobs 8
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from benchmarks import diagrams
+from benchmarks.stats import print_table
+from app.services.cpu_pool import CpuPool
+from app.services.glm_service import GLMService
+from app.services.layout import get_layout_engine
+from app.services.loop_monitor import monitor_loop_lag
+from app.services.mcp_client import validate_and_fix_xml
+from app.services.metrics import get_metrics
+
+
+def _process(glm: GLMService, response: str) -> bool:
+    result = glm._parse_response(response)
+    xml = get_layout_engine().apply(result["xml"], None)
+    return validate_and_fix_xml(xml)[0]
+
+
+async def run_mode(threshold: int, cells: int, jobs: int, interval: float) -> Dict[str, float]:
+    os.environ["CPU_OFFLOAD_THRESHOLD"] = str(threshold)
+    pool = CpuPool()
+    glm = GLMService()
+    response = diagrams.display_response(diagrams.flowchart(cells))
+    metrics = get_metrics()
+    metrics.reset()
+
+    monitor = asyncio.create_task(monitor_loop_lag(interval))
+    await asyncio.sleep(interval * 2)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        pool.run(_process, glm, response, size=len(response)) for _ in range(jobs)
+    ))
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(interval * 2)
+    monitor.cancel()
+    await asyncio.gather(monitor, return_exceptions=True)
+    pool.shutdown()
+
+    assert all(results)
+    lag = metrics.snapshot()["timings"]["loop.lag"]
+    return {
+        "count": lag["count"],
+        "lag_p50_ms": round(lag["p50"] * 1000, 1),
+        "lag_p95_ms": round(lag["p95"] * 1000, 1),
+        "lag_max_ms": round(lag["max"] * 1000, 1),
+        "total_ms": round(elapsed * 1000, 1),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DrawIO AI 事件循环延迟基准测试")
+    parser.add_argument("--cells", type=int, default=3000, help="每张图表的单元格数 (默认: 3000)")
+    parser.add_argument("--jobs", type=int, default=8, help="并发处理的图表数 (默认: 8)")
+    parser.add_argument("--interval", type=float, default=0.01, help="延迟采样间隔（秒）(默认: 0.01)")
+    parser.add_argument("--threshold", type=int, default=65536, help="offload 模式的卸载阈值（字符）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    print("=" * 60)
+    print(f"DrawIO AI 事件循环延迟基准测试: {args.jobs} 张 {args.cells} 单元格的图表")
+    print("=" * 60)
+
+    results = {
+        "inline": {"loop": asyncio.run(run_mode(-1, args.cells, args.jobs, args.interval))},
+        "offload": {"loop": asyncio.run(run_mode(args.threshold, args.cells, args.jobs, args.interval))},
+    }
+    print_table(results, ["count", "lag_p50_ms", "lag_p95_ms", "lag_max_ms", "total_ms"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
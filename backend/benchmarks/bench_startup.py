@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+冷启动基准测试
+在全新子进程中测量后端的启动开销，作为容器重启 / 弹性扩容的冷启动预算：
+
+- import_app_main: `python -X importtime -c "import app.main"` 中 app.main 的累计导入耗时
+- startup_ready:   从进程开始导入到 lifespan 启动完成（可以接收请求）的墙钟时间
+
+同时检查导入 app.main 时不应加载的重型依赖（openai / mcp / redis / httpx），
+它们应推迟到首次使用或启动后的后台预热时导入。
+
+运行方式：
+    cd backend
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --budget-ms 800
+    python -m benchmarks.bench_startup --save-baseline
+    python -m benchmarks.bench_startup --compare --fail-on-regression
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stats import (
+    percentile, save_baseline, load_baseline, compare_results,
+    print_table, print_comparison,
+)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "startup_baseline.json")
+
+# 导入 app.main 时不应加载的模块
+LAZY_MODULES = ["openai", "mcp", "redis", "httpx"]
+
+# 对比指标：(名称, 数值越大越好)
+STARTUP_METRICS = [
+    ("p50_ms", False),
+    ("max_ms", False),
+]
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+# 在子进程中测量到 lifespan 启动完成的耗时
+_READY_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+from app.main import app, lifespan
+imported = time.perf_counter()
+
+async def main():
+    async with lifespan(app):
+        ready = time.perf_counter()
+        print(json.dumps({"import": imported - start, "ready": ready - start}))
+
+asyncio.run(main())
+"""
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # 配置 API Key 以覆盖生产路径（客户端在导入时不应创建）
+    env.setdefault("GLM_API_KEY", "bench-startup")
+    env["STARTUP_PREWARM"] = "0"
+    return env
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """
+    解析 -X importtime 输出
+
+    Returns:
+        (模块名, 自身耗时 µs, 累计耗时 µs, 嵌套深度) 列表
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def measure_import() -> Tuple[float, List[Tuple[str, int, int, int]]]:
+    """在新进程中导入 app.main，返回 (累计耗时秒, importtime 明细)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True,
+    )
+    entries = parse_importtime(proc.stderr)
+    total = next(cumulative for name, _, cumulative, _ in entries if name == "app.main")
+    return total / 1e6, entries
+
+
+def measure_ready() -> float:
+    """在新进程中导入并完成 lifespan 启动，返回墙钟耗时（秒）"""
+    proc = subprocess.run(
+        [sys.executable, "-c", _READY_SCRIPT],
+        cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])["ready"]
+
+
+def _stats(samples: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def heaviest_imports(entries: List[Tuple[str, int, int, int]], top: int) -> List[Tuple[str, int]]:
+    """app.main 直接触发的导入中累计耗时最高的模块（只看最外层，避免重复计算）"""
+    outer = [(name, cumulative) for name, _, cumulative, depth in entries if depth <= 1 and name != "app.main"]
+    return sorted(outer, key=lambda x: -x[1])[:top]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="DrawIO AI 冷启动基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数，取中位数 (默认: 5)")
+    parser.add_argument("--top", type=int, default=10, help="列出耗时最高的导入数 (默认: 10)")
+    parser.add_argument("--budget-ms", type=float, default=0, help="启动耗时预算（毫秒），startup_ready 中位数超出时失败")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--compare", action="store_true", help="与基线对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定退化的相对变化阈值 (默认: 0.2)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="存在退化时以非零状态码退出")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    print("=" * 60)
+    print("DrawIO AI 冷启动基准测试")
+    print("=" * 60)
+
+    import_samples, ready_samples = [], []
+    entries = []
+    for _ in range(args.runs):
+        seconds, entries = measure_import()
+        import_samples.append(seconds)
+        ready_samples.append(measure_ready())
+
+    results = {
+        "import_app_main": {"cold": _stats(import_samples)},
+        "startup_ready": {"cold": _stats(ready_samples)},
+    }
+    print_table(results, ["count", "p50_ms", "max_ms"])
+
+    print(f"\n耗时最高的 {args.top} 个导入（累计，最后一次测量）:")
+    for name, cumulative in heaviest_imports(entries, args.top):
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    exit_code = 0
+    loaded = {name.split(".")[0] for name, _, _, _ in entries}
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    if eager:
+        print(f"\n✗ 导入 app.main 时加载了应延迟导入的模块: {eager}")
+        exit_code = 1
+    else:
+        print(f"\n✓ 未提前加载: {LAZY_MODULES}")
+
+    if args.budget_ms:
+        ready_ms = results["startup_ready"]["cold"]["p50_ms"]
+        within = ready_ms <= args.budget_ms
+        print(f"{'✓' if within else '✗'} 启动耗时 {ready_ms} ms，预算 {args.budget_ms:g} ms")
+        if not within:
+            exit_code = 1
+
+    meta = {"runs": args.runs}
+    if args.compare:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"\n⚠️ 基线文件不存在: {args.baseline}")
+        else:
+            print(f"\n与基线对比 ({args.baseline}):")
+            regressions = print_comparison(
+                compare_results(baseline["results"], results, args.threshold, STARTUP_METRICS)
+            )
+            if regressions and args.fail_on_regression:
+                exit_code = 1
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, meta)
+        print(f"\n✓ 基线已保存: {args.baseline}")
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+XML 解析 / 修复路径的规模伸缩基准测试
+按单元格数量（默认 10 → 10000）测量各函数的耗时与内存峰值，并检测非线性增长
+
+被测函数：
+- DrawioMCPClient._validate_and_fix_xml   （合法 / 缺闭合标签 / 无法修复）
+- GLMService._parse_response               （直接 JSON / markdown 代码块 / 截断）
+- GLMService._try_fix_truncated_json       （截断的 display 响应）
+- DrawioMCPClient._wrap_as_drawio_file
+- LayoutEngine.apply                       （去掉坐标后重新布局）
+
+运行方式：
+    cd backend
+    python -m benchmarks.bench_xml
+    python -m benchmarks.bench_xml --sizes 10,100,1000 --shapes flowchart,dense
+    python -m benchmarks.bench_xml --save-baseline
+    python -m benchmarks.bench_xml --compare --fail-on-regression
+"""
+import argparse
+import gc
+import logging
+import math
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, Any, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import diagrams
+from benchmarks.stats import save_baseline, load_baseline, compare_results, print_table, print_comparison
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "xml_baseline.json")
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# 对比指标：(名称, 数值越大越好)
+XML_METRICS = [("time_ms", False), ("peak_kb", False)]
+
+
+def build_cases() -> Dict[str, Tuple[Callable[[str], Any], Callable[[str], str]]]:
+    """
+    构建被测用例
+
+    Returns:
+        {用例名: (被测函数, 输入构造函数)}，输入构造函数接收合法的 mxGraphModel XML
+    """
+    os.environ.setdefault("GLM_API_KEY", "")
+    from app.services.glm_service import GLMService
+    from app.services.layout import LayoutEngine
+    from app.services.mcp_client import DrawioMCPClient
+
+    glm = GLMService()
+    mcp = DrawioMCPClient()
+
+    return {
+        "validate_fix.valid": (mcp._validate_and_fix_xml, lambda xml: xml),
+        "validate_fix.missing_closing": (mcp._validate_and_fix_xml, diagrams.missing_closing_tags),
+        "validate_fix.unfixable": (mcp._validate_and_fix_xml, diagrams.with_unescaped_quote),
+        "parse_response.direct": (glm._parse_response, diagrams.display_response),
+        "parse_response.fenced": (glm._parse_response, lambda xml: diagrams.fenced(diagrams.display_response(xml))),
+        "parse_response.truncated": (glm._parse_response, diagrams.truncated_display_response),
+        "try_fix_truncated": (glm._try_fix_truncated_json, diagrams.truncated_display_response),
+        "wrap_drawio": (mcp._wrap_as_drawio_file, lambda xml: xml),
+        "layout": (LayoutEngine(mode="always").apply, lambda xml: xml),
+    }
+
+
+def measure_time(func: Callable[[str], Any], arg: str, min_time: float, min_runs: int = 3) -> float:
+    """多次运行取中位数耗时（秒），至少运行 min_runs 次且总时长不少于 min_time"""
+    samples = []
+    total = 0.0
+    while len(samples) < min_runs or total < min_time:
+        start = time.perf_counter()
+        func(arg)
+        elapsed = time.perf_counter() - start
+        samples.append(elapsed)
+        total += elapsed
+        if len(samples) >= 1000:
+            break
+    return statistics.median(samples)
+
+
+def measure_peak_memory(func: Callable[[str], Any], arg: str) -> int:
+    """单次运行的内存峰值（字节，不含输入本身）"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def growth_exponent(points: List[Tuple[int, float]]) -> float:
+    """
+    相邻规模间的最大增长指数 log(t2/t1) / log(n2/n1)
+    线性算法约为 1，二次算法约为 2
+    """
+    worst = 0.0
+    for (n1, t1), (n2, t2) in zip(points, points[1:]):
+        if t1 <= 0 or t2 <= 0 or n2 == n1:
+            continue
+        worst = max(worst, math.log(t2 / t1) / math.log(n2 / n1))
+    return round(worst, 2)
+
+
+def run_benchmark(sizes: List[int], shapes: List[str], case_names: List[str], min_time: float) -> Dict[str, Any]:
+    """运行所有用例，返回 {用例: {"形态/规模": 指标}}"""
+    cases = build_cases()
+    results: Dict[str, Any] = {}
+    for name in case_names:
+        func, make_input = cases[name]
+        results[name] = {}
+        for shape in shapes:
+            points = []
+            for size in sizes:
+                arg = make_input(diagrams.GENERATORS[shape](size))
+                elapsed = measure_time(func, arg, min_time)
+                peak = measure_peak_memory(func, arg)
+                points.append((size, elapsed))
+                results[name][f"{shape}/{size}"] = {
+                    "time_ms": round(elapsed * 1000, 4),
+                    "peak_kb": round(peak / 1024, 1),
+                    "input_kb": round(len(arg.encode("utf-8")) / 1024, 1),
+                }
+            results[name][f"{shape}/{size}"]["exponent"] = growth_exponent(points)
+            print(f"  {name:<30} {shape:<10} 增长指数={growth_exponent(points)}")
+    return results
+
+
+def find_nonlinear(results: Dict[str, Any], max_exponent: float) -> List[str]:
+    """找出增长指数超过阈值的用例"""
+    flagged = []
+    for name, levels in results.items():
+        for level, stats in levels.items():
+            if stats.get("exponent", 0) > max_exponent:
+                flagged.append(f"{name} [{level.split('/')[0]}] 增长指数 {stats['exponent']}")
+    return flagged
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="XML 解析/修复路径规模伸缩基准测试")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="单元格数量档位，逗号分隔")
+    parser.add_argument("--shapes", default=",".join(diagrams.GENERATORS), help="图表形态，逗号分隔")
+    parser.add_argument("--cases", default="", help="只运行指定用例（逗号分隔，默认全部）")
+    parser.add_argument("--min-time", type=float, default=0.05, help="每个测点的最少计时时长（秒）")
+    parser.add_argument("--max-exponent", type=float, default=1.5, help="允许的最大增长指数 (默认: 1.5)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件路径")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果保存为基线")
+    parser.add_argument("--compare", action="store_true", help="与基线对比")
+    parser.add_argument("--threshold", type=float, default=0.3, help="判定退化的相对变化阈值 (默认: 0.3)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="存在退化或非线性增长时以非零状态码退出")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    sizes = sorted(int(x) for x in args.sizes.split(",") if x.strip())
+    shapes = [s.strip() for s in args.shapes.split(",") if s.strip()]
+    all_cases = list(build_cases())
+    case_names = [c.strip() for c in args.cases.split(",") if c.strip()] or all_cases
+    unknown = [c for c in case_names if c not in all_cases] + [s for s in shapes if s not in diagrams.GENERATORS]
+    if unknown:
+        print(f"未知用例或形态: {unknown}")
+        print(f"可用用例: {all_cases}")
+        return 2
+
+    # 被测函数会输出大量修复日志，基准测试期间关闭
+    logging.disable(logging.CRITICAL)
+
+    print("=" * 60)
+    print("XML 解析/修复路径规模伸缩基准测试")
+    print("=" * 60)
+    print(f"规模: {sizes}, 形态: {shapes}")
+    print()
+
+    results = run_benchmark(sizes, shapes, case_names, args.min_time)
+
+    print()
+    print_table(results, ["time_ms", "peak_kb", "input_kb", "exponent"], level_name="shape/cells")
+
+    exit_code = 0
+    flagged = find_nonlinear(results, args.max_exponent)
+    print()
+    if flagged:
+        print(f"⚠️ 检测到非线性增长（指数 > {args.max_exponent}）:")
+        for line in flagged:
+            print(f"  - {line}")
+        if args.fail_on_regression:
+            exit_code = 1
+    else:
+        print(f"✓ 所有用例增长指数均不超过 {args.max_exponent}")
+
+    meta = {"sizes": sizes, "shapes": shapes}
+    if args.compare:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"\n⚠️ 基线文件不存在: {args.baseline}")
+        else:
+            print(f"\n与基线对比 ({args.baseline}):")
+            rows = compare_results(baseline["results"], results, args.threshold, XML_METRICS)
+            if print_comparison(rows) and args.fail_on_regression:
+                exit_code = 1
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, meta)
+        print(f"\n✓ 基线已保存: {args.baseline}")
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
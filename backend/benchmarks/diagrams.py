@@ -0,0 +1,166 @@
+"""
+合成 mxGraph 图表生成器
+为基准测试和单元测试提供不同规模、不同形态的图表，以及截断/损坏的变体
+
+图表形态：
+- flowchart: 纵向线性流程图（节点 + 相邻连线）
+- nested: 多层嵌套的分组容器（泳道套泳道）
+- dense: 稠密的有向图（每个节点有多条出边）
+
+所有生成结果由 seed 决定，保证可复现。
+"""
+import json
+import random
+from typing import Callable, Dict, List
+
+NODE_STYLE = "rounded=1;whiteSpace=wrap;html=1;fillColor=#dae8fc;strokeColor=#6c8ebf;"
+CONTAINER_STYLE = "swimlane;whiteSpace=wrap;html=1;fillColor=#f5f5f5;strokeColor=#666666;"
+EDGE_STYLE = "edgeStyle=orthogonalEdgeStyle;rounded=0;orthogonalLoop=1;jettySize=auto;html=1;endArrow=classic;"
+
+MODEL_OPEN = (
+    '<mxGraphModel dx="1434" dy="780" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" '
+    'arrows="1" fold="1" page="1" pageScale="1" pageWidth="827" pageHeight="1169" math="0" shadow="0">'
+)
+
+
+def vertex(cell_id: str, label: str, x: int, y: int, parent: str = "1",
+           style: str = NODE_STYLE, width: int = 120, height: int = 60) -> str:
+    """生成一个顶点 mxCell"""
+    return (
+        f'<mxCell id="{cell_id}" value="{label}" style="{style}" vertex="1" parent="{parent}">'
+        f'<mxGeometry x="{x}" y="{y}" width="{width}" height="{height}" as="geometry"/></mxCell>'
+    )
+
+
+def edge(cell_id: str, source: str, target: str, parent: str = "1", label: str = "") -> str:
+    """生成一条连线 mxCell"""
+    value = f' value="{label}"' if label else ""
+    return (
+        f'<mxCell id="{cell_id}"{value} style="{EDGE_STYLE}" edge="1" parent="{parent}" '
+        f'source="{source}" target="{target}"><mxGeometry relative="1" as="geometry"/></mxCell>'
+    )
+
+
+def wrap_model(cells: List[str]) -> str:
+    """把 mxCell 列表包装为完整的 mxGraphModel"""
+    return (
+        MODEL_OPEN + '<root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+        + "".join(cells) + '</root></mxGraphModel>'
+    )
+
+
+def flowchart(cells: int, seed: int = 0) -> str:
+    """
+    线性流程图，约 cells 个单元格（节点数 ≈ 边数）
+    """
+    nodes = max(1, (cells + 1) // 2)
+    items = [vertex(f"n{i}", f"步骤 {i + 1}", 320, 40 + i * 100) for i in range(nodes)]
+    items += [edge(f"e{i}", f"n{i}", f"n{i + 1}") for i in range(nodes - 1)]
+    return wrap_model(items)
+
+
+def nested(cells: int, seed: int = 0, depth: int = 6, fanout: int = 4) -> str:
+    """
+    嵌套容器：depth 层容器逐层嵌套，其余单元格作为叶子节点分布在各层容器中
+    """
+    rng = random.Random(seed)
+    items = []
+    containers = ["1"]
+    for level in range(min(depth, max(1, cells // 2))):
+        cid = f"g{level}"
+        items.append(vertex(cid, f"分组 {level + 1}", 20, 40, parent=containers[-1],
+                            style=CONTAINER_STYLE, width=2000, height=2000))
+        containers.append(cid)
+    for i in range(max(0, cells - len(items))):
+        parent = rng.choice(containers[1:]) if len(containers) > 1 else "1"
+        items.append(vertex(f"n{i}", f"节点 {i + 1}", 40 + (i % fanout) * 140, 60 + (i // fanout) * 80,
+                            parent=parent))
+    return wrap_model(items)
+
+
+def dense(cells: int, seed: int = 0, edges_per_node: int = 4) -> str:
+    """
+    稠密有向图：节点数为 cells / (1 + edges_per_node)，每个节点随机连出 edges_per_node 条边
+    """
+    rng = random.Random(seed)
+    nodes = max(2, cells // (1 + edges_per_node))
+    items = [vertex(f"n{i}", f"服务 {i + 1}", (i % 10) * 160, (i // 10) * 100) for i in range(nodes)]
+    count = 0
+    for i in range(nodes):
+        for _ in range(edges_per_node):
+            if len(items) >= cells:
+                break
+            items.append(edge(f"e{count}", f"n{i}", f"n{rng.randrange(nodes)}"))
+            count += 1
+    return wrap_model(items)
+
+
+GENERATORS: Dict[str, Callable[..., str]] = {
+    "flowchart": flowchart,
+    "nested": nested,
+    "dense": dense,
+}
+
+
+# ---------------------------------------------------------------------------
+# 损坏 / 截断变体
+# ---------------------------------------------------------------------------
+
+def truncate(text: str, ratio: float) -> str:
+    """保留前 ratio 比例的内容，模拟 token 上限截断"""
+    return text[:max(1, int(len(text) * ratio))]
+
+
+def missing_closing_tags(xml: str) -> str:
+    """去掉 </root></mxGraphModel>，模拟结尾缺失"""
+    return xml.replace("</root></mxGraphModel>", "")
+
+
+def with_surrounding_text(xml: str) -> str:
+    """XML 前后夹杂说明文字"""
+    return "下面是生成的图表：\n" + xml + "\n以上。"
+
+
+def with_comment(xml: str) -> str:
+    """在 root 中插入注释（系统提示词禁止，但模型偶尔会输出）"""
+    return xml.replace("<root>", "<root><!-- 图形元素 -->", 1)
+
+
+def with_unescaped_quote(xml: str) -> str:
+    """在第一个节点的 value 中插入未转义的双引号，产生无法修复的 XML"""
+    return xml.replace('value="', 'value="含"引号"', 1)
+
+
+MALFORMED_VARIANTS: Dict[str, Callable[[str], str]] = {
+    "missing_closing": missing_closing_tags,
+    "surrounding_text": with_surrounding_text,
+    "comment": with_comment,
+    "unescaped_quote": with_unescaped_quote,
+}
+
+
+# ---------------------------------------------------------------------------
+# GLM 响应文本
+# ---------------------------------------------------------------------------
+
+def display_response(xml: str, reply: str = "已生成图表") -> str:
+    """构造 display 动作的 GLM JSON 响应文本"""
+    return json.dumps({"action": "display", "xml": xml, "reply": reply}, ensure_ascii=False)
+
+
+def edit_response(operations: List[Dict[str, str]], reply: str = "已修改图表") -> str:
+    """构造 edit 动作的 GLM JSON 响应文本"""
+    return json.dumps({"action": "edit", "operations": operations, "reply": reply}, ensure_ascii=False)
+
+
+def fenced(text: str) -> str:
+    """用 markdown 代码块包裹响应"""
+    return f"好的，结果如下：\n```json\n{text}\n```"
+
+
+def truncated_display_response(xml: str, ratio: float = 0.8) -> str:
+    """
+    构造被截断的 display 响应：reply 在前、xml 在后，截断落在 xml 字符串中间
+    """
+    text = json.dumps({"action": "display", "reply": "已生成图表", "xml": xml}, ensure_ascii=False)
+    return truncate(text, ratio)
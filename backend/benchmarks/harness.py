@@ -0,0 +1,69 @@
+"""
+基准测试运行环境
+负责在后台线程中启动 ASGI 应用，并把后端指向桩 LLM / 桩 MCP Server
+"""
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+# 桩 MCP Server 脚本路径
+STUB_MCP_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_mcp_server.py")
+
+
+class BackgroundServer:
+    """
+    在后台线程中运行的 uvicorn 服务
+
+    每个服务拥有独立的事件循环，压测客户端与被测服务互不阻塞。
+    """
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self, timeout: float = 30.0):
+        """启动服务，直到端口就绪（包括 lifespan 启动完成）"""
+        import uvicorn
+
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(f"后台服务启动失败: {self.host}:{self.port}")
+            time.sleep(0.01)
+        self.port = self._server.servers[0].sockets[0].getsockname()[1]
+
+    def stop(self, timeout: float = 10.0):
+        """停止服务（会触发 lifespan 关闭逻辑）"""
+        if self._server:
+            self._server.should_exit = True
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._server = None
+        self._thread = None
+
+
+def configure_stub_environment(llm_base_url: str, mcp_latency: float = 0.0):
+    """
+    设置环境变量，让后端连接桩服务
+
+    必须在导入 app.main 之前调用，因为路由模块在导入时就会创建 GLMService。
+    """
+    os.environ["GLM_API_KEY"] = "stub-key"
+    os.environ["GLM_BASE_URL"] = llm_base_url
+    os.environ["GLM_MODEL"] = "stub-glm"
+    os.environ["MCP_SERVER_COMMAND"] = sys.executable
+    os.environ["MCP_SERVER_ARGS"] = f"{STUB_MCP_SERVER} --latency {mcp_latency}"
@@ -0,0 +1,171 @@
+"""
+基准测试统计工具
+负责延迟分位数计算、结果汇总、基线保存与对比
+"""
+import json
+import math
+import os
+import platform
+import sys
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """
+    计算分位数（nearest-rank 算法）
+
+    Args:
+        samples: 样本列表
+        pct: 分位（0-100）
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies: List[float], wall_time: float, errors: int = 0) -> Dict[str, Any]:
+    """
+    汇总一组请求的延迟数据
+
+    Args:
+        latencies: 每个请求的耗时（秒）
+        wall_time: 整组请求的墙钟时间（秒）
+        errors: 失败请求数
+
+    Returns:
+        包含 p50/p95/p99（毫秒）与 rps 的字典
+    """
+    count = len(latencies)
+    return {
+        "count": count,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else 0.0,
+        "rps": round(count / wall_time, 2) if wall_time > 0 else 0.0,
+    }
+
+
+def environment_info() -> Dict[str, str]:
+    """记录运行环境，便于判断基线是否可比"""
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": str(os.cpu_count()),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def save_baseline(path: str, results: Dict[str, Any], meta: Optional[Dict[str, Any]] = None):
+    """保存基线结果到 JSON 文件"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    payload = {
+        "env": environment_info(),
+        "meta": meta or {},
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    """读取基线文件，不存在时返回 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# 对比时使用的指标：(名称, 数值越大越好)
+COMPARE_METRICS = [
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("p99_ms", False),
+    ("rps", True),
+]
+
+
+def compare_results(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = 0.2,
+    metrics: Optional[List[tuple]] = None
+) -> List[Dict[str, Any]]:
+    """
+    对比当前结果与基线
+
+    结果按 {场景: {档位: 指标字典}} 组织，两边都有的条目才参与对比。
+
+    Args:
+        baseline: 基线 results 部分
+        current: 当前 results 部分
+        threshold: 判定为退化的相对变化阈值（0.2 表示 20%）
+        metrics: 参与对比的指标列表，默认 COMPARE_METRICS
+
+    Returns:
+        对比行列表，每行包含 scenario/level/metric/baseline/current/change/regression
+    """
+    rows = []
+    for scenario, levels in current.items():
+        base_levels = baseline.get(scenario, {})
+        for level, stats in levels.items():
+            base_stats = base_levels.get(level)
+            if not base_stats:
+                continue
+            for metric, higher_is_better in (metrics or COMPARE_METRICS):
+                if metric not in stats or metric not in base_stats:
+                    continue
+                old, new = base_stats[metric], stats[metric]
+                if not old:
+                    continue
+                change = (new - old) / old
+                regression = change < -threshold if higher_is_better else change > threshold
+                rows.append({
+                    "scenario": scenario,
+                    "level": level,
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "change": round(change, 4),
+                    "regression": regression,
+                })
+    return rows
+
+
+def print_table(results: Dict[str, Any], columns: List[str], level_name: str = "level"):
+    """以表格形式打印结果"""
+    level_width = max([len(level_name)] + [len(level) for levels in results.values() for level in levels]) + 2
+    header = f"{'scenario':<28}{level_name:>{level_width}}" + "".join(f"{c:>12}" for c in columns)
+    print(header)
+    print("-" * len(header))
+    for scenario, levels in results.items():
+        for level, stats in levels.items():
+            row = f"{scenario:<28}{level:>{level_width}}"
+            row += "".join(f"{stats.get(c, ''):>12}" for c in columns)
+            print(row)
+
+
+def print_comparison(rows: List[Dict[str, Any]]) -> int:
+    """
+    打印对比结果
+
+    Returns:
+        退化条目数
+    """
+    regressions = 0
+    for row in rows:
+        flag = "✗ 退化" if row["regression"] else ""
+        if row["regression"]:
+            regressions += 1
+        print(
+            f"{row['scenario']:<28}{row['level']:>18}{row['metric']:>10}"
+            f"{row['baseline']:>14}{row['current']:>14}{row['change'] * 100:>+10.1f}%  {flag}"
+        )
+    print("-" * 60)
+    print(f"对比 {len(rows)} 项指标，{regressions} 项退化")
+    return regressions
@@ -0,0 +1,205 @@
+"""
+确定性的 OpenAI 兼容桩服务
+用于离线基准测试，模拟 GLM 的 /chat/completions 接口
+
+特点：
+- 输出内容完全确定（由用户消息关键字决定）
+- 首 token 延迟与 token 速率可配置
+- 支持 stream 与非 stream 两种模式，遵循 max_tokens 截断并返回 finish_reason=length
+- 收到续写请求时从上一次截断处接着输出
+
+独立运行：
+    cd backend
+    python -m benchmarks.stub_llm --port 18080 --tokens-per-second 300
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, Any, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.services.glm_service import CONTINUATION_PROMPT
+from benchmarks.diagrams import flowchart, vertex
+from benchmarks.harness import BackgroundServer
+
+# 每个 token 近似对应的字符数
+CHARS_PER_TOKEN = 4
+
+
+def build_reply(user_message: str, nodes: int) -> str:
+    """根据用户消息生成确定性的 GLM JSON 回复"""
+    if any(kw in user_message for kw in ["修改", "改成", "edit"]):
+        payload = {
+            "action": "edit",
+            "operations": [{
+                "type": "update",
+                "cell_id": "n0",
+                "new_xml": vertex("n0", "开始", 320, 40),
+            }],
+            "reply": "已将第一个节点改为「开始」。",
+        }
+    elif any(kw in user_message for kw in ["画", "流程", "生成", "draw"]):
+        payload = {
+            "action": "display",
+            "xml": flowchart(nodes * 2 - 1),
+            "reply": f"我为你创建了一个包含 {nodes} 个步骤的流程图。",
+        }
+    else:
+        payload = {"action": "none", "reply": "你好！我是 DrawIO AI 助手。"}
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def split_tokens(text: str) -> List[str]:
+    """把文本切成固定长度的伪 token"""
+    return [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+
+class StubLLMServer:
+    """
+    桩 LLM 服务
+
+    通过 start() 在独立线程和事件循环中运行，避免被被测应用中的同步 OpenAI 调用阻塞。
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        first_token_latency: float = 0.05,
+        tokens_per_second: float = 400.0,
+        diagram_nodes: int = 8,
+        model: str = "stub-glm"
+    ):
+        self.host = host
+        self.port = port
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.diagram_nodes = diagram_nodes
+        self.model = model
+        self.request_count = 0
+        self._server = None
+        self.app = self._build_app()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _token_interval(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _completion_body(self, body: Dict[str, Any]) -> tuple[List[str], str]:
+        """根据请求体计算输出 token 与 finish_reason"""
+        messages = body.get("messages") or []
+        user_message = ""
+        offset = 0
+        for i in range(len(messages) - 1, -1, -1):
+            msg = messages[i]
+            if msg.get("role") != "user":
+                continue
+            if msg.get("content") == CONTINUATION_PROMPT and i >= 2:
+                # 续写：前一条 assistant 消息是已输出的内容，从其末尾接着输出
+                offset = len(messages[i - 1].get("content") or "")
+                user_message = messages[i - 2].get("content") or ""
+            else:
+                user_message = msg.get("content") or ""
+            break
+        tokens = split_tokens(build_reply(user_message, self.diagram_nodes)[offset:])
+        max_tokens = body.get("max_tokens")
+        if max_tokens and len(tokens) > max_tokens:
+            return tokens[:max_tokens], "length"
+        return tokens, "stop"
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Stub GLM")
+
+        @app.post("/chat/completions")
+        async def chat_completions(request: Request):
+            body = await request.json()
+            self.request_count += 1
+            tokens, finish_reason = self._completion_body(body)
+            created = int(time.time())
+            completion_id = f"stub-{self.request_count}"
+            interval = self._token_interval()
+
+            if not body.get("stream"):
+                await asyncio.sleep(self.first_token_latency + interval * len(tokens))
+                return JSONResponse({
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": self.model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": finish_reason,
+                    }],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": len(tokens),
+                        "total_tokens": len(tokens),
+                    },
+                })
+
+            async def event_stream():
+                await asyncio.sleep(self.first_token_latency)
+                for i, token in enumerate(tokens):
+                    last = i == len(tokens) - 1
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": self.model,
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": token},
+                            "finish_reason": finish_reason if last else None,
+                        }],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    if interval:
+                        await asyncio.sleep(interval)
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+        return app
+
+    def start(self):
+        """在后台线程启动服务，直到端口就绪"""
+        self._server = BackgroundServer(self.app, host=self.host, port=self.port)
+        self._server.start()
+        self.port = self._server.port
+
+    def stop(self):
+        """停止服务"""
+        if self._server:
+            self._server.stop()
+            self._server = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="确定性的 OpenAI 兼容桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="首 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="输出 token 速率")
+    parser.add_argument("--nodes", type=int, default=8, help="生成流程图的节点数")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    server = StubLLMServer(
+        host=args.host,
+        port=args.port,
+        first_token_latency=args.first_token_latency,
+        tokens_per_second=args.tokens_per_second,
+        diagram_nodes=args.nodes,
+    )
+    uvicorn.run(server.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+本地桩 MCP Server（stdio）
+模拟 @next-ai-drawio/mcp-server 的工具集合，图表保存在内存中，不依赖 Node 和浏览器
+
+提供的工具：
+- start_session / display_diagram / edit_diagram / get_diagram / export_diagram
+
+使用方式（让 DrawioMCPClient 连接桩服务）：
+    MCP_SERVER_COMMAND=python
+    MCP_SERVER_ARGS="benchmarks/stub_mcp_server.py --latency 0.002"
+"""
+import argparse
+import asyncio
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List
+
+from mcp.server.fastmcp import FastMCP
+
+EMPTY_DIAGRAM = '<mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/></root></mxGraphModel>'
+
+
+def apply_operations(xml: str, operations: List[Dict[str, Any]]) -> str:
+    """把 add/update/delete 操作应用到 mxGraphModel XML 上"""
+    model = ET.fromstring(xml)
+    root = model.find("root")
+    if root is None:
+        root = ET.SubElement(model, "root")
+
+    for op in operations:
+        op_type = op.get("type")
+        cell_id = op.get("cell_id")
+        existing = root.find(f"mxCell[@id='{cell_id}']")
+        if op_type == "delete":
+            if existing is not None:
+                root.remove(existing)
+            continue
+        new_cell = ET.fromstring(op.get("new_xml") or "")
+        if op_type == "update" and existing is not None:
+            index = list(root).index(existing)
+            root.remove(existing)
+            root.insert(index, new_cell)
+        else:
+            root.append(new_cell)
+    return ET.tostring(model, encoding="unicode")
+
+
+def create_server(latency: float = 0.0) -> FastMCP:
+    """创建桩 MCP Server，latency 为每次工具调用的模拟耗时（秒）"""
+    server = FastMCP("stub-drawio", log_level="WARNING")
+    state = {"xml": EMPTY_DIAGRAM, "sessions": 0}
+
+    async def simulate():
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+    @server.tool()
+    async def start_session() -> str:
+        """启动绘图会话"""
+        await simulate()
+        state["sessions"] += 1
+        return f"Session started. Preview: http://localhost:6274/?stub={state['sessions']}"
+
+    @server.tool()
+    async def display_diagram(xml: str) -> str:
+        """显示/替换整个图表"""
+        await simulate()
+        ET.fromstring(xml)
+        state["xml"] = xml
+        return "Diagram displayed"
+
+    @server.tool()
+    async def edit_diagram(operations: List[Dict[str, Any]]) -> str:
+        """编辑图表"""
+        await simulate()
+        state["xml"] = apply_operations(state["xml"], operations)
+        return f"Applied {len(operations)} operations"
+
+    @server.tool()
+    async def get_diagram() -> str:
+        """获取当前图表 XML"""
+        await simulate()
+        return state["xml"]
+
+    @server.tool()
+    async def export_diagram(path: str) -> str:
+        """导出 .drawio 文件"""
+        await simulate()
+        content = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<mxfile host="stub"><diagram id="default" name="Page-1">'
+            f'{state["xml"]}</diagram></mxfile>'
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return f"Exported to {path}"
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="桩 drawio MCP Server")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次工具调用的模拟耗时（秒）")
+    args = parser.parse_args()
+    create_server(args.latency).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+会话亲和测试
+验证会话元数据存储，以及多进程部署时把会话请求转发到所属工作进程
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_affinity.py
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from app.services.affinity import FORWARDED_HEADER, SessionAffinityMiddleware
+from app.services.metrics import get_metrics
+from app.services.session_manager import HEADLESS, SessionManager
+from app.services.session_store import MemorySessionStore, RedisSessionStore
+
+OWNER_URL = "http://worker-b"
+
+
+def _local_app():
+    """本进程的应用：返回 local 标记"""
+    app = FastAPI()
+
+    @app.get("/api/diagram/{session_id}")
+    async def get_diagram(session_id: str):
+        return {"served_by": "local", "session_id": session_id}
+
+    return app
+
+
+def _owner_app():
+    """所属进程的应用：回显是否带转发标记，并以流式返回"""
+    app = FastAPI()
+
+    @app.post("/api/chat/{session_id}/stream")
+    async def stream(session_id: str, request: Request):
+        body = await request.body()
+        forwarded = request.headers.get(FORWARDED_HEADER.decode())
+
+        async def chunks():
+            yield f"owner:{forwarded}:".encode()
+            yield body
+
+        return StreamingResponse(chunks())
+
+    @app.get("/api/diagram/{session_id}")
+    async def get_diagram(session_id: str):
+        return {"served_by": "owner"}
+
+    return app
+
+
+class _FakePipeline:
+    """模拟 WATCH / MULTI / EXEC：被监视的键在 EXEC 前被修改时抛出 WatchError"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.watched = None
+        self.queued = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def watch(self, key):
+        self.watched = (key, self.redis.versions.get(key, 0))
+
+    async def unwatch(self):
+        self.watched = None
+
+    async def get(self, key):
+        return self.redis.data.get(key)
+
+    def multi(self):
+        self.queued = []
+
+    def set(self, key, value, ex=None):
+        self.queued.append((key, value))
+
+    async def execute(self):
+        from redis.exceptions import WatchError
+
+        key, version = self.watched
+        if self.redis.versions.get(key, 0) != version:
+            raise WatchError()
+        for key, value in self.queued:
+            self.redis.write(key, value)
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+
+    def write(self, key, value):
+        self.data[key] = value
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.write(key, value)
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+def test_redis_update_retries_on_conflict():
+    """读取与写回之间会话被其他请求修改时重试，两边的修改都保留"""
+    store = RedisSessionStore()
+    store._redis = _FakeRedis()
+    calls = []
+
+    def append(message):
+        def mutate(info):
+            calls.append(message)
+            if len(calls) == 1:
+                # 模拟另一个工作进程在本次读取之后写入
+                other = json.loads(store._redis.data[store._key("s1")])
+                other["chat_history"].append("b")
+                store._redis.write(store._key("s1"), json.dumps(other))
+            info["chat_history"].append(message)
+        return mutate
+
+    async def scenario():
+        await store.set("s1", {"session_id": "s1", "chat_history": []})
+        await store.update("s1", append("a"))
+        assert (await store.get("s1"))["chat_history"] == ["b", "a"]
+        assert await store.update("missing", append("c")) is None
+
+    asyncio.run(scenario())
+    assert calls == ["a", "a"]
+
+
+def test_session_manager_uses_store(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr("app.services.session_manager.get_session_store", lambda: store)
+    monkeypatch.setenv("WORKER_URL", "http://worker-a")
+    manager = SessionManager()
+
+    async def scenario():
+        info = await manager.create_session(HEADLESS)
+        assert info["worker"] == "http://worker-a"
+        assert await manager.add_chat_message(info["session_id"], "user", "你好")
+        stored = await store.get(info["session_id"])
+        assert stored["chat_history"][0]["content"] == "你好"
+        assert await manager.delete_session(info["session_id"])
+        assert await store.get(info["session_id"]) is None
+
+    asyncio.run(scenario())
+
+
+def test_forward_to_owner(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr("app.services.affinity.get_session_store", lambda: store)
+    monkeypatch.setenv("WORKER_URL", "http://worker-a")
+    owner_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=_owner_app()))
+    app = SessionAffinityMiddleware(_local_app(), client=owner_client)
+
+    async def scenario():
+        await store.set("mine", {"session_id": "mine", "worker": "http://worker-a"})
+        await store.set("theirs", {"session_id": "theirs", "worker": OWNER_URL})
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            assert (await client.get("/api/diagram/mine")).json()["served_by"] == "local"
+            assert (await client.get("/api/diagram/unknown")).json()["served_by"] == "local"
+
+            before = get_metrics().counter("affinity.forwarded")
+            assert (await client.get("/api/diagram/theirs")).json()["served_by"] == "owner"
+            resp = await client.post("/api/chat/theirs/stream", content=b"payload")
+            assert resp.text == "owner:http://worker-a:payload"
+            assert get_metrics().counter("affinity.forwarded") == before + 2
+
+            # 已转发过的请求不再转发，避免循环
+            resp = await client.get("/api/diagram/theirs", headers={FORWARDED_HEADER.decode(): "x"})
+            assert resp.json()["served_by"] == "local"
+
+    asyncio.run(scenario())
+
+
+def test_unreachable_owner_returns_503(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr("app.services.affinity.get_session_store", lambda: store)
+    monkeypatch.setenv("WORKER_URL", "http://worker-a")
+
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    app = SessionAffinityMiddleware(_local_app(), client=httpx.AsyncClient(transport=httpx.MockTransport(refuse)))
+
+    async def scenario():
+        await store.set("theirs", {"session_id": "theirs", "worker": OWNER_URL})
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            resp = await client.get("/api/diagram/theirs")
+            assert resp.status_code == 503
+
+    asyncio.run(scenario())
+
+
+class _SlowOwner(httpx.AsyncBaseTransport):
+    """所属进程的非流式接口：整轮完成前不返回任何数据"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.cancelled = False
+
+    async def handle_async_request(self, request):
+        self.started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return httpx.Response(200, json={"reply": "done"})
+
+
+def test_forwarded_request_cancelled_on_disconnect(monkeypatch):
+    """转发的非流式请求在客户端断开时立即取消，不等所属进程返回响应头"""
+    store = MemorySessionStore()
+    monkeypatch.setattr("app.services.affinity.get_session_store", lambda: store)
+    monkeypatch.setenv("WORKER_URL", "http://worker-a")
+    owner = _SlowOwner()
+    app = SessionAffinityMiddleware(_local_app(), client=httpx.AsyncClient(transport=owner))
+
+    async def scenario():
+        await store.set("theirs", {"session_id": "theirs", "worker": OWNER_URL})
+        gone = asyncio.Event()
+        messages = [{"type": "http.request", "body": b"{}", "more_body": False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http", "method": "POST", "path": "/api/chat/theirs",
+            "query_string": b"", "headers": [(b"content-type", b"application/json")],
+        }
+        before = get_metrics().counter("affinity.client_disconnected")
+        task = asyncio.create_task(app(scope, receive, send))
+        await owner.started.wait()
+        gone.set()
+        await asyncio.wait_for(task, 1)
+        assert owner.cancelled and sent == []
+        assert get_metrics().counter("affinity.client_disconnected") == before + 1
+
+    asyncio.run(scenario())
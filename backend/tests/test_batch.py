@@ -0,0 +1,137 @@
+"""
+批量生成测试
+验证有界并发、单条失败隔离，以及 NDJSON / zip 两种输出格式
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_batch.py
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.dependencies import get_glm_service
+from app.services.batch import BatchGenerator, safe_file_name
+
+XML = (
+    '<mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+    '<mxCell id="a" value="A" vertex="1" parent="1"><mxGeometry x="0" y="0" width="120" height="60" as="geometry"/></mxCell>'
+    '</root></mxGraphModel>'
+)
+
+
+class _FakeGLM:
+    """记录并发峰值的假 GLM 服务，提示词含“失败”时不返回图表"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def chat(self, user_message, intent=None, **kwargs):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if "失败" in user_message:
+            return {"action": "none", "reply": "无法理解"}
+        return {"action": "display", "xml": XML, "reply": "完成"}
+
+
+def test_bounded_concurrency_and_isolated_errors():
+    glm = _FakeGLM()
+    generator = BatchGenerator(glm, concurrency=2)
+    prompts = [{"prompt": f"自定义内容 {i}"} for i in range(6)] + [{"prompt": "这条会失败"}]
+
+    async def collect():
+        return [r async for r in generator.run(prompts)]
+
+    results = asyncio.run(collect())
+    assert glm.peak == 2
+    assert [r["completed"] for r in results] == list(range(1, 8))
+    assert all(r["total"] == 7 for r in results)
+    failed = [r for r in results if r["status"] == "error"]
+    assert len(failed) == 1 and failed[0]["index"] == 6
+    assert "无法理解" in failed[0]["error"]
+    ok = [r for r in results if r["status"] == "ok"]
+    assert all("<mxfile" in r["drawio"] for r in ok)
+
+
+def test_safe_file_name():
+    assert safe_file_name("订单/流程 v1", 0) == "订单_流程_v1.drawio"
+    assert safe_file_name("arch.drawio", 0) == "arch.drawio"
+    assert safe_file_name("", 2) == "diagram_3.drawio"
+
+
+def test_ndjson_and_zip_endpoints(monkeypatch):
+    monkeypatch.setitem(app.dependency_overrides, get_glm_service, lambda: _FakeGLM(delay=0))
+    client = TestClient(app)
+    items = [{"prompt": "自定义内容", "name": "a"}, {"prompt": "这条会失败"}, {"prompt": "自定义内容", "name": "a"}]
+
+    resp = client.post("/api/batch/generate", json={"items": items})
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["type"] for line in lines] == ["item"] * 3 + ["summary"]
+    assert lines[-1]["succeeded"] == 2 and lines[-1]["failed"] == 1
+
+    resp = client.post("/api/batch/generate", json={"items": items, "format": "zip"})
+    archive = zipfile.ZipFile(io.BytesIO(resp.content))
+    assert sorted(archive.namelist()) == ["a.drawio", "a_2.drawio", "manifest.json"]
+    manifest = json.loads(archive.read("manifest.json"))
+    assert [item["status"] for item in manifest["items"]] == ["ok", "error", "ok"]
+
+    assert client.post("/api/batch/generate", json={"items": []}).status_code == 400
+
+
+def test_session_target_creates_headless_sessions(monkeypatch):
+    monkeypatch.setitem(app.dependency_overrides, get_glm_service, lambda: _FakeGLM(delay=0))
+    client = TestClient(app)
+    resp = client.post("/api/batch/generate", json={"items": [{"prompt": "自定义内容"}], "target": "session"})
+    item = json.loads(resp.text.splitlines()[0])
+    assert item["status"] == "ok"
+    diagram = client.get(f"/api/diagram/{item['session_id']}").json()
+    assert 'id="a"' in diagram["xml"]
+
+
+def test_session_target_removes_session_on_failure(monkeypatch):
+    """图表写入会话失败或条目超时时报告错误，并删除已创建的会话"""
+    from app.services.diagram_store import get_headless_client
+    from app.services.session_manager import SessionManager
+
+    manager = SessionManager()
+    headless = get_headless_client()
+
+    async def run(generator):
+        before = {s["session_id"] for s in await manager.list_sessions()}
+        results = [r async for r in generator.run([{"prompt": "自定义内容"}])]
+        after = {s["session_id"] for s in await manager.list_sessions()}
+        return results, after - before
+
+    async def fail_display(session_id, xml):
+        return False
+
+    monkeypatch.setattr(headless, "display_diagram", fail_display)
+    results, created = asyncio.run(run(BatchGenerator(_FakeGLM(delay=0), target="session", session_manager=manager)))
+    assert results[0]["status"] == "error" and "写入会话失败" in results[0]["error"]
+    assert "session_id" not in results[0] and not created
+
+    async def slow_display(session_id, xml):
+        await asyncio.sleep(1)
+        return True
+
+    monkeypatch.setattr(headless, "display_diagram", slow_display)
+    generator = BatchGenerator(_FakeGLM(delay=0), target="session", session_manager=manager)
+    generator.item_timeout = 0.05
+    results, created = asyncio.run(run(generator))
+    assert results[0]["status"] == "error" and not created
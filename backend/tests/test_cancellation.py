@@ -0,0 +1,50 @@
+"""
+取消传播测试
+验证客户端断开后进行中的任务被取消
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_cancellation.py
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.cancellation import ClientDisconnected, cancel_on_disconnect
+
+
+class _FakeRequest:
+    def __init__(self, disconnected: bool):
+        self.disconnected = disconnected
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_returns_result_when_connected():
+    """客户端在线时正常返回结果"""
+    async def work():
+        await asyncio.sleep(0.03)
+        return 42
+
+    assert asyncio.run(cancel_on_disconnect(_FakeRequest(False), work(), poll_interval=0.01)) == 42
+
+
+def test_cancels_work_on_disconnect():
+    """客户端断开时取消任务并抛出 ClientDisconnected"""
+    state = {"cancelled": False}
+
+    async def work():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    with pytest.raises(ClientDisconnected):
+        asyncio.run(cancel_on_disconnect(_FakeRequest(True), work(), poll_interval=0.01))
+    assert state["cancelled"]
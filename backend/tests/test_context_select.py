@@ -0,0 +1,73 @@
+"""
+编辑上下文选择测试
+验证按 id / 标签找到相关单元格、在预算内选取邻域子图，以及小图表和全局修改时发送整张图表
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_context_select.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from benchmarks import diagrams
+from app.services.context_select import estimate_tokens, match_cells, select_edit_context
+from app.services.diagram_index import DiagramIndex
+from app.services.glm_service import GLMService
+from app.services.intent import CREATE_DIAGRAM, EDIT_DIAGRAM
+
+
+def _cells(items):
+    return diagrams.wrap_model(items)
+
+
+def test_match_cells_by_id_and_label():
+    xml = _cells([
+        diagrams.vertex("a", "步骤 1", 0, 0),
+        diagrams.vertex("b", "步骤 12", 0, 100),
+        diagrams.vertex("db", "订单数据库", 0, 200),
+        diagrams.vertex("mq", "消息队列", 0, 300),
+        diagrams.edge("e1", "a", "b"),
+    ])
+    index = DiagramIndex.from_xml(xml)
+    # 「步骤 1」不应匹配消息中的「步骤 12」
+    assert list(match_cells(index, "把步骤 12 改成红色")) == ["b"]
+    assert list(match_cells(index, "删除 mq")) == ["mq"]
+    # 部分词命中：「数据库」
+    assert list(match_cells(index, "把数据库改成圆柱形")) == ["db"]
+    assert match_cells(index, "整体改成横向布局") == {}
+
+
+def test_selects_neighbourhood_within_budget():
+    xml = diagrams.flowchart(1000)
+    context = select_edit_context(xml, "把步骤 100 改成红色", budget=2000, hops=1)
+    assert context is not None
+    for cid in ("n99", "n98", "n100", "e98", "e99"):
+        assert f'id="{cid}"' in context.xml
+    assert 'id="n500"' not in context.xml
+    assert context.tokens <= 2000 < estimate_tokens(xml) == context.full_tokens
+    # 其余单元格在概要中给出数量和部分 id / 标签
+    assert "其余 994 个单元格未列出" in context.outline
+    assert "n0「步骤 1」" in context.outline
+
+
+def test_falls_back_to_full_diagram():
+    small = diagrams.flowchart(10)
+    assert select_edit_context(small, "把步骤 1 改成红色", budget=2000) is None
+    large = diagrams.flowchart(1000)
+    assert select_edit_context(large, "整体改成横向布局", budget=2000) is None
+    assert select_edit_context(large, "把步骤 1 改成红色", budget=0) is None
+
+
+def test_messages_use_subgraph_for_edits_only():
+    glm = GLMService()
+    glm.edit_context_budget = 2000
+    xml = diagrams.flowchart(1000)
+    edit = glm.finish_messages([], "把步骤 100 改成红色", xml, EDIT_DIAGRAM)[-1]["content"]
+    assert "只列出与需求相关" in edit and edit.endswith("用户需求：把步骤 100 改成红色")
+    assert estimate_tokens(edit) < estimate_tokens(xml) / 10
+    create = glm.finish_messages([], "把步骤 100 改成红色", xml, CREATE_DIAGRAM)[-1]["content"]
+    assert xml in create
@@ -0,0 +1,97 @@
+"""
+截断续写测试
+验证 finish_reason 为 length 时从中断处续写，并正确拼接重叠的片段
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_continuation.py
+"""
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from app.services.glm_service import CONTINUATION_PROMPT, GLMService
+from app.services.stream_events import CompleteEvent, TextEvent
+
+FULL = json.dumps({"action": "none", "reply": "".join(f"第 {i} 句回复；" for i in range(30))}, ensure_ascii=False)
+
+
+class _Completions:
+    """按 max_tokens 字符截断的假接口，续写时重复上一段末尾的 20 个字符"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.calls = []
+
+    async def create(self, messages, stream=False, **kwargs):
+        self.calls.append(messages)
+        offset = 0
+        if messages[-1]["content"] == CONTINUATION_PROMPT:
+            offset = max(0, len(messages[-2]["content"]) - 20)
+        text = FULL[offset:offset + self.limit]
+        finish = "length" if offset + self.limit < len(FULL) else "stop"
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason=finish)])
+        return _Stream(text, finish)
+
+
+class _Stream:
+    def __init__(self, text, finish):
+        self.chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+        self.finish = finish
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for i, piece in enumerate(self.chunks):
+            last = i == len(self.chunks) - 1
+            yield SimpleNamespace(choices=[SimpleNamespace(
+                delta=SimpleNamespace(content=piece), finish_reason=self.finish if last else None
+            )])
+
+    async def close(self):
+        pass
+
+
+def _service(limit):
+    glm = GLMService()
+    completions = _Completions(limit)
+    glm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return glm, completions
+
+
+def test_stitch_removes_overlap_and_fence():
+    """去掉续写片段开头的代码块标记和重复内容"""
+    text = '{"action": "none", "reply": "第一段'
+    assert GLMService._stitch(text, '```json\n"none", "reply": "第一段，第二段"}') == text + '，第二段"}'
+    assert GLMService._stitch("abc", "def") == "abcdef"
+
+
+def test_chat_continues_until_complete():
+    """非流式：多轮续写后得到完整回复"""
+    glm, completions = _service(limit=120)
+    result = asyncio.run(glm.chat("讲讲流程图"))
+    assert result["reply"] == json.loads(FULL)["reply"]
+    assert len(completions.calls) > 1
+
+
+def test_stream_continuation_cap():
+    """流式：续写不超过上限，文本事件拼起来与完整回复的前缀一致"""
+    glm, completions = _service(limit=120)
+    glm.max_continuations = 1
+
+    async def run():
+        return [e async for e in glm.chat_stream("讲讲流程图")]
+
+    events = asyncio.run(run())
+    text = "".join(e.content for e in events if isinstance(e, TextEvent))
+    assert len(completions.calls) == 2
+    assert FULL.startswith(text) and len(text) > 120
+    assert isinstance(events[-1], CompleteEvent)
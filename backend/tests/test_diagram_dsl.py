@@ -0,0 +1,103 @@
+"""
+紧凑图表描述编译测试
+验证新图表和编辑操作的编译结果，以及截断描述的补全
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_diagram_dsl.py
+"""
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.diagram_dsl import COLORS, compile_diagram, compile_operations
+
+SPEC = {
+    "layout": "flowchart",
+    "groups": [{"id": "svc", "label": "服务层", "nodes": ["order"]}],
+    "nodes": [
+        {"id": "start", "label": "开始", "shape": "start"},
+        {"id": "order", "label": "下单 \"快速\""},
+        {"id": "db", "label": "数据库", "shape": "database"},
+    ],
+    "edges": [
+        {"from": "start", "to": "order"},
+        {"from": "order", "to": "db", "dashed": True},
+        {"from": "order", "to": "missing"},
+    ],
+}
+
+
+def _cells(xml):
+    return {c.get("id"): c for c in ET.fromstring(xml).iter("mxCell")}
+
+
+def test_compile_diagram():
+    """节点、分组和连线编译为 mxCell，引用未知节点的连线被丢弃"""
+    cells = _cells(compile_diagram(SPEC))
+    assert cells["order"].get("parent") == "svc"
+    assert cells["order"].get("value") == '下单 "快速"'
+    assert "shape=cylinder3" in cells["db"].get("style")
+    assert cells["db"].find("mxGeometry").get("x") is None
+    edges = [c for c in cells.values() if c.get("edge") == "1"]
+    assert len(edges) == 2
+    assert any("dashed=1" in e.get("style") for e in edges)
+
+
+def test_compile_operations():
+    """新增节点带坐标，修改保留原几何，删除节点连带删除连线"""
+    current = compile_diagram(SPEC).replace('<mxGeometry width="80" height="100"', '<mxGeometry x="100" y="300" width="80" height="100"')
+    operations = compile_operations([
+        {"op": "add", "node": {"id": "cache", "label": "缓存"}},
+        {"op": "add", "edge": {"from": "db", "to": "cache"}},
+        {"op": "update", "id": "db", "label": "主库", "color": "red"},
+        {"op": "delete", "id": "start"},
+        {"type": "delete", "cell_id": "legacy"},
+    ], current)
+
+    added = ET.fromstring(operations[0]["new_xml"]).find("mxGeometry")
+    assert float(added.get("y")) > 300
+    updated = ET.fromstring(operations[2]["new_xml"])
+    assert updated.get("value") == "主库"
+    assert COLORS["red"] in updated.get("style") and "cylinder3" in updated.get("style")
+    assert updated.find("mxGeometry").get("x") == "100"
+    deleted = [op["cell_id"] for op in operations if op["type"] == "delete"]
+    assert deleted == ["e_start_order", "start", "legacy"]
+
+
+def test_truncated_description_recovered():
+    """截断的描述补全后保留已写完的节点"""
+    os.environ.setdefault("GLM_API_KEY", "")
+    from app.services.glm_service import GLMService
+
+    glm = GLMService()
+    text = json.dumps({"action": "display", "diagram": SPEC, "reply": "好的"}, ensure_ascii=False)
+    cut = text.index('"label": "数据库"')
+    result = glm._compile_result(glm._parse_response(text[:cut]))
+    assert result["action"] == "display"
+    ids = set(_cells(result["xml"]))
+    assert {"start", "order"} <= ids and "db" not in ids
+
+
+def test_update_merges_into_existing_style():
+    """只改虚线 / 粗体时保留原有样式，不按缺省值重建"""
+    current = compile_diagram({
+        "nodes": [
+            {"id": "a", "label": "中心", "shape": "topic"},
+            {"id": "b", "label": "分支", "color": "green"},
+        ],
+        "edges": [{"from": "a", "to": "b", "arrow": False, "route": "curved"}],
+    })
+    operations = compile_operations([
+        {"op": "update", "id": "e_a_b", "dashed": True},
+        {"op": "update", "id": "b", "bold": True},
+    ], current)
+
+    edge = ET.fromstring(operations[0]["new_xml"]).get("style")
+    assert "dashed=1" in edge and "endArrow=none" in edge and "curved=1" in edge
+    assert "endArrow=classic" not in edge
+    node = ET.fromstring(operations[1]["new_xml"]).get("style")
+    assert COLORS["green"] in node and "fontStyle=1" in node
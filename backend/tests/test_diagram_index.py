@@ -0,0 +1,101 @@
+"""
+图表索引测试
+验证索引的关系表、按编辑操作增量更新的结果与重新解析一致，以及按会话、按修订版本缓存
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_diagram_index.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import diagrams
+from app.services.diagram_dsl import compile_operations
+from app.services.diagram_index import DiagramIndex, DiagramIndexCache, get_index_cache
+from app.services.diagram_store import HeadlessDiagramClient
+from app.services.metrics import get_metrics
+
+XML = diagrams.wrap_model([
+    diagrams.vertex("g", "服务层", 0, 0, style=diagrams.CONTAINER_STYLE, width=400, height=300),
+    diagrams.vertex("a", "订单&lt;b&gt;服务&lt;/b&gt;", 20, 40, parent="g"),
+    diagrams.vertex("b", "库存服务", 200, 40, parent="g"),
+    diagrams.vertex("c", "数据库", 20, 400),
+    diagrams.edge("e1", "a", "b"),
+    diagrams.edge("e2", "b", "c"),
+    '<UserObject label="网关" id="u"><mxCell style="" vertex="1" parent="1">'
+    '<mxGeometry x="300" y="400" width="120" height="60" as="geometry"/></mxCell></UserObject>',
+])
+
+
+def _tables(index: DiagramIndex):
+    return (
+        list(index.cells), index.labels, index.by_label, index.parent,
+        {k: sorted(v) for k, v in index.children.items()},
+        {k: sorted(v) for k, v in index.edges_of.items()},
+        index.endpoints, index.vertices,
+    )
+
+
+def test_index_relations():
+    index = DiagramIndex.from_xml(XML)
+    assert index.labels["a"] == "订单 服务" and index.labels["u"] == "网关"
+    assert index.by_label["库存服务"] == ["b"]
+    assert index.children["g"] == ["a", "b"] and index.ancestors("a") == ["g"]
+    assert index.edges_of["b"] == ["e1", "e2"] and index.neighbours("b") == ["a", "c"]
+    assert index.is_edge("e1") and index.is_container("g") and "u" in index.vertices
+
+
+def test_incremental_update_matches_rebuild():
+    async def scenario():
+        client = HeadlessDiagramClient()
+        cache = get_index_cache()
+        await client.start_session("s1")
+        await client.display_diagram("s1", XML)
+        cache.get(await client.get_diagram("s1"), "s1")
+
+        metrics = get_metrics()
+        metrics.reset()
+        operations = compile_operations([
+            {"op": "update", "id": "a", "label": "订单中心", "color": "red"},
+            {"op": "update", "id": "u", "label": "API 网关"},
+            {"op": "add", "node": {"id": "d", "label": "缓存", "group": "g"}},
+            {"op": "add", "edge": {"from": "d", "to": "c"}},
+            {"op": "delete", "id": "b"},
+        ], await client.get_diagram("s1"))
+        assert await client.edit_diagram("s1", operations)
+
+        xml = await client.get_diagram("s1")
+        index = cache.get(xml, "s1")
+        counters = metrics.snapshot()["counters"]
+        # 增量更新后直接命中，不再解析整张图表
+        assert counters["diagram_index.incremental"] == 1
+        assert counters.get("diagram_index.builds", 0) == 0
+        assert _tables(index) == _tables(DiagramIndex.from_xml(xml))
+        assert "b" not in index.cells and "e1" not in index.cells and "e2" not in index.cells
+        assert index.labels["u"] == "API 网关" and index.children["g"] == ["a", "d"]
+
+    asyncio.run(scenario())
+
+
+def test_cache_revisions():
+    cache = DiagramIndexCache(max_sessions=2)
+    metrics = get_metrics()
+    metrics.reset()
+    first = cache.get(XML, "s1")
+    # 同一版本：按会话或按 XML 查找都命中
+    assert cache.get(XML, "s1") is first and cache.get(XML) is first
+    # 新版本重建
+    changed = XML.replace("数据库", "主库")
+    assert cache.get(changed, "s1").labels["c"] == "主库"
+    # before 不是缓存的版本时丢弃，而不是套用到错误的版本上
+    cache.apply("s1", [{"type": "delete", "cell_id": "c"}], XML, "x")
+    assert cache.get(changed, "s1").labels["c"] == "主库"
+    # 容量上限
+    cache.get(XML, "s2")
+    cache.get(XML, "s3")
+    assert metrics.snapshot()["counters"]["diagram_index.builds"] == 5
+    assert cache.get(changed, "s1") is not None
+    assert metrics.snapshot()["counters"]["diagram_index.builds"] == 6
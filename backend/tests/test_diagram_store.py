@@ -0,0 +1,100 @@
+"""
+无头图表存储测试
+验证进程内后端的 display / edit / get / export，以及 headless 会话走同一套 /api/diagram 接口
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_diagram_store.py
+"""
+import asyncio
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.diagram_store import HeadlessDiagramClient
+
+XML = (
+    '<mxGraphModel dx="800"><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+    '<mxCell id="g" value="组" style="swimlane;" vertex="1" parent="1"><mxGeometry width="300" height="200" as="geometry"/></mxCell>'
+    '<mxCell id="a" value="A" vertex="1" parent="g"><mxGeometry x="20" y="40" width="120" height="60" as="geometry"/></mxCell>'
+    '<mxCell id="b" value="B" vertex="1" parent="1"><mxGeometry x="400" y="40" width="120" height="60" as="geometry"/></mxCell>'
+    '<mxCell id="e" edge="1" source="a" target="b" parent="1"><mxGeometry relative="1" as="geometry"/></mxCell>'
+    '</root></mxGraphModel>'
+)
+
+
+def _ids(xml):
+    return [cell.get("id") for cell in ET.fromstring(xml).find("root")]
+
+
+def test_display_edit_get_export():
+    client = HeadlessDiagramClient()
+
+    async def scenario():
+        await client.start_session("s1")
+        await client.start_session("s2")
+        assert _ids(await client.get_diagram("s1")) == ["0", "1"]
+
+        assert await client.display_diagram("s1", XML)
+        assert ET.fromstring(await client.get_diagram("s1")).get("dx") == "800"
+
+        assert await client.edit_diagram("s1", [
+            {"type": "update", "cell_id": "b", "new_xml": '<mxCell id="b" value="B2" vertex="1" parent="1"><mxGeometry as="geometry"/></mxCell>'},
+            {"type": "add", "cell_id": "c", "new_xml": '<mxCell id="c" value="C" vertex="1" parent="1"><mxGeometry as="geometry"/></mxCell>'},
+        ])
+        xml = await client.get_diagram("s1")
+        assert _ids(xml) == ["0", "1", "g", "a", "b", "e", "c"]
+        assert 'value="B2"' in xml
+
+        # 删除分组时级联删除子节点和相连的连线
+        assert await client.edit_diagram("s1", [{"type": "delete", "cell_id": "g"}])
+        assert _ids(await client.get_diagram("s1")) == ["0", "1", "b", "c"]
+
+        # 其他会话不受影响
+        assert _ids(await client.get_diagram("s2")) == ["0", "1"]
+
+        exported = (await client.export_diagram("s1")).decode("utf-8")
+        assert exported.startswith("<?xml") and "<mxfile" in exported
+
+    asyncio.run(scenario())
+
+
+def test_failed_edit_leaves_diagram_unchanged():
+    client = HeadlessDiagramClient()
+
+    async def scenario():
+        await client.start_session("s")
+        await client.display_diagram("s", XML)
+        before = await client.get_diagram("s")
+        assert not await client.edit_diagram("s", [
+            {"type": "delete", "cell_id": "b"},
+            {"type": "update", "cell_id": "missing", "new_xml": '<mxCell id="missing"/>'},
+        ])
+        assert await client.get_diagram("s") == before
+        assert not await client.display_diagram("s", "<mxGraphModel><root><mxCell")
+
+    asyncio.run(scenario())
+
+
+def test_headless_session_router_contract():
+    client = TestClient(app)
+    created = client.post("/api/session", json={"mode": "headless"}).json()
+    assert created["mode"] == "headless" and created["preview_url"] is None
+    session_id = created["session_id"]
+
+    resp = client.post(f"/api/diagram/{session_id}/edit", json={"operations": [
+        {"type": "add", "cell_id": "n1", "new_xml": '<mxCell id="n1" value="节点" vertex="1" parent="1"><mxGeometry as="geometry"/></mxCell>'},
+    ]})
+    assert resp.json()["success"] is True
+    assert "n1" in _ids(client.get(f"/api/diagram/{session_id}").json()["xml"])
+    assert b"<mxfile" in client.get(f"/api/diagram/{session_id}/download").content
+
+    assert client.post("/api/session", json={"mode": "bogus"}).status_code == 400
+    assert client.delete(f"/api/session/{session_id}").status_code == 200
@@ -0,0 +1,109 @@
+"""
+手动编辑合并测试
+验证操作合并规则，以及同一会话的并发编辑合并为一次图表操作
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_edit_queue.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.diagram_store import HeadlessDiagramClient
+from app.services.edit_queue import EditQueue, merge_operations
+
+
+def _cell(cell_id, value="", parent="1", **attrs):
+    extra = "".join(f' {k}="{v}"' for k, v in attrs.items())
+    return f'<mxCell id="{cell_id}" value="{value}" parent="{parent}"{extra} vertex="1"/>'
+
+
+def _op(op_type, cell_id, **kwargs):
+    return {"type": op_type, "cell_id": cell_id, "new_xml": _cell(cell_id, **kwargs) if op_type != "delete" else None}
+
+
+class _CountingClient(HeadlessDiagramClient):
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.delay = delay
+        self.batches = []
+
+    async def edit_diagram(self, session_id, operations):
+        self.batches.append(operations)
+        await asyncio.sleep(self.delay)
+        return await super().edit_diagram(session_id, operations)
+
+
+def test_merge_rules():
+    ops = [
+        _op("update", "a", value="1"),
+        _op("add", "n"),
+        _op("update", "a", value="2"),
+        _op("update", "n", value="x"),
+        _op("update", "b", value="1"),
+        _op("delete", "b"),
+        _op("add", "tmp"),
+        _op("delete", "tmp"),
+    ]
+    merged = merge_operations(ops)
+    assert [(op["type"], op["cell_id"]) for op in merged] == [("add", "n"), ("update", "a"), ("delete", "b")]
+    assert 'value="x"' in merged[0]["new_xml"]
+    assert 'value="2"' in merged[1]["new_xml"]
+
+    # 期间有操作引用了新增的单元格时，add / delete 不抵消，由后端级联删除
+    ops = [_op("add", "g"), _op("add", "e", parent="g"), _op("delete", "g")]
+    assert [op["cell_id"] for op in merge_operations(ops)] == ["g", "e", "g"]
+
+
+def test_concurrent_edits_share_one_call(monkeypatch):
+    monkeypatch.setenv("EDIT_BATCH_WINDOW_MS", "20")
+    queue = EditQueue()
+    client = _CountingClient()
+
+    async def scenario():
+        await client.start_session("s")
+        await client.edit_diagram("s", [_op("add", "a")])
+        client.batches.clear()
+
+        results = await asyncio.gather(*(
+            queue.submit(client, "s", [_op("update", "a", value=str(i))]) for i in range(10)
+        ))
+        assert results == [True] * 10
+        assert len(client.batches) == 1
+        assert len(client.batches[0]) == 1
+        assert 'value="9"' in await client.get_diagram("s")
+
+        # 整批失败时每个调用方都收到失败结果
+        results = await asyncio.gather(
+            queue.submit(client, "s", [_op("update", "a", value="ok")]),
+            queue.submit(client, "s", [_op("update", "missing")]),
+        )
+        assert results == [False, False]
+
+        # 全部抵消时不调用后端
+        assert await queue.submit(client, "s", [_op("add", "t"), _op("delete", "t")])
+        assert len(client.batches) == 2
+
+    asyncio.run(scenario())
+
+
+def test_batches_run_in_order(monkeypatch):
+    monkeypatch.setenv("EDIT_BATCH_WINDOW_MS", "5")
+    monkeypatch.setenv("EDIT_BATCH_MAX_OPS", "2")
+    queue = EditQueue()
+    client = _CountingClient(delay=0.02)
+
+    async def scenario():
+        await client.start_session("s")
+        first = asyncio.ensure_future(queue.submit(client, "s", [_op("add", "a"), _op("add", "b")]))
+        await asyncio.sleep(0.005)
+        # 上一批仍在执行时，下一批等待其完成后再执行
+        second = asyncio.ensure_future(queue.submit(client, "s", [_op("update", "a", value="v")]))
+        assert await first and await second
+        assert [len(batch) for batch in client.batches] == [2, 1]
+        assert 'value="v"' in await client.get_diagram("s")
+
+    asyncio.run(scenario())
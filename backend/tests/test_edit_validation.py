@@ -0,0 +1,155 @@
+"""
+编辑操作预检测试
+验证对照当前图表检查编辑操作，以及发现问题后让模型改正一次（非流式和流式）
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_edit_validation.py
+"""
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from benchmarks import diagrams
+from app.services.diagram_dsl import compile_operations
+from app.services.diagram_index import DiagramIndex
+from app.services.edit_validation import validate_operations
+from app.services.glm_service import GLMService
+from app.services.intent import EDIT_DIAGRAM
+from app.services.metrics import get_metrics
+from app.services.stream_events import CompleteEvent, RestartEvent
+
+XML = diagrams.wrap_model([
+    diagrams.vertex("a", "订单服务", 0, 0),
+    diagrams.vertex("b", "库存服务", 200, 0),
+    diagrams.edge("e1", "a", "b"),
+])
+
+
+def _cell(cell_id, **attrs):
+    extra = "".join(f' {k}="{v}"' for k, v in attrs.items())
+    return f'<mxCell id="{cell_id}" value="x"{extra} parent="1"><mxGeometry as="geometry"/></mxCell>'
+
+
+def test_validate_operations():
+    index = DiagramIndex.from_xml(XML)
+    errors = validate_operations([
+        {"type": "update", "cell_id": "zz", "new_xml": _cell("zz", vertex="1")},
+        {"type": "update", "cell_id": "a"},
+        {"type": "update", "cell_id": "b", "new_xml": _cell("c", vertex="1")},
+        {"type": "add", "cell_id": "a", "new_xml": _cell("a", vertex="1")},
+        {"type": "add", "cell_id": "e2", "new_xml": _cell("e2", edge="1", source="a", target="ghost")},
+        {"type": "move", "cell_id": "a"},
+        {"type": "delete", "cell_id": "nope"},
+    ], index)
+    assert errors == [
+        "update zz：单元格不存在",
+        "update a：缺少 new_xml",
+        "update b：new_xml 中的 id「c」与 cell_id 不一致",
+        "add a：单元格已存在，新增请使用新的 id，修改请使用 update",
+        "操作 a 的类型「move」无效，应为 add / update / delete",
+        "delete nope：单元格不存在",
+        "add e2：target「ghost」指向的单元格不存在",
+    ]
+
+    # 连线可以先于节点新增；删除节点后连带删除的连线不能再修改
+    assert validate_operations([
+        {"type": "add", "cell_id": "e3", "new_xml": _cell("e3", edge="1", source="a", target="c")},
+        {"type": "add", "cell_id": "c", "new_xml": _cell("c", vertex="1")},
+    ], index) == []
+    assert validate_operations([
+        {"type": "delete", "cell_id": "b"},
+        {"type": "update", "cell_id": "e1", "new_xml": _cell("e1", edge="1", source="a", target="b")},
+    ], index) == ["update e1：单元格不存在"]
+
+
+def test_compile_reports_dropped_operations():
+    errors = []
+    compiled = compile_operations([
+        {"op": "update", "id": "数据库", "color": "red"},
+        {"op": "add", "edge": {"from": "a"}},
+        {"op": "update", "id": "a", "color": "red"},
+    ], XML, errors)
+    assert [op["cell_id"] for op in compiled] == ["a"]
+    assert errors[0] == "update 数据库：要修改的单元格不存在"
+    assert errors[1].startswith("无效的编辑操作: 连线缺少 from/to")
+
+
+BAD = json.dumps({"action": "edit", "operations": [{"op": "update", "id": "数据库", "color": "red"}], "reply": "好"})
+GOOD = json.dumps({"action": "edit", "operations": [{"op": "update", "id": "b", "color": "red"}], "reply": "好"})
+
+
+class _Completions:
+    """第一次返回引用不存在单元格的编辑操作，收到问题列表后返回正确的操作"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, messages, stream=False, **kwargs):
+        self.calls.append(messages)
+        text = BAD if len(self.calls) == 1 else GOOD
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason="stop")])
+        return _Stream(text)
+
+
+class _Stream:
+    def __init__(self, text):
+        self.text = text
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.text), finish_reason="stop")])
+
+    async def close(self):
+        pass
+
+
+def _service():
+    glm = GLMService()
+    completions = _Completions()
+    glm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return glm, completions
+
+
+def test_chat_corrects_invalid_edit_once():
+    glm, completions = _service()
+    metrics = get_metrics()
+    metrics.reset()
+    result = asyncio.run(glm.chat("把数据库改成红色", current_diagram_xml=XML, intent=EDIT_DIAGRAM))
+
+    assert len(completions.calls) == 2
+    assert "update 数据库：要修改的单元格不存在" in completions.calls[1][-1]["content"]
+    assert [op["cell_id"] for op in result["operations"]] == ["b"]
+    assert "compile_errors" not in result
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["edit_validation.first_pass_failed"] == 1
+    assert snapshot["counters"]["edit_validation.corrected"] == 1
+    assert snapshot["gauges"]["edit_validation.first_pass_rate"] == 0
+
+    # 首次即通过时不再请求
+    completions.calls = [None]
+    result = asyncio.run(glm.chat("把库存服务改成红色", current_diagram_xml=XML, intent=EDIT_DIAGRAM))
+    assert len(completions.calls) == 2 and result["operations"][0]["cell_id"] == "b"
+    assert metrics.snapshot()["gauges"]["edit_validation.first_pass_rate"] == 0.5
+
+
+def test_stream_corrects_invalid_edit_once():
+    glm, completions = _service()
+
+    async def collect():
+        return [e async for e in glm.chat_stream("把数据库改成红色", current_diagram_xml=XML, intent=EDIT_DIAGRAM)]
+
+    events = asyncio.run(collect())
+    assert len(completions.calls) == 2
+    assert sum(isinstance(e, RestartEvent) for e in events) == 1
+    assert isinstance(events[-1], CompleteEvent)
+    assert [op["cell_id"] for op in events[-1].result["operations"]] == ["b"]
@@ -0,0 +1,53 @@
+"""
+上游连接池测试
+验证所有 GLMService 共用一个上游客户端、连接被复用、预热提前建立连接，以及连接池指标
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_http_pool.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from app.services.glm_service import GLMService
+from app.services.http_pool import close_upstream_client, get_upstream_client
+from app.services.metrics import get_metrics
+from benchmarks.stub_llm import StubLLMServer
+
+
+def test_shared_pool_reuses_warm_connections(monkeypatch):
+    stub = StubLLMServer(first_token_latency=0, tokens_per_second=100000)
+    stub.start()
+    monkeypatch.setenv("GLM_API_KEY", "test")
+    monkeypatch.setenv("GLM_BASE_URL", stub.base_url)
+    monkeypatch.setenv("UPSTREAM_WARM_CONNECTIONS", "1")
+    metrics = get_metrics()
+
+    async def scenario():
+        first, second = GLMService(), GLMService()
+        assert first.client._client is second.client._client is get_upstream_client()
+
+        await first.warm_up()
+        assert metrics.snapshot()["gauges"]["upstream.pool.connections"] == 1
+
+        before = metrics.counter("upstream.requests")
+        for service in (first, second, first):
+            result = await service.chat("你好")
+            assert result["action"] == "none"
+        gauges = metrics.snapshot()["gauges"]
+        assert metrics.counter("upstream.requests") == before + 3
+        # 预热的连接被后续请求复用，没有新建连接
+        assert gauges["upstream.pool.connections"] == 1
+        assert gauges["upstream.pool.active"] == 0
+
+        await close_upstream_client()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        stub.stop()
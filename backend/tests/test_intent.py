@@ -0,0 +1,50 @@
+"""
+意图预分类测试
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_intent.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.intent import (
+    CREATE_DIAGRAM, EDIT_DIAGRAM, GREETING, QUESTION, classify_intent, is_conversational,
+)
+
+
+@pytest.mark.parametrize("message, has_diagram, expected", [
+    ("你好", None, GREETING),
+    ("谢谢！", True, GREETING),
+    ("hi there", None, GREETING),
+    ("你能做什么？", None, QUESTION),
+    ("帮我画一个用户登录流程图", None, CREATE_DIAGRAM),
+    ("把数据库节点改成红色", True, EDIT_DIAGRAM),
+    ("删除结束节点", False, CREATE_DIAGRAM),
+    ("你好，帮我画一个架构图", None, CREATE_DIAGRAM),
+    ("this is my system", True, EDIT_DIAGRAM),
+    # 询问当前图表的问题需要附带图表
+    ("这个图是什么意思", True, EDIT_DIAGRAM),
+    ("这张图的功能模块是什么", True, EDIT_DIAGRAM),
+    ("你好，帮我看看当前的图有什么问题", True, EDIT_DIAGRAM),
+    ("什么是微服务？", True, QUESTION),
+])
+def test_classify_intent(message, has_diagram, expected):
+    assert classify_intent(message, has_diagram) == expected
+
+
+def test_conversational_prompt_has_no_diagram_context():
+    """对话类意图使用轻量提示词且不附带图表 XML"""
+    os.environ.setdefault("GLM_API_KEY", "")
+    from app.services.glm_service import GLMService, CHAT_SYSTEM_PROMPT
+
+    service = GLMService()
+    messages = service._build_messages("你好", [], "<mxGraphModel/>", GREETING)
+    assert messages[0]["content"] == CHAT_SYSTEM_PROMPT
+    assert messages[-1]["content"] == "你好"
+    assert is_conversational(GREETING) and not is_conversational(CREATE_DIAGRAM)
+    assert service._max_tokens_for(GREETING) == service.chat_max_tokens
@@ -0,0 +1,80 @@
+"""
+自动布局测试
+验证只描述拓扑的图表能得到无重叠的坐标，已有良好布局的图表保持不变
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_layout.py
+"""
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.layout import GRID, LAYERED, MINDMAP, TREE, LayoutEngine, infer_layout
+
+
+def _model(cells):
+    return '<mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>' + "".join(cells) + "</root></mxGraphModel>"
+
+
+def _vertex(cid, parent="1", style=""):
+    return f'<mxCell id="{cid}" value="{cid}" style="{style}" vertex="1" parent="{parent}"/>'
+
+
+def _edge(cid, source, target):
+    return f'<mxCell id="{cid}" edge="1" parent="1" source="{source}" target="{target}"/>'
+
+
+def _boxes(xml):
+    boxes = {}
+    for cell in ET.fromstring(xml).iter("mxCell"):
+        if cell.get("vertex") == "1":
+            geo = cell.find("mxGeometry")
+            boxes[cell.get("id")] = tuple(float(geo.get(k)) for k in ("x", "y", "width", "height"))
+    return boxes
+
+
+def _overlap(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def test_topology_only_flowchart_is_layered():
+    """没有坐标的流程图按层从上到下排列，节点互不重叠"""
+    cells = [_vertex(n) for n in "abcd"]
+    cells += [_edge("e1", "a", "b"), _edge("e2", "b", "c"), _edge("e3", "b", "d"), _edge("e4", "c", "d")]
+    boxes = _boxes(LayoutEngine(mode="auto").apply(_model(cells), "flowchart"))
+    assert boxes["a"][1] < boxes["b"][1] < boxes["c"][1] < boxes["d"][1]
+    ids = list(boxes)
+    assert not any(_overlap(boxes[x], boxes[y]) for i, x in enumerate(ids) for y in ids[i + 1:])
+
+
+def test_positioned_diagram_left_untouched():
+    """已有坐标且不重叠时 auto 模式原样返回"""
+    xml = _model([
+        '<mxCell id="a" vertex="1" parent="1"><mxGeometry x="0" y="0" width="100" height="50" as="geometry"/></mxCell>',
+        '<mxCell id="b" vertex="1" parent="1"><mxGeometry x="200" y="0" width="100" height="50" as="geometry"/></mxCell>',
+    ])
+    assert LayoutEngine(mode="auto").apply(xml) == xml
+
+
+def test_container_fits_children():
+    """容器内的子节点先布局，容器尺寸包住所有子节点"""
+    cells = ['<mxCell id="g" value="服务" style="swimlane;startSize=30;" vertex="1" parent="1"/>']
+    cells += [_vertex(f"s{i}", parent="g") for i in range(4)]
+    boxes = _boxes(LayoutEngine(mode="auto").apply(_model(cells)))
+    _, _, width, height = boxes["g"]
+    for i in range(4):
+        x, y, w, h = boxes[f"s{i}"]
+        assert y >= 30 and x + w <= width and y + h <= height
+
+
+def test_infer_layout():
+    """按拓扑推断布局算法"""
+    nodes = [f"n{i}" for i in range(5)]
+    assert infer_layout(nodes, []) == GRID
+    star = [("n0", f"n{i}") for i in range(1, 5)]
+    assert infer_layout(nodes, star) == TREE
+    assert infer_layout(nodes, star, ["endArrow=none;"] * 4) == MINDMAP
+    assert infer_layout(nodes, [("n0", "n1"), ("n1", "n2"), ("n2", "n0")]) == LAYERED
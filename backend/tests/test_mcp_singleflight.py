@@ -0,0 +1,118 @@
+"""
+MCP 读取合并测试
+验证并发的相同读取只调用一次 MCP、结果短暂缓存，以及写入使缓存失效
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_mcp_singleflight.py
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.mcp_client import DrawioMCPClient
+from app.services.metrics import get_metrics
+
+
+class _FakeSession:
+    """模拟 MCP 会话：get_diagram 返回当前 XML，display_diagram 替换它"""
+
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.xml = "<mxGraphModel>v1</mxGraphModel>"
+        self.calls = {}
+
+    async def call_tool(self, name, arguments):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        xml = self.xml
+        await asyncio.sleep(self.delay)
+        if name == "display_diagram":
+            self.xml = arguments["xml"]
+            return SimpleNamespace(content=[])
+        if name == "get_diagram":
+            return SimpleNamespace(content=[SimpleNamespace(text=xml)])
+        raise RuntimeError(f"unexpected tool {name}")
+
+    async def list_tools(self):
+        self.calls["list_tools"] = self.calls.get("list_tools", 0) + 1
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(tools=[SimpleNamespace(name="get_diagram")])
+
+
+def _client(monkeypatch, session, ttl="0.5"):
+    monkeypatch.setenv("MCP_READ_CACHE_TTL", ttl)
+    client = DrawioMCPClient()
+
+    async def ensure_connected():
+        return session
+
+    client._ensure_connected = ensure_connected
+    return client
+
+
+def test_concurrent_reads_share_one_call(monkeypatch):
+    session = _FakeSession()
+    client = _client(monkeypatch, session)
+    metrics = get_metrics()
+
+    async def scenario():
+        before = metrics.counter("mcp.coalesced.get_diagram")
+        results = await asyncio.gather(*(client.get_diagram("s") for _ in range(5)))
+        assert results == ["<mxGraphModel>v1</mxGraphModel>"] * 5
+        assert session.calls["get_diagram"] == 1
+        assert metrics.counter("mcp.coalesced.get_diagram") == before + 4
+
+        # 缓存有效期内的读取不再调用 MCP
+        assert await client.get_diagram("s") == "<mxGraphModel>v1</mxGraphModel>"
+        assert session.calls["get_diagram"] == 1
+
+        tools = await asyncio.gather(client.list_available_tools(), client.list_available_tools())
+        assert tools == [["get_diagram"], ["get_diagram"]]
+        assert session.calls["list_tools"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_write_invalidates_cache_and_inflight_reads(monkeypatch):
+    session = _FakeSession()
+    client = _client(monkeypatch, session, ttl="60")
+
+    async def scenario():
+        # 写入开始前发起的读取不会被写入后的调用方复用，也不会写入缓存
+        stale = asyncio.ensure_future(client.get_diagram("s"))
+        await asyncio.sleep(0)
+        assert await client.display_diagram("s", "<mxGraphModel>v2</mxGraphModel>")
+        assert await stale == "<mxGraphModel>v1</mxGraphModel>"
+        assert await client.get_diagram("s") == "<mxGraphModel>v2</mxGraphModel>"
+        assert session.calls["get_diagram"] == 2
+
+        # 写入后读到的结果被缓存，再次写入时失效
+        assert await client.get_diagram("s") == "<mxGraphModel>v2</mxGraphModel>"
+        assert session.calls["get_diagram"] == 2
+        assert await client.display_diagram("s", "<mxGraphModel>v3</mxGraphModel>")
+        assert await client.get_diagram("s") == "<mxGraphModel>v3</mxGraphModel>"
+        assert session.calls["get_diagram"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_shared_call(monkeypatch):
+    session = _FakeSession(delay=0.05)
+    client = _client(monkeypatch, session, ttl="0")
+
+    async def scenario():
+        leader = asyncio.ensure_future(client.get_diagram("s"))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(client.get_diagram("s"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == "<mxGraphModel>v1</mxGraphModel>"
+        assert session.calls["get_diagram"] == 1
+        # TTL 为 0 时只合并不缓存
+        await client.get_diagram("s")
+        assert session.calls["get_diagram"] == 2
+
+    asyncio.run(scenario())
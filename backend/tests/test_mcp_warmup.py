@@ -0,0 +1,99 @@
+"""
+MCP 连接预热测试
+验证启动后只建立 MCP 连接、不调用 start_session，连接失败或断开后重试
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_mcp_warmup.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.mcp_warmup import MCPWarmup
+from app.services.metrics import get_metrics
+from app.services.session_manager import PREVIEW, SessionManager
+from app.services.session_store import MemorySessionStore
+
+
+class _FakeMCPClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.connects = 0
+        self.started = []
+        self.dropped = asyncio.Event()
+
+    async def connect(self):
+        if self.fail:
+            raise RuntimeError("MCP Server 不可用")
+        self.connects += 1
+        self.dropped = asyncio.Event()
+
+    async def wait_disconnected(self):
+        await self.dropped.wait()
+
+    async def start_session(self, session_id):
+        self.started.append(session_id)
+        return {"preview_url": f"http://preview/{session_id}", "session_id": session_id}
+
+
+def _setup(monkeypatch, client):
+    monkeypatch.setenv("MCP_PREWARM_RETRY_DELAY", "0.01")
+    monkeypatch.setattr("app.services.mcp_client.get_mcp_client", lambda: client)
+    monkeypatch.setattr("app.services.session_manager.get_session_store", lambda: MemorySessionStore())
+    return MCPWarmup()
+
+
+async def _wait(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("等待超时")
+
+
+def test_warm_connection_without_starting_sessions(monkeypatch):
+    client = _FakeMCPClient()
+    warmup = _setup(monkeypatch, client)
+
+    async def scenario():
+        warmup.start()
+        await _wait(lambda: client.connects == 1)
+        # 预热不会打开浏览器窗口；会话仍在请求中启动
+        assert client.started == []
+        info = await SessionManager().create_session(PREVIEW)
+        assert client.started == [info["session_id"]]
+
+        # 连接断开后重新建立
+        client.dropped.set()
+        await _wait(lambda: client.connects == 2)
+        await warmup.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failed_connect_retries(monkeypatch):
+    client = _FakeMCPClient(fail=True)
+    warmup = _setup(monkeypatch, client)
+    metrics = get_metrics()
+
+    async def scenario():
+        failed = metrics.counter("mcp_warmup.failed")
+        warmup.start()
+        await _wait(lambda: metrics.counter("mcp_warmup.failed") >= failed + 2)
+
+        # MCP Server 恢复后连接成功
+        client.fail = False
+        await _wait(lambda: client.connects == 1)
+        await warmup.stop()
+
+    asyncio.run(scenario())
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setenv("MCP_PREWARM", "0")
+    warmup = _setup(monkeypatch, _FakeMCPClient())
+    warmup.start()
+    assert warmup._task is None
@@ -0,0 +1,144 @@
+"""
+快慢模型路由测试
+验证按意图和图表规模选择模型、按近期出错率和首字延迟回避快模型，以及快模型出错时升级到强模型
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_model_router.py
+"""
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from benchmarks import diagrams
+from app.services.glm_service import GLMService
+from app.services.intent import CREATE_DIAGRAM, EDIT_DIAGRAM, GREETING
+from app.services.metrics import get_metrics
+from app.services.model_router import FAST, STRONG, ModelRouter
+from app.services.stream_events import CompleteEvent, RestartEvent
+
+SMALL = diagrams.wrap_model([
+    diagrams.vertex("a", "订单服务", 0, 0),
+    diagrams.vertex("b", "库存服务", 200, 0),
+    diagrams.edge("e1", "a", "b"),
+])
+LARGE = diagrams.wrap_model([diagrams.vertex(f"n{i}", f"节点 {i}", 0, i * 80) for i in range(60)])
+
+
+def test_route_by_intent_and_size():
+    assert ModelRouter("strong-m", "").choose(GREETING).name == STRONG
+
+    router = ModelRouter("strong-m", "fast-m")
+    assert router.choose(GREETING).model == "fast-m"
+    assert router.choose(EDIT_DIAGRAM, SMALL).name == FAST
+    assert router.choose(EDIT_DIAGRAM, LARGE).name == STRONG
+    assert router.choose(CREATE_DIAGRAM).name == STRONG
+    assert router.choose(None).name == STRONG
+
+
+def test_avoid_unhealthy_fast_model():
+    metrics = get_metrics()
+    metrics.reset()
+    router = ModelRouter("strong-m", "fast-m")
+    fast = router.choose(GREETING)
+    for _ in range(3):
+        router.record(fast, ok=False)
+    assert router.choose(GREETING).name == STRONG
+    assert metrics.snapshot()["counters"]["route.fast.skipped"] == 1
+    assert metrics.snapshot()["gauges"]["route.fast.error_rate"] > 0.3
+
+    # 超过冷却时间后重新尝试快模型
+    router.cooldown = 0
+    assert router.choose(GREETING).name == FAST
+
+    # 首字延迟高于强模型时同样回避
+    router = ModelRouter("strong-m", "fast-m")
+    strong = router.choose(CREATE_DIAGRAM)
+    for _ in range(3):
+        router.record(fast, ok=True)
+        router.observe_latency(fast, 2.0)
+        router.observe_latency(strong, 1.0)
+    assert router.choose(GREETING).name == STRONG
+
+
+BAD = json.dumps({"action": "edit", "operations": [{"op": "update", "id": "数据库", "color": "red"}], "reply": "好"})
+GOOD = json.dumps({"action": "edit", "operations": [{"op": "update", "id": "b", "color": "red"}], "reply": "好"})
+
+
+class _Completions:
+    """快模型返回引用不存在单元格的编辑操作（或直接出错），强模型返回正确的操作"""
+
+    def __init__(self, fast_fails=False):
+        self.models = []
+        self.fast_fails = fast_fails
+
+    async def create(self, messages, model=None, stream=False, **kwargs):
+        self.models.append(model)
+        if model == "fast-m" and self.fast_fails:
+            raise RuntimeError("429 Too Many Requests")
+        text = BAD if model == "fast-m" else GOOD
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text), finish_reason="stop")])
+        return _Stream(text)
+
+
+class _Stream:
+    def __init__(self, text):
+        self.text = text
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.text), finish_reason="stop")])
+
+    async def close(self):
+        pass
+
+
+def _service(**kwargs):
+    glm = GLMService()
+    glm.router = ModelRouter("strong-m", "fast-m")
+    completions = _Completions(**kwargs)
+    glm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return glm, completions
+
+
+def test_escalate_invalid_edit():
+    metrics = get_metrics()
+    metrics.reset()
+    glm, completions = _service()
+    # 即使关闭编辑改正，快模型的错误输出也会交给强模型重新生成
+    glm.edit_correction = False
+    result = asyncio.run(glm.chat("把数据库改成红色", current_diagram_xml=SMALL, intent=EDIT_DIAGRAM))
+
+    assert completions.models == ["fast-m", "strong-m"]
+    assert [op["cell_id"] for op in result["operations"]] == ["b"]
+    counters = metrics.snapshot()["counters"]
+    assert counters["route.fast.turns"] == 1 and counters["route.fast.escalated"] == 1
+    assert counters["route.fast.failed"] == 1 and "route.strong.failed" not in counters
+
+
+def test_stream_escalates_failed_request():
+    metrics = get_metrics()
+    metrics.reset()
+    glm, completions = _service(fast_fails=True)
+
+    async def collect():
+        return [e async for e in glm.chat_stream("把库存服务改成红色", current_diagram_xml=SMALL, intent=EDIT_DIAGRAM)]
+
+    events = asyncio.run(collect())
+    assert completions.models == ["fast-m", "strong-m"]
+    # 快模型没有输出任何内容，无需通知前端重新开始
+    assert not any(isinstance(e, RestartEvent) for e in events)
+    assert isinstance(events[-1], CompleteEvent)
+    assert events[-1].result["operations"][0]["cell_id"] == "b"
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["route.fast.escalated"] == 1
+    assert snapshot["timings"]["route.strong.first_token"]["count"] == 1
@@ -0,0 +1,37 @@
+"""
+冷启动测试
+验证导入 app.main 时不加载重型依赖，以及共享服务由 lifespan 创建并注入到各路由
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_startup.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from benchmarks.bench_startup import LAZY_MODULES, measure_import
+
+
+def test_heavy_modules_are_not_imported_eagerly():
+    _, entries = measure_import()
+    loaded = {name.split(".")[0] for name, _, _, _ in entries}
+    assert not loaded & set(LAZY_MODULES)
+
+
+def test_lifespan_creates_shared_services(monkeypatch):
+    monkeypatch.setenv("STARTUP_PREWARM", "0")
+    from app.dependencies import get_glm_service, get_session_manager
+    from app.main import app, lifespan
+
+    async def scenario():
+        async with lifespan(app):
+            request = type("Req", (), {"app": app})()
+            assert get_glm_service(request) is app.state.glm_service
+            assert get_session_manager(request) is get_session_manager(request)
+
+    asyncio.run(scenario())
@@ -0,0 +1,80 @@
+"""
+流式缓冲区测试
+验证水位线合并、客户端停滞丢弃，以及客户端断开时取消上游
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_stream_buffer.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.metrics import get_metrics
+from app.services.stream_buffer import StreamBuffer, StreamStalled, buffered_events
+from app.services.stream_events import CompleteEvent, TextEvent
+
+
+def test_coalesce_above_watermark():
+    """超过水位线后文本增量合并进末尾帧，非文本事件保持独立"""
+    async def run():
+        buffer = StreamBuffer(max_frames=8, high_watermark=2, stall_timeout=5)
+        for c in "abcde":
+            await buffer.put(TextEvent(content=c))
+        await buffer.put(CompleteEvent(result={}))
+        await buffer.close()
+        out = []
+        while (event := await buffer.get()) is not None:
+            out.append(event)
+        return buffer, out
+
+    buffer, out = asyncio.run(run())
+    assert [e.content for e in out[:2]] == ["a", "bcde"]
+    assert isinstance(out[2], CompleteEvent)
+    assert buffer.coalesced == 3
+
+
+def test_stalled_reader_raises():
+    """写出端长时间不取数据时，写入方收到 StreamStalled"""
+    async def run():
+        buffer = StreamBuffer(max_frames=1, high_watermark=1, stall_timeout=0.05)
+        await buffer.put(CompleteEvent(result={}))
+        try:
+            await buffer.put(CompleteEvent(result={}))
+        except StreamStalled:
+            return buffer.stalled
+        return False
+
+    assert asyncio.run(run()) is True
+
+
+class _DisconnectedRequest:
+    async def is_disconnected(self):
+        return True
+
+
+def test_disconnect_cancels_upstream():
+    """客户端断开后读取任务被取消，上游生成器的清理逻辑执行"""
+    closed = asyncio.Event
+
+    async def run():
+        upstream_closed = closed()
+
+        async def upstream():
+            try:
+                yield TextEvent(content="hello")
+                await asyncio.sleep(10)
+                yield TextEvent(content="never")
+            finally:
+                upstream_closed.set()
+
+        before = get_metrics().counter("stream.cancelled")
+        out = [e async for e in buffered_events(upstream(), _DisconnectedRequest(), poll_interval=0.02)]
+        return out, upstream_closed.is_set(), get_metrics().counter("stream.cancelled") - before
+
+    out, upstream_closed, cancelled = asyncio.run(run())
+    assert [e.content for e in out] == ["hello"]
+    assert upstream_closed
+    assert cancelled == 1
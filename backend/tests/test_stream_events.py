@@ -0,0 +1,71 @@
+"""
+流式事件测试
+验证 SSE 编码与文本增量合并逻辑
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_stream_events.py
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.stream_events import (
+    CoalesceConfig, CompleteEvent, ErrorEvent, TextEvent,
+    coalesce_text, encode_sse,
+)
+
+
+async def _from_list(events):
+    for event in events:
+        yield event
+
+
+def _collect(events, config):
+    async def run():
+        return [e async for e in coalesce_text(_from_list(events), config)]
+    return asyncio.run(run())
+
+
+def test_encode_sse_escapes_quotes():
+    """错误信息中的引号不会破坏帧格式"""
+    frame = encode_sse(ErrorEvent(message='bad "quote"\nline'))
+    assert frame.startswith("data: ") and frame.endswith("\n\n")
+    assert json.loads(frame[6:]) == {"type": "error", "message": 'bad "quote"\nline'}
+
+
+def test_coalesce_disabled_passes_through():
+    """max_chars 为 0 时逐个透传"""
+    events = [TextEvent(content="a"), TextEvent(content="b")]
+    assert _collect(events, CoalesceConfig(max_chars=0)) == events
+
+
+def test_coalesce_by_size_and_flush_before_complete():
+    """按字符数合并，遇到非文本事件先刷出缓冲"""
+    complete = CompleteEvent(result={"action": "none", "reply": "hi"})
+    events = [TextEvent(content=c) for c in "abcde"] + [complete]
+    out = _collect(events, CoalesceConfig(max_chars=2, max_delay=60))
+    assert [e.content for e in out[:-1]] == ["ab", "cd", "e"]
+    assert out[-1] is complete
+
+
+def test_coalesce_flushes_on_delay_while_upstream_paused():
+    """上游暂停时，缓冲的文本在 max_delay 到期后输出，不等下一个增量"""
+    received = []
+
+    async def paused():
+        yield TextEvent(content="a")
+        await asyncio.sleep(0.3)
+        # 暂停期间第一帧已经发出
+        assert [e.content for e in received] == ["a"]
+        yield TextEvent(content="b")
+
+    async def run():
+        async for event in coalesce_text(paused(), CoalesceConfig(max_chars=100, max_delay=0.05)):
+            received.append(event)
+
+    asyncio.run(run())
+    assert [e.content for e in received] == ["a", "b"]
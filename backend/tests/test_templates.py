@@ -0,0 +1,77 @@
+"""
+模板快速通道测试
+验证槽位填充、置信度回退，以及生成的 XML 结构完整
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_templates.py
+"""
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.templates import FLOWCHART, MINDMAP, TemplateEngine
+
+
+def _cells(xml):
+    return ET.fromstring(xml).find("root").findall("mxCell")
+
+
+def test_flowchart_with_labels_served():
+    """列出步骤的流程图请求直接命中模板"""
+    engine = TemplateEngine(min_confidence=0.8)
+    result = engine.try_serve("帮我画一个流程图：登录、验证、进入主页")
+    assert result["action"] == "display"
+    assert result["source"] == "template"
+    labels = [c.get("value") for c in _cells(result["xml"]) if c.get("vertex") == "1"]
+    assert labels == ["开始", "登录", "验证", "进入主页", "结束"]
+
+
+def test_underspecified_request_falls_back():
+    """没有任何槽位信息的请求交给 GLM"""
+    engine = TemplateEngine(min_confidence=0.8)
+    match = engine.match("帮我画一个流程图")
+    assert match.diagram_type == FLOWCHART
+    assert match.confidence < 0.8
+    assert engine.try_serve("帮我画一个流程图") is None
+
+
+def test_complex_request_falls_back():
+    """包含判断分支等复杂描述时回退"""
+    engine = TemplateEngine(min_confidence=0.8)
+    assert engine.try_serve("画一个流程图：提交订单、检查库存，如果库存不足则失败") is None
+
+
+def test_mindmap_topic_and_branches():
+    """思维导图提取中心主题和分支，标签中的引号被转义"""
+    engine = TemplateEngine(min_confidence=0.8)
+    message = '画一个关于机器学习的思维导图，分支为监督学习、无监督学习、强化学习与"奖励"'
+    match = engine.match(message)
+    assert match.diagram_type == MINDMAP
+    assert match.slots["topic"] == "机器学习"
+    result = engine.try_serve(message)
+    values = [c.get("value") for c in _cells(result["xml"]) if c.get("vertex") == "1"]
+    assert values[0] == "机器学习"
+    assert '强化学习与"奖励"' in values
+
+
+def test_label_leads_need_boundary():
+    """引导词须位于句首或标点之后；出现列举但提取不到标签时回退到 GLM"""
+    engine = TemplateEngine()
+    # 「没有」中的「有」不是引导词，排除的数据库不能出现在图中
+    assert engine.try_serve("帮我画一个没有数据库的架构图，前端、后端") is None
+    # 引导词后的冒号不进入标签
+    match = engine.match("画一个流程图，步骤为：登录、验证、主页")
+    assert match.slots["labels"] == ["登录", "验证", "主页"]
+    # 无法理解的列举不生成「步骤 1/2/3」占位节点
+    assert engine.try_serve("画一个流程图，分为准备、执行、收尾三个阶段") is None
+
+
+def test_database_hints_match_whole_words():
+    engine = TemplateEngine()
+    result = engine.try_serve("画一个架构图：gateway、services、es")
+    styles = {c.get("value"): c.get("style") for c in _cells(result["xml"]) if c.get("vertex") == "1"}
+    assert "cylinder" not in styles["services"]
+    assert "cylinder" in styles["es"]
@@ -0,0 +1,94 @@
+"""
+对话轮次编排测试
+验证读取图表、建立连接和准备历史并行执行，建连不延长准备阶段，且构建的消息与依次执行一致
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_turn.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from app.services.glm_service import GLMService
+from app.services.intent import CREATE_DIAGRAM, GREETING
+from app.services.metrics import get_metrics
+from app.services.turn import prepare_turn
+
+XML = '<mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/></root></mxGraphModel>'
+HISTORY = [{"role": "user", "content": "画一个流程图"}, {"role": "assistant", "content": "好的"}]
+DELAY = 0.05
+
+
+class _SlowDiagramClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_diagram(self, session_id):
+        self.calls += 1
+        await asyncio.sleep(DELAY)
+        return XML
+
+
+def _service(connect_delay=DELAY):
+    glm = GLMService()
+
+    async def connect():
+        await asyncio.sleep(connect_delay)
+
+    glm.connect = connect
+    return glm
+
+
+def test_stages_overlap(monkeypatch):
+    monkeypatch.setenv("TURN_OVERLAP", "1")
+    glm = _service()
+
+    turn = asyncio.run(prepare_turn(glm, _SlowDiagramClient(), "s", "加一个节点", HISTORY, CREATE_DIAGRAM))
+
+    assert turn.current_xml == XML
+    assert turn.messages == glm._build_messages("加一个节点", HISTORY, XML, CREATE_DIAGRAM)
+    # 读取图表与建连同时进行，关键路径约为其中较慢的一步
+    assert turn.timings["prepare"] < DELAY * 1.8
+    assert get_metrics().snapshot()["timings"]["turn.prepare_saved"]["count"] >= 1
+
+
+def test_slow_connect_stays_off_critical_path(monkeypatch):
+    monkeypatch.setenv("TURN_OVERLAP", "1")
+    glm = _service(connect_delay=DELAY * 4)
+    metrics = get_metrics()
+
+    async def scenario():
+        pending = metrics.counter("turn.connect_pending")
+        # 建连慢于读取图表：准备阶段只等读取图表，建连留在后台继续
+        turn = await prepare_turn(glm, _SlowDiagramClient(), "s", "加一个节点", HISTORY, CREATE_DIAGRAM)
+        assert turn.current_xml == XML
+        assert turn.timings["prepare"] < DELAY * 2
+        assert "connect" not in turn.timings
+
+        # 对话类轮次不读取图表，无需等待建连
+        turn = await prepare_turn(glm, _SlowDiagramClient(), "s", "你好", HISTORY, GREETING)
+        assert turn.timings["prepare"] < DELAY
+        assert metrics.counter("turn.connect_pending") == pending + 2
+
+    asyncio.run(scenario())
+
+
+def test_sequential_mode_and_conversational_skip(monkeypatch):
+    monkeypatch.setenv("TURN_OVERLAP", "0")
+    glm = _service()
+    client = _SlowDiagramClient()
+
+    turn = asyncio.run(prepare_turn(glm, client, "s", "加一个节点", HISTORY, CREATE_DIAGRAM))
+    assert turn.timings["prepare"] >= DELAY * 2
+
+    # 对话类意图不读取当前图表，使用轻量提示词
+    turn = asyncio.run(prepare_turn(glm, client, "s", "你好", HISTORY, GREETING))
+    assert client.calls == 1
+    assert turn.current_xml is None
+    assert "fetch_diagram" not in turn.timings
+    assert turn.messages == glm._build_messages("你好", HISTORY, None, GREETING)
@@ -0,0 +1,150 @@
+"""
+流式 XML 格式检查测试
+验证跨片段解码 JSON 字符串中的 XML 并及时发现结构错误，以及流式对话中出错后中止并重新生成
+
+运行方式：
+    cd backend
+    python -m pytest tests/test_xml_stream_check.py
+"""
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("GLM_API_KEY", "")
+
+from app.services.glm_service import GLMService
+from app.services.metrics import get_metrics
+from app.services.stream_events import CompleteEvent, RestartEvent, TextEvent
+from app.services.xml_stream_check import JsonXMLFieldChecker
+
+CELLS = "".join(
+    f'<mxCell id="n{i}" value="步骤 {i} &amp; &quot;检查&quot;" style="rounded=1;" vertex="1" parent="1">'
+    f'<mxGeometry x="{i * 10}" y="0" width="120" height="60" as="geometry"/></mxCell>'
+    for i in range(2, 40)
+)
+GOOD_XML = f'<mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>{CELLS}</root></mxGraphModel>'
+# 属性值中未转义的 &，位于 XML 开头附近
+BAD_XML = GOOD_XML.replace("步骤 3 &amp;", "步骤 3 & ")
+
+
+def _response(xml, field="xml"):
+    if field == "xml":
+        return json.dumps({"action": "display", "xml": xml, "reply": "已生成"}, ensure_ascii=False)
+    return json.dumps({"action": "edit", "operations": [{"op": "add", "new_xml": xml}], "reply": "好"})
+
+
+def _feed(text, step):
+    checker = JsonXMLFieldChecker()
+    for i in range(0, len(text), step):
+        if checker.feed(text[i:i + step]) is not None:
+            return checker.error, i
+    return None, len(text)
+
+
+def test_valid_xml_across_chunk_sizes():
+    """合法输出在任意分片下都不报错（包括跨片段的 \\uXXXX 转义和代理对）"""
+    text = "```json\n" + json.dumps(
+        {"action": "display", "xml": GOOD_XML.replace("检查", "检查😀"), "reply": "ok"}, ensure_ascii=True
+    ) + "\n```"
+    for step in (1, 2, 5, 64, len(text)):
+        assert _feed(text, step)[0] is None, step
+    assert _feed(_response(f"<mxCell id=\"a\" value=\"x &lt; y\" vertex=\"1\" parent=\"1\"/>", "new_xml"), 3)[0] is None
+
+
+def test_errors_reported_early():
+    """结构错误在到达出错位置时立即报告，而不是等输出结束"""
+    text = _response(BAD_XML)
+    error, position = _feed(text, 16)
+    assert error is not None and error.field == "xml" and error.line == 1
+    assert position < text.index("步骤 4") < len(text)
+
+    error, _ = _feed(_response('<mxCell id="a" vertex="1"><mxGeometry></mxCell>', "new_xml"), 4)
+    assert error is not None and error.field == "new_xml" and "mismatched" in error.message
+
+    # 只检查 XML 字段，其他字段中的 & 与 < 不受影响
+    assert _feed(json.dumps({"action": "none", "reply": "a & b < c"}), 2)[0] is None
+
+
+class _Completions:
+    """第一次输出含格式错误的 XML，收到改正指令后输出正确的 XML"""
+
+    def __init__(self):
+        self.calls = []
+        self.streams = []
+
+    async def create(self, messages, stream=False, **kwargs):
+        self.calls.append(messages)
+        xml = BAD_XML if len(self.calls) == 1 else GOOD_XML
+        response = _Stream(_response(xml))
+        self.streams.append(response)
+        return response
+
+
+class _Stream:
+    def __init__(self, text):
+        self.chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+        self.sent = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for i, piece in enumerate(self.chunks):
+            self.sent += 1
+            last = i == len(self.chunks) - 1
+            yield SimpleNamespace(choices=[SimpleNamespace(
+                delta=SimpleNamespace(content=piece), finish_reason="stop" if last else None
+            )])
+
+    async def close(self):
+        self.closed = True
+
+
+async def _collect(glm):
+    return [event async for event in glm.chat_stream("画一个流程图", intent="create_diagram")]
+
+
+def test_stream_aborts_and_regenerates(monkeypatch):
+    """流式对话：发现 XML 错误后关闭上游流，要求改正并重新生成"""
+    monkeypatch.setenv("DIAGRAM_DSL", "0")
+    glm = GLMService()
+    completions = _Completions()
+    glm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    metrics = get_metrics()
+    metrics.reset()
+
+    events = asyncio.run(_collect(glm))
+
+    first = completions.streams[0]
+    assert first.closed and first.sent < len(first.chunks)
+    assert len(completions.calls) == 2
+    assert "第 1 行" in completions.calls[1][-1]["content"]
+
+    restart = next(i for i, e in enumerate(events) if isinstance(e, RestartEvent))
+    text = "".join(e.content for e in events[restart:] if isinstance(e, TextEvent))
+    assert text == _response(GOOD_XML)
+    assert isinstance(events[-1], CompleteEvent)
+    assert events[-1].result["action"] == "display"
+    assert metrics.snapshot()["counters"]["glm.xml_stream_restarts"] == 1
+
+    # 关闭检查时不中止，交给解析后的修复逻辑处理
+    monkeypatch.setenv("GLM_XML_STREAM_CHECK", "0")
+    glm = GLMService()
+    completions = _Completions()
+    glm.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    events = asyncio.run(_collect(glm))
+    assert len(completions.calls) == 1
+    assert not any(isinstance(e, RestartEvent) for e in events)
+
+
+def test_no_checker_in_dsl_mode(monkeypatch):
+    """DSL 模式下模型不输出 XML，不创建检查器"""
+    monkeypatch.setenv("DIAGRAM_DSL", "1")
+    assert GLMService()._stream_checker() is None
+    monkeypatch.setenv("DIAGRAM_DSL", "0")
+    assert isinstance(GLMService()._stream_checker(), JsonXMLFieldChecker)